@@ -0,0 +1,213 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import jwt
+from fastapi import Header, HTTPException
+
+from resilience import DependencyError, supabase_calls
+
+
+# --- Supabase Session Verification ---
+# Supabase access tokens are JWTs, so instead of asking the auth server about
+# every request we check the signature and expiry ourselves: HS256 tokens
+# against the project's JWT secret, asymmetric ones against the project's
+# published JWKS (fetched once and cached). Verified user IDs and profile rows
+# are kept for a short TTL. If neither a secret nor a JWKS key is available
+# we fall back to supabase.auth.get_user(), and cache that answer too.
+# When Supabase is down, a user whose profile row we read before gets that
+# (expired) row back instead of an error; it is dropped whenever we write to it.
+
+SUPABASE_JWT_SECRET = os.environ.get("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.environ.get("SUPABASE_JWT_AUDIENCE", "authenticated")
+AUTH_CACHE_TTL_SECONDS = int(os.environ.get("AUTH_CACHE_TTL_SECONDS", "300"))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get("AUTH_CACHE_MAX_ENTRIES", "10000"))
+PROFILE_CACHE_TTL_SECONDS = int(os.environ.get("PROFILE_CACHE_TTL_SECONDS", "30"))
+JWKS_CACHE_SECONDS = int(os.environ.get("JWKS_CACHE_SECONDS", "3600"))
+# Asymmetric algorithms Supabase signs with; a JWKS key for anything else is refused
+JWKS_ALGORITHMS = ("RS256", "ES256", "EdDSA")
+
+
+class AuthError(Exception):
+    pass
+
+
+class _CannotVerifyLocally(jwt.InvalidTokenError):
+    pass
+
+
+class TTLCache:
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] <= now:
+                # Expired entries stay (until LRU-evicted) for stale()
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key: str, value, expires_at: float):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def stale(self, key: str):
+        """The entry even if it has expired; a fallback for when it can't be refreshed."""
+        with self._lock:
+            item = self._data.get(key)
+            return item[0] if item is not None else None
+
+    def pop(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class Authenticator:
+    def __init__(self, get_supabase: Callable[[], Any], supabase_url: Optional[str], jwt_secret: Optional[str] = SUPABASE_JWT_SECRET):
+        # get_supabase is called lazily so callers can swap or defer the client
+        self._get_supabase = get_supabase
+        self.jwt_secret = jwt_secret
+        self._jwks = None
+        if supabase_url:
+            self._jwks = jwt.PyJWKClient(f"{supabase_url.rstrip('/')}/auth/v1/.well-known/jwks.json",
+                                         cache_keys=True, lifespan=JWKS_CACHE_SECONDS, timeout=5)
+        self.users = TTLCache(AUTH_CACHE_MAX_ENTRIES)
+        self.profiles = TTLCache(AUTH_CACHE_MAX_ENTRIES)
+        self._stats_lock = threading.Lock()
+        self.stats = {"local": 0, "remote": 0, "stale_profiles": 0}
+
+    def _count(self, name):
+        # Called from the run_io threads, so += alone can lose updates
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    @staticmethod
+    def _token_key(token: str) -> str:
+        return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def cached_user_id(self, token: str) -> Optional[str]:
+        return self.users.get(self._token_key(token))
+
+    def user_id(self, token: str) -> str:
+        """Verified user ID for an access token. May block (JWKS fetch or remote fallback)."""
+        key = self._token_key(token)
+        cached = self.users.get(key)
+        if cached is not None:
+            return cached
+        try:
+            claims = self._verify_locally(token)
+            self._count("local")
+        except jwt.ExpiredSignatureError:
+            raise AuthError("Session expired")
+        except jwt.InvalidTokenError as e:
+            if not isinstance(e, _CannotVerifyLocally):
+                raise AuthError(str(e))
+            claims = self._verify_remotely(token)
+            self._count("remote")
+        user_id = claims.get("sub")
+        if not user_id:
+            raise AuthError("Token has no subject")
+        # Never cache past the token's own expiry
+        expires_at = min(time.time() + AUTH_CACHE_TTL_SECONDS, float(claims.get("exp") or 0) or float("inf"))
+        self.users.put(key, user_id, expires_at)
+        return user_id
+
+    def _verify_locally(self, token: str) -> Dict[str, Any]:
+        # The header only picks which key to try; the algorithm checked is always
+        # pinned by us (HS256 for the secret, the JWKS key's own for the rest)
+        header = jwt.get_unverified_header(token)
+        if header.get("alg") == "HS256":
+            if not self.jwt_secret:
+                raise _CannotVerifyLocally("No JWT secret configured")
+            key, algorithm = self.jwt_secret, "HS256"
+        else:
+            if self._jwks is None:
+                raise _CannotVerifyLocally("No JWKS endpoint configured")
+            try:
+                signing_key = self._jwks.get_signing_key_from_jwt(token)
+            except jwt.PyJWKClientError as e:
+                raise _CannotVerifyLocally(str(e))
+            algorithm = signing_key.algorithm_name
+            if algorithm not in JWKS_ALGORITHMS:
+                raise jwt.InvalidAlgorithmError(f"Unexpected signing key algorithm {algorithm}")
+            key = signing_key.key
+        return jwt.decode(token, key, algorithms=[algorithm], audience=SUPABASE_JWT_AUDIENCE,
+                          options={"require": ["exp", "sub"]})
+
+    def _verify_remotely(self, token: str) -> Dict[str, Any]:
+        try:
+            user_response = supabase_calls.call(self._get_supabase().auth.get_user, token)
+        except DependencyError:
+            raise
+        except Exception as e:
+            if "Invalid JWT" in str(e) or "Auth session missing" in str(e) or "expired" in str(e).lower():
+                raise AuthError(str(e))
+            raise
+        if not user_response or not user_response.user:
+            raise AuthError("Auth session missing")
+        # Supabase vouched for the token; read exp only to bound the cache lifetime
+        claims = jwt.decode(token, options={"verify_signature": False})
+        claims["sub"] = user_response.user.id
+        return claims
+
+    def profile(self, user_id: str) -> Optional[Dict[str, Any]]:
+        cached = self.profiles.get(user_id)
+        if cached is not None:
+            return cached
+        query = self._get_supabase().table('profiles').select('credits', 'is_vip').eq('id', user_id).single()
+        if hasattr(query, "retry"):
+            # postgrest's own retries (with multi-second sleeps) would stack on ours
+            query = query.retry(False)
+        try:
+            profile_response = supabase_calls.call(query.execute)
+        except DependencyError:
+            stale = self.profiles.stale(user_id)
+            if stale is None:
+                raise
+            self._count("stale_profiles")
+            return stale
+        profile = profile_response.data
+        if profile:
+            self.profiles.put(user_id, profile, time.time() + PROFILE_CACHE_TTL_SECONDS)
+        return profile
+
+    def forget_profile(self, user_id: str):
+        # Call after writing to a profile (e.g. deducting credits)
+        self.profiles.pop(user_id)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {
+            "verified_locally": stats["local"],
+            "verified_remotely": stats["remote"],
+            "stale_profiles_served": stats["stale_profiles"],
+            "user_cache_hits": self.users.hits,
+            "user_cache_misses": self.users.misses,
+            "profile_cache_hits": self.profiles.hits,
+            "profile_cache_misses": self.profiles.misses,
+        }
+
+
+def bearer_token(authorization: str = Header(None)) -> str:
+    if not authorization or not authorization.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Missing or invalid authentication token.")
+    return authorization.split("Bearer ")[1]
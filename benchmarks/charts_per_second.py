@@ -0,0 +1,67 @@
+"""Charts per second on one core for calculate_astro_details and the ephemeris engine.
+
+    python benchmarks/charts_per_second.py [--table data/slow_planets.npy] [--seconds 2]
+
+"cold" uses a fresh birth minute for every chart (no memo hits), "warm"
+repeats a small set of births the way real traffic does.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "bench")
+
+
+def rate(fn, seconds):
+    count = 0
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    while time.perf_counter() < deadline:
+        for _ in range(50):
+            fn(count)
+            count += 1
+    return round(count / (time.perf_counter() - started), 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--table", help="slow-planet table built with `python ephemeris.py build-table`")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    args = parser.parse_args()
+
+    import main as app_main
+    from ephemeris import ChartEngine, SlowPlanetTable
+
+    def birth(i):
+        day = 1 + (i // 1440) % 28
+        return f"1990-05-{day:02d}", f"{(i // 60) % 24:02d}:{i % 60:02d}"
+
+    def cold(i):
+        app_main.chart_engine._cache.clear()
+        date, tm = birth(i)
+        app_main.calculate_astro_details(date, tm, 6.9271, 79.8612)
+
+    def warm(i):
+        date, tm = birth(i % 16)
+        app_main.calculate_astro_details(date, tm, 6.9271, 79.8612)
+
+    base_jd = 2447000.5
+    exact = ChartEngine(cache_size=1)
+    report = {
+        "calculate_astro_details": {"cold_charts_per_sec": rate(cold, args.seconds),
+                                    "warm_charts_per_sec": rate(warm, args.seconds)},
+        "engine_positions": {"swisseph_per_sec": rate(lambda i: exact.positions(base_jd + i / 1440.0, 6.9, 79.8), args.seconds)},
+    }
+    if args.table:
+        tabled = ChartEngine(cache_size=1, table=SlowPlanetTable(args.table))
+        report["engine_positions"]["table_per_sec"] = rate(lambda i: tabled.positions(base_jd + i / 1440.0, 6.9, 79.8), args.seconds)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""Local stand-ins for the services the API talks to, for benchmarks.
+
+FakeServices runs one threaded HTTP server that answers like
+
+  * Nominatim   GET  /search                       (geopy, via NOMINATIM_DOMAIN/NOMINATIM_SCHEME)
+  * GoTrue      GET  /auth/v1/user                 (supabase.auth.get_user)
+                GET  /auth/v1/.well-known/jwks.json
+  * PostgREST   GET  /rest/v1/profiles             (profiles select ... single())
+                PATCH /rest/v1/profiles            (credit updates)
+
+so the real geopy and supabase clients are exercised over real sockets.
+FakeGemini replaces google.generativeai.GenerativeModel in-process (the SDK
+talks gRPC, which is not worth faking on the wire). Every service has its own
+latency and error rate, and counts the calls it served. The profiles can be
+changed while the server runs, to inject an outage and take it away again.
+"""
+import json
+import time
+import random
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+SERVICES = ("nominatim", "gotrue", "postgrest", "gemini")
+
+
+class DeadlineExceeded(Exception):
+    """Same name as google.api_core's, which is what resilience.py looks at."""
+
+
+class ServiceProfile:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency, self.jitter, self.error_rate = latency, jitter, error_rate
+        self.calls = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def visit(self, timeout: Optional[float] = None) -> bool:
+        """Sleep for this call's latency; True if the call should fail.
+
+        With a timeout (in-process fakes only), a call slower than that gives
+        up after `timeout` seconds with DeadlineExceeded, like the real client.
+        """
+        with self._lock:
+            self.calls += 1
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if timeout is not None and delay > timeout:
+            time.sleep(timeout)
+            raise DeadlineExceeded(f"Deadline of {timeout}s exceeded")
+        if delay > 0:
+            time.sleep(delay)
+        return failed
+
+    def stats(self):
+        return {"calls": self.calls, "errors": self.errors}
+
+
+def fake_coordinates(place: str):
+    # Deterministic, inside Sri Lanka, so charts are stable across runs
+    digest = hashlib.sha256(place.strip().lower().encode("utf-8")).digest()
+    return 6.0 + digest[0] / 255 * 3.8, 79.7 + digest[1] / 255 * 2.1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    services: "FakeServices" = None
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, payload, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _fail(self):
+        self._send(503, {"message": "injected failure"})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if url.path == "/search":
+            if self.services.profiles["nominatim"].visit():
+                return self._fail()
+            place = (query.get("q") or [""])[0]
+            lat, lon = fake_coordinates(place)
+            return self._send(200, [{"lat": str(lat), "lon": str(lon), "display_name": place}])
+        if url.path == "/auth/v1/.well-known/jwks.json":
+            return self._send(200, {"keys": []})
+        if url.path == "/auth/v1/user":
+            if self.services.profiles["gotrue"].visit():
+                return self._fail()
+            auth = self.headers.get("Authorization", "")
+            if not auth.startswith("Bearer ") or len(auth) < 12:
+                return self._send(401, {"code": 401, "msg": "Invalid JWT"})
+            return self._send(200, {
+                "id": self.services.user_id, "aud": "authenticated", "role": "authenticated",
+                "app_metadata": {}, "user_metadata": {}, "created_at": "2024-01-01T00:00:00Z",
+            })
+        if url.path == "/rest/v1/profiles":
+            if self.services.profiles["postgrest"].visit():
+                return self._fail()
+            profile = {"credits": self.services.credits, "is_vip": False}
+            if "vnd.pgrst.object" in self.headers.get("Accept", ""):
+                return self._send(200, profile, {"Content-Range": "0-0/1"})
+            return self._send(200, [profile], {"Content-Range": "0-0/1"})
+        self._send(404, {"message": "not found"})
+
+    def do_PATCH(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        if urlparse(self.path).path == "/rest/v1/profiles":
+            if self.services.profiles["postgrest"].visit():
+                return self._fail()
+            return self._send(200, [{"credits": self.services.credits, "is_vip": False}])
+        self._send(404, {"message": "not found"})
+
+
+class FakeServices:
+    def __init__(self, profiles: Optional[Dict[str, ServiceProfile]] = None, user_id: str = "bench-user", credits: int = 1000):
+        self.profiles = {name: ServiceProfile(seed=i) for i, name in enumerate(SERVICES)}
+        self.profiles.update(profiles or {})
+        self.user_id, self.credits = user_id, credits
+        handler = type("Handler", (_Handler,), {"services": self})
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def env(self) -> Dict[str, str]:
+        """Environment that points the app at these fakes (set before importing main)."""
+        return {
+            "SUPABASE_URL": self.base_url,
+            "SUPABASE_SERVICE_KEY": "bench-service-key",
+            "NOMINATIM_DOMAIN": self.base_url.split("://", 1)[1],
+            "NOMINATIM_SCHEME": "http",
+        }
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def stats(self):
+        return {name: profile.stats() for name, profile in self.profiles.items()}
+
+
+# --- Gemini ---
+READING_TEXT = "\n".join(
+    [f"### කොටස {n}\n" + "මෙය පරීක්ෂණ පාඨයකි. " * 40 for n in range(1, 9)]
+)
+PORONDAM_TEXT = "SCORE: 14/20\n---\n" + READING_TEXT
+
+
+class _Usage:
+    def __init__(self, prompt_tokens, output_tokens):
+        self.prompt_token_count, self.candidates_token_count = prompt_tokens, output_tokens
+
+
+class _Chunk:
+    def __init__(self, text, usage=None):
+        self.text = text
+        self.usage_metadata = usage
+
+
+class FakeGemini:
+    """Callable that stands in for genai.GenerativeModel: FakeGemini(profile)(model_name, ...).
+
+    prefill_seconds_per_1k adds latency per 1000 prompt tokens before the first
+    chunk, so prompt size shows up in the timings the way it does on the real API.
+    """
+
+    def __init__(self, profile: ServiceProfile, chunks: int = 16, prefill_seconds_per_1k: float = 0.0):
+        self.profile = profile
+        self.chunks = chunks
+        self.prefill_seconds_per_1k = prefill_seconds_per_1k
+
+    def __call__(self, *args, system_instruction=None, **kwargs):
+        return _FakeModel(self, system_instruction or "")
+
+
+class _FakeModel:
+    def __init__(self, fake: FakeGemini, system: str = ""):
+        self.fake = fake
+        self.system = system
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        profile = self.fake.profile
+        full_prompt = self.system + str(prompt)
+        text = PORONDAM_TEXT if "SCORE" in full_prompt else READING_TEXT
+        usage = _Usage(len(full_prompt) // 4, len(text) // 4)
+        if self.fake.prefill_seconds_per_1k:
+            time.sleep(usage.prompt_token_count / 1000 * self.fake.prefill_seconds_per_1k)
+        if not stream:
+            if profile.visit((request_options or {}).get("timeout")):
+                raise RuntimeError("503 injected Gemini failure")
+            return _Chunk(text, usage)
+        return self._stream(text, usage)
+
+    def _stream(self, text, usage):
+        profile, n = self.fake.profile, self.fake.chunks
+        # Spread the configured latency over the chunks, like a real stream
+        per_chunk = ServiceProfile(profile.latency / n, profile.jitter / n)
+        with profile._lock:
+            profile.calls += 1
+            failed = profile._rng.random() < profile.error_rate
+            if failed:
+                profile.errors += 1
+        size = -(-len(text) // n)
+        for i in range(n):
+            per_chunk.visit()
+            if failed and i == n // 2:
+                raise RuntimeError("503 injected Gemini failure")
+            last = i == n - 1
+            yield _Chunk(text[i * size:(i + 1) * size], usage if last else None)
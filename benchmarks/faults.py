@@ -0,0 +1,255 @@
+"""Fault injection: what clients see while Nominatim, Supabase or Gemini misbehave.
+
+    python benchmarks/faults.py                                  # every scenario
+    python benchmarks/faults.py --scenarios gemini_down,nominatim_slow --requests 40
+    python benchmarks/faults.py --ref HEAD~1 --output before.json
+    python benchmarks/faults.py --compare before.json
+
+Same setup as load.py (app in-process, real geopy/supabase clients against
+benchmarks/fakes.py, Gemini faked in-process), but each scenario first warms
+up with healthy services, then breaks one of them (all errors, or slower than
+its timeout) for --requests requests, then heals it and sends a few more to see
+it recover. Timeouts and the breaker reset are shortened (see FAULT_ENV) so the
+whole run takes seconds.
+
+Per scenario the report has latency and status codes during the outage and
+after it, how many calls actually reached the broken service, the breaker
+states, and how many answers came from a fallback (stale place, stale profile,
+queued reading). Run it with --ref against a tree without resilience.py to see
+the difference: every request then waits for the broken service itself.
+
+Each scenario also has pass/fail checks (see check_scenario): the breaker
+opened and kept calls to the broken service bounded, the expected fallback
+answered, nothing turned into a 500, and requests succeed again once the
+service is back. The script exits 1 when any check fails.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from report import add_common_arguments, finish, metadata, run_at_ref, strip_ref_args, summarize
+from fakes import FakeServices, FakeGemini, ServiceProfile, SERVICES
+from load import JWT_SECRET, birth
+
+HEALTHY_LATENCY = {"nominatim": 0.05, "gotrue": 0.02, "postgrest": 0.02, "gemini": 0.3}
+# Fake service -> the resilience.Dependency whose breaker guards it
+DEPENDENCY_OF = {"nominatim": "nominatim", "gotrue": "supabase", "postgrest": "supabase", "gemini": "gemini"}
+FAULT_ENV = {
+    "NOMINATIM_TIMEOUT_SECONDS": "1", "SUPABASE_TIMEOUT_SECONDS": "1", "GEMINI_TIMEOUT_SECONDS": "2",
+    "BREAKER_FAILURES": "5", "BREAKER_RESET_SECONDS": "2", "RETRY_BASE_SECONDS": "0.05",
+    # Cached places and profiles expire right away, so the outage phase needs the stale fallbacks
+    "PLACE_CACHE_TTL_SECONDS": "1", "PROFILE_CACHE_TTL_SECONDS": "1",
+}
+
+
+def scenarios(main):
+    prompt_data = main.calculate_astro_details("1990-05-17", "08:30", 6.9271, 79.8612)[2]
+    known = [birth(i, 5) for i in range(5)]
+
+    def reading(i):
+        return {"prompt_data": dict(prompt_data, fault_nonce=i)}
+
+    # name: (path, body for request i, broken service, (latency, error_rate) while broken, body for warm-up)
+    return {
+        # New places: nothing to fall back on, so errors (but fast ones once the breaker opens)
+        "nominatim_down": ("/calculate_charts", lambda i: dict(birth(i, 10_000), place=f"Fault Town {i}"), "nominatim", (0.05, 1.0), None),
+        "nominatim_slow": ("/calculate_charts", lambda i: dict(birth(i, 10_000), place=f"Slow Town {i}"), "nominatim", (5.0, 0.0), None),
+        # Places looked up before the outage: answered from the expired cache entries
+        "nominatim_down_known_places": ("/calculate_charts", lambda i: dict(known[i % 5], date=f"{1950 + i % 70}-01-01"),
+                                        "nominatim", (0.05, 1.0), lambda i: known[i % 5]),
+        # The profile read before the outage is served stale
+        "postgrest_down": ("/deduct_pdf_credit", lambda i: None, "postgrest", (0.02, 1.0), lambda i: None),
+        "gemini_down": ("/generate_reading", reading, "gemini", (0.3, 1.0), None),
+        "gemini_slow": ("/generate_reading", lambda i: reading(10_000 + i), "gemini", (10.0, 0.0), None),
+        # Some errors, not an outage: retries hide most of them
+        "gemini_flaky": ("/generate_reading", lambda i: reading(20_000 + i), "gemini", (0.3, 0.3), None),
+    }
+
+
+async def send_all(client, path, make_body, indices, concurrency, headers):
+    latencies, statuses = [], {}
+    queue = iter(indices)
+
+    async def worker():
+        for i in queue:
+            started = time.perf_counter()
+            response = await client.post(path, json=make_body(i), headers=headers)
+            await response.aread()
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result = summarize(latencies, time.perf_counter() - started)
+    result["status"] = {str(k): v for k, v in sorted(statuses.items())}
+    return result
+
+
+def fallbacks(main):
+    counts = {}
+    if hasattr(main.place_resolver, "snapshot"):
+        counts["stale_places"] = main.place_resolver.snapshot().get("stale_hits", 0)
+    if hasattr(main, "authenticator"):
+        counts["stale_profiles"] = main.authenticator.snapshot().get("stale_profiles_served", 0)
+    return counts
+
+
+def breakers(resilience):
+    if resilience is None:
+        return {}
+    return {d.name: d.breaker.state for d in resilience.DEPENDENCIES}
+
+
+def busy_jobs(main):
+    if not hasattr(main, "job_queue"):
+        return 0
+    snapshot = main.job_queue.snapshot()
+    return snapshot["queued"] + snapshot["running"]
+
+
+def check_scenario(name, result, resilience, concurrency):
+    """{check: passed} for one scenario; {} against a tree without resilience.py (nothing to hold it to)."""
+    if resilience is None:
+        return {}
+    outage, recovered = result["outage"], result["recovered"]
+    dependency = next(d for d in resilience.DEPENDENCIES if d.name == DEPENDENCY_OF[result["service"]])
+    statuses = {int(k): v for k, v in outage["status"].items()}
+    sent = sum(statuses.values())
+    checks = {
+        # Every request after healing is answered normally
+        "recovered": set(recovered["status"]) == {"200"},
+        # Failures are 503/504 (or a fallback), never an unhandled 500
+        "no_500s": not any(code >= 500 and code not in (503, 504) for code in statuses),
+    }
+    if name == "gemini_flaky":
+        # Not an outage: the breaker stays shut and retries hide most errors
+        checks["breaker_closed"] = outage["breakers"][dependency.name] == "closed"
+        checks["mostly_ok"] = statuses.get(200, 0) >= 0.8 * sent
+        return checks
+    checks["breaker_opened"] = outage["breakers"][dependency.name] == "open"
+    # Once the breaker opens, calls stop reaching the service: at most the failures that open it
+    # plus one attempt (with its retries) per request already in flight
+    checks["upstream_calls_bounded"] = outage["upstream_calls"] <= (
+        resilience.BREAKER_FAILURES + concurrency * (dependency.retries + 1))
+    if name == "nominatim_down_known_places":
+        checks["stale_places_served"] = outage["fallbacks"].get("stale_places", 0) > 0 and statuses == {200: sent}
+    elif name == "postgrest_down":
+        checks["stale_profiles_served"] = outage["fallbacks"].get("stale_profiles", 0) > 0 and statuses == {200: sent}
+    elif result["service"] == "gemini":
+        # Readings asked for while Gemini was down were queued, and all of them finished once it was back
+        queued = statuses.get(202, 0)
+        checks["readings_queued"] = queued > 0
+        checks["queued_readings_completed"] = recovered["jobs"] == {"completed": queued, "failed": 0}
+    return checks
+
+
+def reset_breakers(resilience):
+    if resilience is not None:
+        for dependency in resilience.DEPENDENCIES:
+            dependency.breaker = resilience.CircuitBreaker()
+
+
+async def run(args):
+    profiles = {name: ServiceProfile(HEALTHY_LATENCY[name], seed=i) for i, name in enumerate(SERVICES)}
+    services = FakeServices({k: v for k, v in profiles.items() if k != "gemini"}).start()
+    scratch = tempfile.mkdtemp(prefix="bench-faults-")
+    os.environ.update(services.env())
+    os.environ.update(FAULT_ENV)
+    os.environ.update({
+        "PLACE_CACHE_PATH": os.path.join(scratch, "places.sqlite3"),
+        "READING_CACHE_PATH": os.path.join(scratch, "readings.sqlite3"),
+        "JOB_DB_PATH": os.path.join(scratch, "jobs.sqlite3"),
+        "GEMINI_API_KEY": "bench",
+        "SUPABASE_JWT_SECRET": JWT_SECRET,
+        "SINGLEFLIGHT_PER_USER": "100000", "JOB_MAX_PER_USER": "100000", "JOB_QUEUE_MAX": "100000",
+    })
+    sys.path.insert(0, args.app_dir)
+
+    import jwt
+    import httpx
+    import main
+    try:
+        import resilience
+    except ImportError:
+        resilience = None
+
+    main.GEMINI_API_KEY = "bench"
+    main.clients.override(genai=SimpleNamespace(GenerativeModel=FakeGemini(profiles["gemini"])))
+    token = jwt.encode({"sub": "bench-user", "aud": "authenticated", "exp": int(time.time()) + 3600}, JWT_SECRET, algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+    selected_scenarios = scenarios(main)
+    selected = args.scenarios.split(",") if args.scenarios else list(selected_scenarios)
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        for name in selected:
+            path, make_body, service, (latency, error_rate), warm_body = selected_scenarios[name]
+            profile = profiles[service]
+            reset_breakers(resilience)
+            if warm_body is not None:
+                await send_all(client, path, warm_body, range(5), 1, headers)
+                # Let what the warm-up cached expire (FAULT_ENV TTLs)
+                await asyncio.sleep(1.2)
+
+            healthy = (profile.latency, profile.error_rate)
+            profile.latency, profile.error_rate = latency, error_rate
+            calls_before, fallbacks_before = profile.calls, fallbacks(main)
+            jobs_before = main.job_queue.snapshot() if hasattr(main, "job_queue") else {}
+            outage = await send_all(client, path, make_body, range(args.requests), args.concurrency, headers)
+            outage["upstream_calls"] = profile.calls - calls_before
+            outage["fallbacks"] = {k: v - fallbacks_before.get(k, 0) for k, v in fallbacks(main).items()}
+            outage["breakers"] = breakers(resilience)
+
+            # Heal, wait out the breaker's reset (queued readings probe it) and check requests go through again
+            profile.latency, profile.error_rate = healthy
+            healed = time.perf_counter()
+            await asyncio.sleep(float(FAULT_ENV["BREAKER_RESET_SECONDS"]) + 0.2)
+            while time.perf_counter() - healed < 15 and (busy_jobs(main) or set(breakers(resilience).values()) - {"closed"}):
+                await asyncio.sleep(0.1)
+            waited = time.perf_counter() - healed
+            recovered = await send_all(client, path, lambda i: make_body(100_000 + i), range(args.recovery_requests), 1, headers)
+            recovered["seconds_until_closed"] = round(waited, 2)
+            recovered["breakers"] = breakers(resilience)
+            if hasattr(main, "job_queue"):
+                recovered["jobs"] = {k: main.job_queue.snapshot().get(k, 0) - jobs_before.get(k, 0) for k in ("completed", "failed")}
+            results[name] = {"service": service, "fault": {"latency": latency, "error_rate": error_rate},
+                             "p95_ms": outage.get("p95_ms"), "outage": outage, "recovered": recovered}
+            results[name]["checks"] = check_scenario(name, results[name], resilience, args.concurrency)
+    if hasattr(main, "job_queue"):
+        await main.job_queue.stop()
+    services.stop()
+    config = {"requests": args.requests, "concurrency": args.concurrency, "recovery_requests": args.recovery_requests,
+              "healthy_latency": HEALTHY_LATENCY, "env": FAULT_ENV}
+    failed = [f"{name}.{check}" for name, result in results.items() for check, ok in result["checks"].items() if not ok]
+    return {"kind": "faults", "meta": metadata(args.app_dir), "config": config, "results": results, "failed_checks": failed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_common_arguments(parser)
+    parser.add_argument("--scenarios", help="comma-separated subset (default: all)")
+    parser.add_argument("--requests", type=int, default=30, help="requests per scenario while the service is broken")
+    parser.add_argument("--recovery-requests", type=int, default=3, help="requests after it is healthy again")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.ref:
+        report = run_at_ref(__file__, args.ref, strip_ref_args(sys.argv[1:]))
+    else:
+        with contextlib.redirect_stdout(sys.stderr):
+            report = asyncio.run(run(args))
+    code = finish(report, args, "p95_ms")
+    for failed in report.get("failed_checks", []):
+        print(f"FAILED {failed}", file=sys.stderr)
+    sys.exit(1 if report.get("failed_checks") else code)
+
+
+if __name__ == "__main__":
+    main()
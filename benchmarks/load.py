@@ -0,0 +1,203 @@
+"""Per-endpoint load scenarios against local fake Nominatim, Supabase and Gemini.
+
+    python benchmarks/load.py                                   # every scenario
+    python benchmarks/load.py --scenarios calculate_charts,generate_reading --concurrency 16
+    python benchmarks/load.py --latency gemini=2.0,nominatim=0.3 --error-rate gemini=0.05
+    python benchmarks/load.py --ref HEAD~5 --output before.json
+    python benchmarks/load.py --compare before.json            # exit 1 on a p95 (--metric) regression
+
+The app runs in-process (httpx ASGI transport) while the real geopy and
+supabase clients talk HTTP to benchmarks/fakes.py; Gemini is replaced
+in-process. Each scenario is a closed loop of --concurrency clients sending
+--requests requests in total; the report has p50/p95/p99, throughput, status
+codes and how many calls reached each fake service.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import contextlib
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from report import add_common_arguments, finish, metadata, run_at_ref, strip_ref_args, summarize
+from fakes import FakeServices, FakeGemini, ServiceProfile, SERVICES
+
+JWT_SECRET = "bench-jwt-secret-0123456789abcdef"
+DEFAULT_LATENCY = {"nominatim": 0.15, "gotrue": 0.04, "postgrest": 0.03, "gemini": 1.0}
+
+
+def parse_pairs(text, defaults=None):
+    values = dict(defaults or {})
+    for part in filter(None, (text or "").split(",")):
+        name, _, value = part.partition("=")
+        if name not in SERVICES:
+            raise SystemExit(f"unknown service {name!r}; expected one of {', '.join(SERVICES)}")
+        values[name] = float(value)
+    return values
+
+
+def birth(i, places):
+    # Spread over 60 years and `places` distinct towns, so caches see realistic reuse
+    day = 1 + (i * 7) % 28
+    month = 1 + (i * 5) % 12
+    year = 1960 + (i * 13) % 60
+    return {"date": f"{year}-{month:02d}-{day:02d}", "time": f"{(i * 11) % 24:02d}:{(i * 17) % 60:02d}",
+            "place": f"Bench Town {i % places}", "gender": "female" if i % 2 else "male"}
+
+
+def build_scenarios(main, places):
+    chart = main.calculate_astro_details("1990-05-17", "08:30", 6.9271, 79.8612)
+    d1_chart, prompt_data = chart[0], chart[2]
+    candidates = [{"id": f"c{k}", "nakshatra": k % 27, "rasi": (k * 5) % 12, "kuja_dosha": k % 3 == 0,
+                   "gender": "male" if k % 2 else "female"} for k in range(200)]
+
+    def reading(i):
+        # A nonce in the prompt data makes every request a reading-cache miss
+        return {"prompt_data": dict(prompt_data, bench_nonce=i)}
+
+    return {
+        "calculate_charts": ("/calculate_charts", lambda i: birth(i, places)),
+        "calculate_charts_batch": ("/calculate_charts/batch", lambda i: {"records": [birth(i * 50 + k, places) for k in range(50)]}),
+        "prepare_porondam": ("/prepare_porondam", lambda i: {"person1": birth(i, places), "person2": birth(i + 1, places)}),
+        "calculate_porondam": ("/calculate_porondam", lambda i: {"person1": birth(i, places), "person2": birth(i + 1, places)}),
+        "calculate_porondam_stream": ("/calculate_porondam?stream=true", lambda i: {"person1": birth(i, places), "person2": birth(i + 3, places)}),
+        "generate_reading": ("/generate_reading", reading),
+        "generate_reading_stream": ("/generate_reading?stream=true", lambda i: reading(-i - 1)),
+        # Bursts of five identical requests, like double clicks and frontend retries
+        "generate_reading_duplicates": ("/generate_reading", lambda i: reading(-1_000_000 - i // 5)),
+        # Time to a 202 with a job ID; the generation itself runs on the job workers
+        "generate_reading_job": ("/generate_reading?job=true", lambda i: reading(-2_000_000 - i)),
+        "deduct_pdf_credit": ("/deduct_pdf_credit", lambda i: None),
+        "porondam_search": ("/porondam/search", lambda i: {"person": birth(i, places), "top_k": 10, "candidates": candidates}),
+        "dasha": ("/dasha", lambda i: {"person": birth(i, places), "start": "2020-01-01", "end": "2030-01-01"}),
+        "transits": ("/transits", lambda i: {"d1_chart": d1_chart, "prompt_data": prompt_data,
+                                              "start": f"{2020 + i % 10}-01-01", "end": f"{2021 + i % 10}-01-01"}),
+    }
+
+
+async def warm_up(client, path, make_body, count, headers):
+    # Lazy imports and first cache fills; these use their own inputs and are not counted
+    for i in range(count):
+        response = await client.post(path, json=make_body(1_000_000 + i), headers=headers)
+        await response.aread()
+
+
+async def run_scenario(client, path, make_body, requests_total, concurrency, headers):
+    latencies, statuses = [], {}
+    queue = iter(range(requests_total))
+
+    async def worker():
+        for i in queue:
+            started = time.perf_counter()
+            response = await client.post(path, json=make_body(i), headers=headers)
+            await response.aread()
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    result = summarize(latencies, wall)
+    result["status"] = {str(k): v for k, v in sorted(statuses.items())}
+    return result
+
+
+async def run(args):
+    latency = parse_pairs(args.latency, DEFAULT_LATENCY)
+    errors = parse_pairs(args.error_rate)
+    profiles = {name: ServiceProfile(latency.get(name, 0.0), latency.get(name, 0.0) * args.jitter, errors.get(name, 0.0), seed=i)
+                for i, name in enumerate(SERVICES)}
+    services = FakeServices({k: v for k, v in profiles.items() if k != "gemini"}).start()
+    scratch = tempfile.mkdtemp(prefix="bench-load-")
+    os.environ.update(services.env())
+    os.environ.update({
+        "PLACE_CACHE_PATH": os.path.join(scratch, "places.sqlite3"),
+        "READING_CACHE_PATH": os.path.join(scratch, "readings.sqlite3"),
+        "JOB_DB_PATH": os.path.join(scratch, "jobs.sqlite3"),
+        "GEMINI_API_KEY": "bench",
+        # Every scenario runs as one user; --per-user-limit keeps the default cap out of the way
+        "SINGLEFLIGHT_PER_USER": str(args.per_user_limit),
+        "JOB_MAX_PER_USER": str(args.per_user_limit),
+        "JOB_QUEUE_MAX": str(args.per_user_limit),
+    })
+    if not args.remote_auth:
+        os.environ["SUPABASE_JWT_SECRET"] = JWT_SECRET
+    sys.path.insert(0, args.app_dir)
+
+    import jwt
+    import httpx
+    from geopy.geocoders import Nominatim
+    import main
+
+    main.GEMINI_API_KEY = "bench"
+    if hasattr(main, "clients"):
+        # Supabase and Nominatim already point at the fakes through the environment
+        main.clients.override(genai=SimpleNamespace(GenerativeModel=FakeGemini(profiles["gemini"])))
+    else:
+        # Older trees build their clients at import time and hard-code the Nominatim host
+        main.geolocator = Nominatim(user_agent="bench", domain=services.env()["NOMINATIM_DOMAIN"], scheme="http")
+        if hasattr(main, "place_resolver"):
+            main.place_resolver._geocode = main.geolocator.geocode
+        main.genai.GenerativeModel = FakeGemini(profiles["gemini"])
+
+    token = jwt.encode({"sub": "bench-user", "aud": "authenticated", "exp": int(time.time()) + 3600}, JWT_SECRET, algorithm="HS256")
+    headers = {"Authorization": f"Bearer {token}"}
+    scenarios = build_scenarios(main, args.places)
+    selected = args.scenarios.split(",") if args.scenarios else list(scenarios)
+    routes = {getattr(r, "path", None) for r in main.app.routes}
+
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        for name in selected:
+            path, make_body = scenarios[name]
+            if path.split("?")[0] not in routes:
+                results[name] = {"skipped": "endpoint not present in this tree"}
+                continue
+            await warm_up(client, path, make_body, args.warmup, headers)
+            before = services.stats()
+            before["gemini"] = profiles["gemini"].stats()
+            result = await run_scenario(client, path, make_body, args.requests, args.concurrency, headers)
+            after = services.stats()
+            after["gemini"] = profiles["gemini"].stats()
+            result["service_calls"] = {k: after[k]["calls"] - before[k]["calls"] for k in SERVICES if after[k]["calls"] != before[k]["calls"]}
+            results[name] = result
+    services.stop()
+    config = {"requests": args.requests, "warmup": args.warmup, "concurrency": args.concurrency, "places": args.places, "latency": latency,
+              "error_rate": errors, "jitter": args.jitter, "remote_auth": args.remote_auth,
+              "per_user_limit": args.per_user_limit}
+    return {"kind": "load", "meta": metadata(args.app_dir), "config": config, "results": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_common_arguments(parser)
+    parser.add_argument("--scenarios", help="comma-separated subset (default: all)")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=3, help="uncounted requests before each scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--places", type=int, default=25, help="distinct place names in the traffic")
+    parser.add_argument("--latency", help="per-service seconds, e.g. gemini=1.5,nominatim=0.2")
+    parser.add_argument("--error-rate", help="per-service failure probability, e.g. gemini=0.05")
+    parser.add_argument("--jitter", type=float, default=0.25, help="extra random latency as a fraction of the base")
+    parser.add_argument("--metric", default="p95_ms", choices=["p50_ms", "p95_ms", "p99_ms", "mean_ms"],
+                        help="latency figure used by --compare")
+    parser.add_argument("--per-user-limit", type=int, default=100000, help="SINGLEFLIGHT_PER_USER for the app under test")
+    parser.add_argument("--remote-auth", action="store_true", help="don't give the app the JWT secret (every token goes to GoTrue)")
+    args = parser.parse_args()
+
+    if args.ref:
+        report = run_at_ref(__file__, args.ref, strip_ref_args(sys.argv[1:]))
+    else:
+        # Keep stdout clean for the JSON report (the app prints tracebacks and sampled logs)
+        with contextlib.redirect_stdout(sys.stderr):
+            report = asyncio.run(run(args))
+    sys.exit(finish(report, args, args.metric))
+
+
+if __name__ == "__main__":
+    main()
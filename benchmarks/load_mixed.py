@@ -0,0 +1,179 @@
+"""Tail latency of the API under concurrent mixed traffic.
+
+Runs the FastAPI app in-process with slow, *blocking* stand-ins for Nominatim
+and Supabase (they sleep like the real synchronous clients do) and fires a mix
+of /calculate_charts, /prepare_porondam and /deduct_pdf_credit requests.
+
+    python benchmarks/load_mixed.py                 # current tree
+    python benchmarks/load_mixed.py --ref HEAD~1    # any git revision, for before/after
+
+Prints one JSON document with p50/p95/p99 per endpoint and overall throughput.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import statistics
+import contextlib
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class _Location:
+    def __init__(self, lat, lon):
+        self.latitude, self.longitude = lat, lon
+
+
+class FakeSupabase:
+    def __init__(self, latency):
+        self.latency = latency
+        self.auth = self
+
+    def get_user(self, token):
+        time.sleep(self.latency)
+        return type("R", (), {"user": type("U", (), {"id": "bench-user"})()})()
+
+    def table(self, name):
+        return self
+
+    def select(self, *cols):
+        return self
+
+    def eq(self, *args):
+        return self
+
+    def single(self):
+        return self
+
+    def execute(self):
+        time.sleep(self.latency)
+        return type("R", (), {"data": {"credits": 1000, "is_vip": False}})()
+
+
+def bench_token():
+    import jwt
+    claims = {"sub": "bench-user", "aud": "authenticated", "exp": int(time.time()) + 3600}
+    return jwt.encode(claims, os.environ.get("SUPABASE_JWT_SECRET", "bench-secret"), algorithm="HS256")
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))]
+
+
+async def run_load(app_dir, requests_total, rate, geocode_latency, supabase_latency):
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_SERVICE_KEY", "bench")
+    os.environ["PLACE_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "places.sqlite3")
+    # Trees with auth.py verify tokens locally, so hand them a real HS256 JWT
+    os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-secret")
+    # All traffic comes from one token, so lift the per-user in-flight limit
+    os.environ.setdefault("SINGLEFLIGHT_PER_USER", "100000")
+    sys.path.insert(0, app_dir)
+    import httpx
+    import main
+
+    def slow_geocode(place, *args, **kwargs):
+        time.sleep(geocode_latency)
+        return _Location(6.9271 + random.random() / 10, 79.8612)
+
+    if hasattr(main, "place_resolver"):
+        main.place_resolver._geocode = slow_geocode
+    else:
+        main.geolocator.geocode = slow_geocode
+    if hasattr(main, "clients"):
+        main.clients.override(supabase=FakeSupabase(supabase_latency))
+    else:
+        main.supabase = FakeSupabase(supabase_latency)
+
+    rng = random.Random(42)
+    headers = {"Authorization": f"Bearer {bench_token()}"}
+
+    def make_request(i):
+        # Unique place names so every request is a geocoding miss
+        birth = {"date": "1990-05-17", "time": "08:30", "place": f"Bench Town {i}", "gender": "female"}
+        kind = rng.choices(["charts", "porondam", "pdf"], weights=[6, 2, 2])[0]
+        if kind == "charts":
+            return "/calculate_charts", birth
+        if kind == "porondam":
+            other = dict(birth, place=f"Bench Town {i}b", date="1988-02-03")
+            return "/prepare_porondam", {"person1": birth, "person2": other}
+        return "/deduct_pdf_credit", None
+
+    plan = [make_request(i) for i in range(requests_total)]
+    latencies = {}
+    errors = 0
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        # Open-loop arrivals: request i is due at i / rate, and its latency is
+        # measured from that moment, so time spent stuck behind a blocked event
+        # loop is counted (a closed loop would hide it).
+        async def one(i, path, body):
+            nonlocal errors
+            due = started + i / rate
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            resp = await client.post(path, json=body, headers=headers)
+            elapsed = time.perf_counter() - due
+            if resp.status_code != 200:
+                errors += 1
+            latencies.setdefault(path, []).append(elapsed)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i, path, body) for i, (path, body) in enumerate(plan)))
+        wall = time.perf_counter() - started
+
+    report = {"requests": requests_total, "arrival_rate": rate, "errors": errors,
+              "wall_seconds": round(wall, 3), "throughput_rps": round(requests_total / wall, 2), "endpoints": {}}
+    everything = []
+    for path, samples in sorted(latencies.items()):
+        everything.extend(samples)
+        report["endpoints"][path] = {
+            "count": len(samples),
+            "p50_ms": round(percentile(samples, 50) * 1000, 1),
+            "p95_ms": round(percentile(samples, 95) * 1000, 1),
+            "p99_ms": round(percentile(samples, 99) * 1000, 1),
+            "mean_ms": round(statistics.mean(samples) * 1000, 1),
+        }
+    report["overall"] = {q: round(percentile(everything, int(q[1:3])) * 1000, 1) for q in ("p50_ms", "p95_ms", "p99_ms")}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ref", help="git revision to benchmark instead of the working tree")
+    parser.add_argument("--app-dir", default=REPO_ROOT, help=argparse.SUPPRESS)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20.0, help="request arrivals per second")
+    parser.add_argument("--geocode-latency", type=float, default=0.25)
+    parser.add_argument("--supabase-latency", type=float, default=0.08)
+    args = parser.parse_args()
+
+    if args.ref:
+        # Extract the revision into a scratch dir and re-run ourselves against it
+        target = tempfile.mkdtemp(prefix="bench-ref-")
+        archive = subprocess.run(["git", "-C", REPO_ROOT, "archive", args.ref], check=True, capture_output=True).stdout
+        subprocess.run(["tar", "-x", "-C", target], input=archive, check=True)
+        cmd = [sys.executable, os.path.abspath(__file__), "--app-dir", target,
+               "--requests", str(args.requests), "--rate", str(args.rate),
+               "--geocode-latency", str(args.geocode_latency), "--supabase-latency", str(args.supabase_latency)]
+        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        report = json.loads(result.stdout)
+        report["ref"] = args.ref
+        print(json.dumps(report, indent=2))
+        return
+
+    # Keep stdout clean for the JSON report (the app prints tracebacks)
+    with contextlib.redirect_stdout(sys.stderr):
+        report = asyncio.run(run_load(args.app_dir, args.requests, args.rate,
+                                      args.geocode_latency, args.supabase_latency))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""CPU cost of request metrics (middleware + stage spans) on /calculate_charts.
+
+    python benchmarks/metrics_overhead.py [--requests 400] [--rounds 5]
+
+Runs the same warm /calculate_charts requests in-process with and without
+MetricsMiddleware, alternating rounds, and reports CPU seconds per request
+and the relative overhead (the target is < 1%). Stage spans stay on in both
+runs; `span_us` is the cost of one of them on its own.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+os.environ.setdefault("SUPABASE_SERVICE_KEY", "bench")
+os.environ.setdefault("SUPABASE_JWT_SECRET", "bench-secret")
+os.environ.setdefault("SINGLEFLIGHT_PER_USER", "100000")
+os.environ["PLACE_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "places.sqlite3")
+
+
+async def cpu_per_request(app, headers, requests_total):
+    import httpx
+    transport = httpx.ASGITransport(app=app)
+    birth = {"date": "1990-05-17", "time": "08:30", "place": "Colombo"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.process_time()
+        for _ in range(requests_total):
+            response = await client.post("/calculate_charts", json=birth, headers=headers)
+            response.raise_for_status()
+        return (time.process_time() - started) / requests_total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    import main as app_main
+    import metrics
+    from load_mixed import FakeSupabase, bench_token
+
+    app_main.clients.override(supabase=FakeSupabase(0))
+    headers = {"Authorization": f"Bearer {bench_token()}"}
+    with_metrics = list(app_main.app.user_middleware)
+    without_metrics = [m for m in with_metrics if m.cls is not metrics.MetricsMiddleware]
+
+    def use(middleware):
+        app_main.app.user_middleware = middleware
+        app_main.app.middleware_stack = None
+
+    samples = {"with": [], "without": []}
+    asyncio.run(cpu_per_request(app_main.app, headers, 50))  # warm caches
+    for _ in range(args.rounds):
+        for label, middleware in (("without", without_metrics), ("with", with_metrics)):
+            use(middleware)
+            samples[label].append(asyncio.run(cpu_per_request(app_main.app, headers, args.requests)))
+    use(with_metrics)
+
+    started = time.perf_counter()
+    for _ in range(100000):
+        with metrics.span("bench"):
+            pass
+    span_seconds = (time.perf_counter() - started) / 100000
+
+    base, instrumented = statistics.median(samples["without"]), statistics.median(samples["with"])
+    print(json.dumps({
+        "cpu_ms_per_request_without": round(base * 1000, 4),
+        "cpu_ms_per_request_with": round(instrumented * 1000, 4),
+        "overhead_percent": round((instrumented - base) / base * 100, 2),
+        "span_us": round(span_seconds * 1e6, 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
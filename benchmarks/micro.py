@@ -0,0 +1,127 @@
+"""Micro-benchmarks for the chart code paths, no network involved.
+
+    python benchmarks/micro.py [--repeat 7] [--output now.json] [--compare before.json]
+    python benchmarks/micro.py --ref HEAD~3 --output before.json
+
+Each benchmark is timed `--repeat` times; the report has the median and best
+microseconds per call. --compare exits non-zero when a median got slower than
+--threshold.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import datetime
+import statistics
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from report import add_common_arguments, finish, metadata, run_at_ref, strip_ref_args
+
+
+def births(n):
+    start = datetime.datetime(1950, 1, 1, 0, 0)
+    for i in range(n):
+        dt = start + datetime.timedelta(minutes=i * 7919)
+        yield dt.strftime("%Y-%m-%d"), dt.strftime("%H:%M")
+
+
+def time_per_call(fn, inputs, repeat):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in inputs:
+            fn(item)
+        runs.append((time.perf_counter() - started) / len(inputs))
+    return {"median_us": round(statistics.median(runs) * 1e6, 3), "best_us": round(min(runs) * 1e6, 3),
+            "calls_per_run": len(inputs)}
+
+
+def check_transit_windows(main):
+    # Every event of a year, asked for again as a one-day window on its own date, comes back,
+    # and nothing outside a window is reported
+    start, end = datetime.date(2020, 1, 1), datetime.date(2021, 1, 1)
+    events = main.calculate_transits(0, 0, None, start, end, ["Moon"], False)
+    assert all(start.isoformat() <= e["time"][:10] < end.isoformat() for e in events), "transit outside its window"
+    for event in events[::25]:
+        day = datetime.date.fromisoformat(event["time"][:10])
+        found = main.calculate_transits(0, 0, None, day, day + datetime.timedelta(days=1), ["Moon"], False)
+        assert event in found, f"{event['time']} ingress missing from its own day"
+        assert all(e["time"][:10] == day.isoformat() for e in found), f"{day}: transit from another day"
+
+
+def run(app_dir, repeat):
+    sys.path.insert(0, app_dir)
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_SERVICE_KEY", "bench")
+    import main
+    import swisseph as swe
+
+    cold = list(births(400))
+    warm = cold[:20] * 20
+    colombo = (6.9271, 79.8612)
+    charts = [main.calculate_astro_details(d, t, *colombo) for d, t in cold[:50]]
+    dasha_inputs = []
+    for d, t in cold[:200]:
+        year, month, day = map(int, d.split('-'))
+        hour, minute = map(int, t.split(':'))
+        birth = datetime.datetime(year, month, day, hour, minute)
+        dasha_inputs.append((swe.julday(year, month, day, hour + minute / 60.0), birth))
+
+    results = {
+        # Distinct birth minutes, so nothing is memoized
+        "calculate_astro_details_cold": time_per_call(lambda b: main.calculate_astro_details(b[0], b[1], *colombo), cold, 1),
+        # The same 20 births over and over, like repeat visitors
+        "calculate_astro_details_warm": time_per_call(lambda b: main.calculate_astro_details(b[0], b[1], *colombo), warm, repeat),
+        "calculate_vimshottari_dasha_sequence": time_per_call(lambda a: main.calculate_vimshottari_dasha_sequence(*a), dasha_inputs, repeat),
+        "get_house_placements": time_per_call(lambda c: main.get_house_placements(c[0]), charts * 20, repeat),
+    }
+    # Local birth time -> Julian day (the time-zone step of every chart)
+    results["birth_moment"] = time_per_call(lambda b: main.birth_moment(b[0], b[1]), cold[:200], repeat)
+    if hasattr(main, "tz_resolver"):
+        abroad = [(d, t, 51.5 + (i % 7) * 0.01, -0.12) for i, (d, t) in enumerate(cold[:200])]
+        main.birth_moment(*abroad[0])  # opens the timezonefinder index once, outside the timing
+        results["birth_moment_abroad"] = time_per_call(lambda b: main.birth_moment(*b), abroad, repeat)
+        moments = [(main.parse_birth(d, t), lat, lon) for d, t, lat, lon in abroad]
+        batch = time_per_call(main.tz_resolver.to_jd_batch, [moments], repeat)
+        results["birth_moment_batch"] = {k: round(v / len(moments), 3) if k.endswith("_us") else v for k, v in batch.items()}
+    if hasattr(main, "calculate_chart"):
+        # Full labelled response vs the compact one, both serialized the way the endpoint would
+        compact_sep = (",", ":")
+        results["chart_response_full"] = time_per_call(
+            lambda b: json.dumps(main.build_chart_response(*main.calculate_astro_details(b[0], b[1], *colombo), "female"),
+                                 ensure_ascii=False, default=str), warm, repeat)
+        results["chart_response_compact"] = time_per_call(
+            lambda b: json.dumps(main.calculate_chart(b[0], b[1], *colombo).compact("female"), ensure_ascii=False, separators=compact_sep),
+            warm, repeat)
+    if hasattr(main, "calculate_transits"):
+        check_transit_windows(main)
+        year = (datetime.date(2020, 1, 1), datetime.date(2021, 1, 1))
+        results["transits_year_slow_planets"] = time_per_call(
+            lambda w: main.calculate_transits(0, 0, None, *w, ["Saturn", "Jupiter", "Rahu", "Ketu"]), [year], repeat)
+    if hasattr(main, "DashaTree"):
+        trees = [main.DashaTree(birth, (i * 37.1) % 360) for i, (_, birth) in enumerate(dasha_inputs)]
+        today = datetime.date.today()
+        results["dasha_path_on"] = time_per_call(lambda tree: tree.path_on(today), trees, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_common_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.ref:
+        report = run_at_ref(__file__, args.ref, strip_ref_args(sys.argv[1:]))
+    else:
+        # Keep stdout clean for the JSON report
+        with contextlib.redirect_stdout(sys.stderr):
+            results = run(args.app_dir, args.repeat)
+        report = {"kind": "micro", "meta": metadata(args.app_dir), "config": {"repeat": args.repeat}, "results": results}
+    sys.exit(finish(report, args, "median_us"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""One-to-many porondam search over a synthetic candidate pool.
+
+    python benchmarks/porondam_search.py [--candidates 100000] [--top-k 10]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from porondam import CandidateIndex
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--candidates", type=int, default=100_000)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(7)
+    n = args.candidates
+    index = CandidateIndex()
+    started = time.perf_counter()
+    index.extend({"id": str(i), "nakshatra": int(nak), "rasi": int(rasi), "kuja_dosha": bool(kuja), "gender": "male" if male else "female"}
+                 for i, (nak, rasi, kuja, male) in enumerate(zip(rng.integers(0, 27, n), rng.integers(0, 12, n),
+                                                                 rng.random(n) < 0.3, rng.random(n) < 0.5)))
+    build_ms = (time.perf_counter() - started) * 1000
+
+    timings = []
+    for i in range(args.repeat):
+        started = time.perf_counter()
+        index.search(i % 27, i % 12, bool(i % 2), query_is_bride=bool(i % 3), top_k=args.top_k)
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    print(json.dumps({
+        "candidates": n,
+        "index_build_ms": round(build_ms, 1),
+        "search_p50_ms": round(timings[len(timings) // 2], 3),
+        "search_max_ms": round(timings[-1], 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Prompt size and generation latency, legacy vs. compact prompts.
+
+    python benchmarks/prompt_size.py [--charts 20] [--prefill-ms-per-1k 40]
+    python benchmarks/prompt_size.py --live --charts 3      (needs GEMINI_API_KEY)
+    python benchmarks/prompt_size.py --compare before.json
+
+For a spread of birth charts, both PROMPT_STYLEs build the reading and the
+porondam prompt; the report has characters, estimated tokens and build time per
+prompt, split into the static part (system instruction / cached context) and
+the per-call part.
+
+Latency is modeled with benchmarks/fakes.FakeGemini: a fixed generation time
+plus --prefill-ms-per-1k for every 1000 prompt tokens, so only the prompt-size
+part of the difference shows. With --live the prompts go to the real Gemini
+API instead: count_tokens gives the actual prompt tokens and each prompt is
+generated once (this costs tokens).
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import statistics
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from report import add_common_arguments, finish, metadata, run_at_ref, strip_ref_args
+from fakes import FakeGemini, ServiceProfile
+
+STYLES = ("legacy", "compact")
+
+
+def births(n):
+    start = datetime.datetime(1952, 3, 1, 4, 10)
+    for i in range(n):
+        dt = start + datetime.timedelta(minutes=i * 104729)
+        yield dt.strftime("%Y-%m-%d"), dt.strftime("%H:%M")
+
+
+def prompt_data_for(main, n):
+    colombo = (6.9271, 79.8612)
+    out = []
+    for i, (date, time_str) in enumerate(births(n)):
+        details = main.calculate_astro_details(date, time_str, *colombo)
+        out.append(main.build_chart_response(*details, "female" if i % 2 else "male")["prompt_data"])
+    return out
+
+
+def build_all(prompts, style, charts):
+    builder = prompts.PromptBuilder(style=style, budget=0)
+    pairs = list(zip(charts, charts[1:] + charts[:1]))
+    built, seconds = {"reading": [], "porondam": []}, {"reading": [], "porondam": []}
+    for data in charts:
+        started = time.perf_counter()
+        built["reading"].append(builder.reading(data))
+        seconds["reading"].append(time.perf_counter() - started)
+    for p1, p2 in pairs:
+        started = time.perf_counter()
+        built["porondam"].append(builder.porondam(p1, p2))
+        seconds["porondam"].append(time.perf_counter() - started)
+    return built, seconds
+
+
+def size_row(prompts, built, seconds):
+    return {
+        "static_chars": len(built[0].system),
+        "per_call_chars": round(statistics.mean(len(p.contents) for p in built)),
+        "per_call_tokens": round(statistics.mean(prompts.estimate_tokens(p.contents) for p in built)),
+        "estimated_tokens": round(statistics.mean(p.estimated_tokens for p in built)),
+        "build_us": round(statistics.median(seconds) * 1e6, 1),
+    }
+
+
+def modeled_latency(prompts, built, generation_ms, prefill_ms_per_1k):
+    fake = FakeGemini(ServiceProfile(latency=generation_ms / 1000), prefill_seconds_per_1k=prefill_ms_per_1k / 1000)
+    factory = prompts.ModelFactory(lambda: SimpleNamespace(GenerativeModel=fake), "fake", context_cache=False)
+    samples = []
+    for prompt in built:
+        started = time.perf_counter()
+        factory.model(prompt).generate_content(prompt.contents)
+        samples.append(time.perf_counter() - started)
+    return {"median_ms": round(statistics.median(samples) * 1000, 1)}
+
+
+def live_latency(prompts, built, model_name):
+    import google.generativeai as genai
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    factory = prompts.ModelFactory(lambda: genai, model_name, context_cache=False)
+    tokens, samples = [], []
+    for prompt in built:
+        model = factory.model(prompt)
+        tokens.append(model.count_tokens(prompt.contents).total_tokens)
+        started = time.perf_counter()
+        model.generate_content(prompt.contents)
+        samples.append(time.perf_counter() - started)
+    return {"prompt_tokens": round(statistics.mean(tokens)), "median_ms": round(statistics.median(samples) * 1000, 1)}
+
+
+def run(app_dir, n, generation_ms, prefill_ms_per_1k, live):
+    sys.path.insert(0, app_dir)
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_SERVICE_KEY", "bench")
+    os.environ["PROMPT_LOG"] = "0"
+    import main
+    import prompts
+
+    charts = prompt_data_for(main, n)
+    results = {}
+    for style in STYLES:
+        built, seconds = build_all(prompts, style, charts)
+        for kind in ("reading", "porondam"):
+            row = size_row(prompts, built[kind], seconds[kind])
+            if live:
+                row.update(live_latency(prompts, built[kind], main.READING_MODEL))
+            else:
+                row.update(modeled_latency(prompts, built[kind], generation_ms, prefill_ms_per_1k))
+            results[f"{kind}_{style}"] = row
+    for kind in ("reading", "porondam"):
+        legacy, compact = results[f"{kind}_legacy"], results[f"{kind}_compact"]
+        # The static part is what a cached context bills at the cached rate
+        results[f"{kind}_compact"]["per_call_tokens_saved_percent"] = round(
+            100 * (1 - compact["per_call_tokens"] / legacy["estimated_tokens"]), 1)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_common_arguments(parser)
+    parser.add_argument("--charts", type=int, default=20, help="birth charts to build prompts for")
+    parser.add_argument("--generation-ms", type=float, default=200, help="modeled generation time independent of prompt size")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=40, help="modeled extra latency per 1000 prompt tokens")
+    parser.add_argument("--live", action="store_true", help="call the real Gemini API (GEMINI_API_KEY)")
+    args = parser.parse_args()
+
+    if args.ref:
+        report = run_at_ref(__file__, args.ref, strip_ref_args(sys.argv[1:]))
+    else:
+        results = run(args.app_dir, args.charts, args.generation_ms, args.prefill_ms_per_1k, args.live)
+        report = {"kind": "prompt_size", "meta": metadata(args.app_dir),
+                  "config": {"charts": args.charts, "live": args.live, "generation_ms": args.generation_ms,
+                             "prefill_ms_per_1k": args.prefill_ms_per_1k},
+                  "results": results}
+    sys.exit(finish(report, args, "estimated_tokens"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Shared helpers for benchmark reports: percentiles, run metadata, --ref and --compare."""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))]
+
+
+def summarize(samples, wall_seconds=None):
+    """Latency summary (milliseconds) of a list of durations in seconds."""
+    if not samples:
+        return {"count": 0}
+    summary = {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(statistics.mean(samples) * 1000, 3),
+    }
+    if wall_seconds:
+        summary["throughput_rps"] = round(len(samples) / wall_seconds, 2)
+    return summary
+
+
+def _git(*args, cwd=REPO_ROOT):
+    try:
+        return subprocess.run(["git", "-C", cwd] + list(args), capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(app_dir=REPO_ROOT):
+    return {
+        "commit": _git("rev-parse", "HEAD", cwd=app_dir),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no", cwd=app_dir)),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+def run_at_ref(script, ref, argv):
+    """Re-run `script` against `git archive <ref>` and return its JSON report."""
+    target = tempfile.mkdtemp(prefix="bench-ref-")
+    archive = subprocess.run(["git", "-C", REPO_ROOT, "archive", ref], check=True, capture_output=True).stdout
+    subprocess.run(["tar", "-x", "-C", target], input=archive, check=True)
+    cmd = [sys.executable, os.path.abspath(script), "--app-dir", target] + list(argv)
+    result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+    report = json.loads(result.stdout)
+    report["meta"]["commit"] = _git("rev-parse", ref)
+    report["meta"]["ref"] = ref
+    return report
+
+
+def strip_ref_args(argv):
+    # Drop --ref/--output/--compare (and their values) before re-running ourselves
+    out, skip = [], False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        name = arg.split("=", 1)[0]
+        if name in ("--ref", "--output", "--compare"):
+            skip = "=" not in arg
+            continue
+        out.append(arg)
+    return out
+
+
+def compare(current, baseline, metric, threshold):
+    """Per-benchmark relative change of `metric` (higher is worse); returns (rows, regressions)."""
+    rows, regressions = [], []
+    for name, result in current["results"].items():
+        before = baseline.get("results", {}).get(name, {}).get(metric)
+        after = result.get(metric)
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        rows.append({"name": name, "before": before, "after": after, "change_percent": round(change * 100, 1)})
+        if change > threshold:
+            regressions.append(name)
+    return rows, regressions
+
+
+def finish(report, args, metric):
+    """Print the report, optionally save it and compare against a baseline file. Returns the exit code."""
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        rows, regressions = compare(report, baseline, metric, args.threshold)
+        report["comparison"] = {"baseline": baseline.get("meta", {}).get("commit"), "metric": metric,
+                                "threshold_percent": args.threshold * 100, "rows": rows, "regressions": regressions}
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    return 1 if report.get("comparison", {}).get("regressions") else 0
+
+
+def add_common_arguments(parser):
+    parser.add_argument("--ref", help="git revision to benchmark instead of the working tree")
+    parser.add_argument("--app-dir", default=REPO_ROOT, help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative slowdown that counts as a regression (default 0.10)")
@@ -0,0 +1,93 @@
+"""Worker start-up cost: import time and time to the first answered requests.
+
+    python benchmarks/startup.py [--runs 5]
+    python benchmarks/startup.py --ref HEAD~1 --output before.json
+    python benchmarks/startup.py --compare before.json
+
+Every run is a fresh interpreter (like a new gunicorn worker) that imports
+main, enters the app's lifespan and sends GET /health and then an
+authenticated POST /calculate_charts (geocoded by the fake Nominatim in
+benchmarks/fakes.py). Runs are repeated with CLIENT_WARMUP on and off; the
+report has the median milliseconds from interpreter start for each step.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from report import add_common_arguments, finish, metadata, run_at_ref, strip_ref_args
+from fakes import FakeServices
+
+JWT_SECRET = "bench-jwt-secret-0123456789abcdef"
+
+# Runs inside the fresh interpreter; prints one JSON line of timestamps (seconds since start)
+CHILD = r"""
+import time
+started = time.perf_counter()
+import sys, json
+sys.path.insert(0, sys.argv[1])
+marks = {}
+import main
+marks["import"] = time.perf_counter() - started
+import jwt
+from fastapi.testclient import TestClient
+token = jwt.encode({"sub": "bench-user", "aud": "authenticated", "exp": int(time.time()) + 3600}, sys.argv[2], algorithm="HS256")
+with TestClient(main.app) as client:
+    marks["lifespan"] = time.perf_counter() - started
+    health = client.get("/health")
+    marks["health"] = time.perf_counter() - started
+    charts = client.post("/calculate_charts", json={"date": "1990-05-17", "time": "08:30", "place": "Kandy", "gender": "female"},
+                         headers={"Authorization": "Bearer " + token})
+    marks["first_chart"] = time.perf_counter() - started
+marks["status"] = {"health": health.status_code, "first_chart": charts.status_code}
+print(json.dumps(marks))
+"""
+
+
+def one_run(app_dir, env):
+    result = subprocess.run([sys.executable, "-c", CHILD, app_dir, JWT_SECRET], env=env,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(app_dir, runs):
+    results = {}
+    with FakeServices() as services:
+        base_env = dict(os.environ, **services.env())
+        base_env["SUPABASE_JWT_SECRET"] = JWT_SECRET
+        base_env["PYTHONDONTWRITEBYTECODE"] = "1"
+        for warmup in ("1", "0"):
+            env = dict(base_env, CLIENT_WARMUP=warmup)
+            samples = [one_run(app_dir, env) for _ in range(runs)]
+            for step in ("import", "lifespan", "health", "first_chart"):
+                values = [s[step] for s in samples]
+                results[f"{step}_warmup_{'on' if warmup == '1' else 'off'}"] = {
+                    "median_ms": round(statistics.median(values) * 1000, 1),
+                    "best_ms": round(min(values) * 1000, 1),
+                    "status": samples[-1]["status"].get(step),
+                }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_common_arguments(parser)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per configuration")
+    args = parser.parse_args()
+
+    if args.ref:
+        report = run_at_ref(__file__, args.ref, strip_ref_args(sys.argv[1:]))
+    else:
+        started = time.perf_counter()
+        results = run(args.app_dir, args.runs)
+        report = {"kind": "startup", "meta": metadata(args.app_dir), "config": {"runs": args.runs},
+                  "results": results, "wall_seconds": round(time.perf_counter() - started, 1)}
+    sys.exit(finish(report, args, "median_ms"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Cost of divisional charts: the old D1+D9 arithmetic vs. the varga tables.
+
+    python benchmarks/varga_tables.py [--repeat 7] [--rows 1,256,5000]
+    python benchmarks/varga_tables.py --compare before.json
+
+For (rows, 10) arrays of real chart longitudes (rows=1 is one /calculate_charts
+request, 256 a batch chunk) it times:
+
+  * d1_d9_formulas   int(pos / 30) and int(((pos * 9) % 360) / 30), as before vargas.py
+  * d1_d9            the same two charts from the varga tables
+  * all_16           every varga in vargas.VARGA_NAMES
+  * derive_all_16    derive_chart_indices with all 16 (plus nakshatra and pada)
+
+and checks that the tables give exactly the old D1 and D9.
+"""
+import os
+import sys
+import time
+import argparse
+import datetime
+import statistics
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from report import add_common_arguments, finish, metadata, run_at_ref, strip_ref_args
+
+
+def longitudes(main, rows):
+    start = datetime.datetime(1950, 1, 1)
+    out = []
+    for i in range(min(rows, 500)):
+        dt = start + datetime.timedelta(minutes=i * 104729)
+        jd = main.tz_resolver.to_jd(dt, 6.9271, 79.8612)
+        out.append(main.chart_engine.positions(jd, 6.9271, 79.8612).as_row())
+    # Past 500 distinct births the rows repeat; the arithmetic doesn't care
+    return np.resize(np.array(out), (rows, len(out[0])))
+
+
+def timed(fn, repeat, number):
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        runs.append((time.perf_counter() - started) / number)
+    return {"median_us": round(statistics.median(runs) * 1e6, 3), "best_us": round(min(runs) * 1e6, 3)}
+
+
+def old_d1_d9(lon):
+    return (lon / 30).astype(np.int64), (np.mod(lon * 9, 360) / 30).astype(np.int64)
+
+
+def run(app_dir, rows_list, repeat):
+    sys.path.insert(0, app_dir)
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_SERVICE_KEY", "bench")
+    import main
+    try:
+        import vargas
+    except ImportError:
+        vargas = None
+
+    results = {}
+    for rows in rows_list:
+        lon = longitudes(main, rows)
+        number = max(20, 20000 // rows)
+        results[f"d1_d9_formulas_{rows}"] = timed(lambda: old_d1_d9(lon), repeat, number)
+        if vargas is None:
+            continue
+        signs = vargas.varga_signs(lon, ("D1", "D9"))
+        d1, d9 = old_d1_d9(lon)
+        assert (signs["D1"] == d1).all() and (signs["D9"] == d9).all(), "varga tables disagree with the old D1/D9"
+        results[f"d1_d9_{rows}"] = timed(lambda: vargas.varga_signs(lon, ("D1", "D9")), repeat, number)
+        results[f"all_16_{rows}"] = timed(lambda: vargas.varga_signs(lon, vargas.VARGA_NAMES), repeat, number)
+        results[f"derive_all_16_{rows}"] = timed(lambda: main.derive_chart_indices(lon, vargas.VARGA_NAMES), repeat, number)
+        baseline = results[f"d1_d9_formulas_{rows}"]["median_us"]
+        results[f"all_16_{rows}"]["vs_d1_d9_formulas"] = round(results[f"all_16_{rows}"]["median_us"] / baseline, 2)
+    if vargas is not None:
+        # For scale: one whole /calculate_charts response (ephemeris memoized) without and with every varga
+        def response(names):
+            chart = main.calculate_chart("1990-05-17", "08:30", 6.9271, 79.8612)
+            return main.full_chart_response(chart, "female", names)
+        results["full_response"] = timed(lambda: response(()), repeat, 200)
+        results["full_response_all_16"] = timed(lambda: response(vargas.VARGA_NAMES), repeat, 200)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_common_arguments(parser)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--rows", default="1,256,5000", help="comma-separated array sizes (charts per call)")
+    args = parser.parse_args()
+    rows_list = [int(r) for r in args.rows.split(",")]
+
+    if args.ref:
+        report = run_at_ref(__file__, args.ref, strip_ref_args(sys.argv[1:]))
+    else:
+        report = {"kind": "vargas", "meta": metadata(args.app_dir), "config": {"rows": rows_list, "repeat": args.repeat},
+                  "results": run(args.app_dir, rows_list, args.repeat)}
+    sys.exit(finish(report, args, "median_us"))
+
+
+if __name__ == "__main__":
+    main()
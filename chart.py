@@ -0,0 +1,119 @@
+import datetime
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from ephemeris import CHART_COLUMNS, PLANET_ORDER, ChartPositions
+from dasha import DashaTree
+from vargas import varga_signs
+
+
+# --- Compact Chart ---
+# One birth chart as small ints and floats. Signs are indices from Aries = 0,
+# columns follow CHART_COLUMNS (lagna, then PLANET_ORDER). Nothing here knows
+# a sign or planet name: main.py attaches the English/Sinhala labels when it
+# builds the full response, and compact clients do it themselves with the
+# tables from GET /chart_legend.
+#
+# Compact form (the short-key JSON / msgpack response, version 1):
+#   {"v": 1, "b": "1990-05-17T08:30",   local birth time
+#    "s": [10 ints], "n": [10 ints],     D1 and D9 signs in CHART_COLUMNS order
+#    "x": [10 floats],                   sidereal longitudes (4 decimals, for display)
+#    "k": [nakshatra 0-26, pada 1-4],
+#    "m": float,                         Moon longitude the dasha balance is computed from
+#    "d": {"l": [18 ints], "t": [19 dates]},  mahadasha lords (PLANET_ORDER) and boundaries
+#    "w": {"D10": [10 ints], ...},       only the divisional charts asked for (?vargas=)
+#    "g": "female"}                      only when a gender was given
+
+COMPACT_VERSION = 1
+
+
+class Chart:
+    __slots__ = ("birth", "longitudes", "moon_sidereal", "d1", "d9", "nakshatra", "pada", "_dasha_tree", "_vargas")
+
+    def __init__(self, birth: datetime.datetime, longitudes: Sequence[float], moon_sidereal: float,
+                 d1: Sequence[int], d9: Sequence[int], nakshatra: int, pada: int,
+                 vargas: Optional[Dict[str, Sequence[int]]] = None):
+        self.birth = birth                      # local birth time (zone of the birth place), naive
+        self.longitudes = tuple(longitudes)
+        self.moon_sidereal = moon_sidereal
+        self.d1 = tuple(d1)
+        self.d9 = tuple(d9)
+        self.nakshatra = nakshatra
+        self.pada = pada
+        self._dasha_tree: Optional[DashaTree] = None
+        # Divisional charts beyond D1/D9, filled in as they are asked for
+        self._vargas: Dict[str, Tuple[int, ...]] = {k: tuple(v) for k, v in (vargas or {}).items()}
+
+    @classmethod
+    def from_positions(cls, birth: datetime.datetime, positions: ChartPositions, d1, d9, nakshatra: int, pada: int,
+                       vargas=None) -> "Chart":
+        return cls(birth, positions.as_row(), positions.moon_sidereal, d1, d9, nakshatra, pada, vargas)
+
+    @property
+    def lagna(self) -> int:
+        return self.d1[0]
+
+    def sign(self, planet: str) -> int:
+        return self.d1[CHART_COLUMNS.index(planet)]
+
+    def navamsa_sign(self, planet: str) -> int:
+        return self.d9[CHART_COLUMNS.index(planet)]
+
+    def house(self, planet: str) -> int:
+        return (self.sign(planet) - self.lagna) % 12 + 1
+
+    def vargas(self, names: Sequence[str]) -> Dict[str, Tuple[int, ...]]:
+        """Signs per CHART_COLUMNS for each named divisional chart (vargas.VARGA_NAMES), computed on first use."""
+        missing = [name for name in names if name not in self._vargas]
+        if missing:
+            for name, signs in varga_signs(self.longitudes, missing).items():
+                self._vargas[name] = tuple(signs.tolist())
+        return {name: self._vargas[name] for name in names}
+
+    @property
+    def dasha_tree(self) -> DashaTree:
+        if self._dasha_tree is None:
+            self._dasha_tree = DashaTree(self.birth, self.moon_sidereal)
+        return self._dasha_tree
+
+    def compact(self, gender: Optional[str] = None, vargas: Sequence[str] = ()) -> Dict[str, Any]:
+        tree = self.dasha_tree
+        count = tree.mahadasha_count()
+        periods = [tree.mahadasha(i) for i in range(count)]
+        data = {
+            "v": COMPACT_VERSION,
+            "b": self.birth.strftime("%Y-%m-%dT%H:%M"),
+            "s": list(self.d1),
+            "n": list(self.d9),
+            "x": [round(x, 4) for x in self.longitudes],
+            "k": [self.nakshatra, self.pada],
+            "m": self.moon_sidereal,
+            "d": {"l": [PLANET_ORDER.index(p.lord) for p in periods],
+                  "t": [p.start.date().isoformat() for p in periods] + [periods[-1].end.date().isoformat()]},
+        }
+        if vargas:
+            data["w"] = {name: list(signs) for name, signs in self.vargas(vargas).items()}
+        if gender:
+            data["g"] = gender
+        return data
+
+    @classmethod
+    def from_compact(cls, data: Dict[str, Any]) -> Tuple["Chart", Optional[str]]:
+        """(chart, gender) from a compact chart sent back by a client; ValueError if it doesn't look like one."""
+        try:
+            if data.get("v") != COMPACT_VERSION:
+                raise ValueError(f"unsupported compact chart version {data.get('v')!r}")
+            birth = datetime.datetime.strptime(data["b"], "%Y-%m-%dT%H:%M")
+            d1, d9 = [int(s) for s in data["s"]], [int(s) for s in data["n"]]
+            longitudes = [float(x) for x in data["x"]]
+            nakshatra, pada = (int(v) for v in data["k"])
+            moon = float(data["m"])
+        except (KeyError, TypeError, AttributeError) as e:
+            raise ValueError(f"malformed compact chart: {e}")
+        columns = len(CHART_COLUMNS)
+        if len(d1) != columns or len(d9) != columns or len(longitudes) != columns:
+            raise ValueError(f"compact chart needs {columns} columns")
+        if not all(0 <= s < 12 for s in d1 + d9) or not 0 <= nakshatra < 27 or not 1 <= pada <= 4:
+            raise ValueError("compact chart index out of range")
+        gender = data.get("g")
+        return cls(birth, longitudes, moon, d1, d9, nakshatra, pada), gender if isinstance(gender, str) else None
+
@@ -0,0 +1,131 @@
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from resilience import HTTP_POOL_SIZE, nominatim_calls, supabase_calls
+
+
+# --- Lazily Built External Clients ---
+# google.generativeai, supabase and geopy take most of the time it takes to
+# import main.py (well over a second together), and gunicorn starts
+# 2*cpu+1 workers, so they are imported and constructed on first use instead
+# of at import time. The app's lifespan can warm them up in the background, and
+# /health reports which ones are ready. A missing env var now fails the
+# requests that need that client (503) instead of crashing the worker.
+# Supabase and Nominatim each get one keep-alive connection pool shared by all
+# threads, with the timeouts from resilience.py; retries are left to resilience
+# (the libraries' own retries are turned off so attempts aren't multiplied).
+
+CLIENT_WARMUP = os.environ.get("CLIENT_WARMUP", "1") not in ("0", "false", "no")
+
+
+class ClientUnavailable(Exception):
+    pass
+
+
+class _Lazy:
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self.value = None
+        self.error: Optional[str] = None
+        self.seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self.value is not None:
+            return self.value
+        with self._lock:
+            if self.value is None:
+                started = time.perf_counter()
+                try:
+                    self.value = self.factory()
+                    self.error = None
+                except ClientUnavailable as e:
+                    self.error = str(e)
+                    raise
+                except Exception as e:
+                    self.error = f"{type(e).__name__}: {e}"
+                    raise ClientUnavailable(f"{self.name} client could not be created: {e}")
+                finally:
+                    self.seconds = round(time.perf_counter() - started, 4)
+        return self.value
+
+    def status(self) -> Dict[str, Any]:
+        state = "ready" if self.value is not None else ("error" if self.error else "cold")
+        status = {"state": state}
+        if self.seconds is not None:
+            status["init_seconds"] = self.seconds
+        if self.error:
+            status["error"] = self.error
+        return status
+
+
+class Clients:
+    def __init__(self, supabase_url: Optional[str], supabase_key: Optional[str], gemini_api_key: Optional[str],
+                 nominatim_domain: str, nominatim_scheme: str):
+        self.supabase_url, self.supabase_key = supabase_url, supabase_key
+        self.gemini_api_key = gemini_api_key
+        self.nominatim_domain, self.nominatim_scheme = nominatim_domain, nominatim_scheme
+        self._supabase = _Lazy("supabase", self._make_supabase)
+        self._genai = _Lazy("gemini", self._make_genai)
+        self._geolocator = _Lazy("geocoder", self._make_geolocator)
+        self._warmup: Optional[threading.Thread] = None
+
+    def _make_supabase(self):
+        if not self.supabase_url or not self.supabase_key:
+            raise ClientUnavailable("SUPABASE_URL and SUPABASE_SERVICE_KEY must be set")
+        import httpx
+        from supabase import ClientOptions, create_client
+        # One pooled client for auth and PostgREST instead of a connection per call
+        http = httpx.Client(timeout=supabase_calls.timeout, http2=False,
+                            limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE))
+        options = ClientOptions(httpx_client=http, postgrest_client_timeout=supabase_calls.timeout)
+        return create_client(self.supabase_url, self.supabase_key, options)
+
+    def _make_genai(self):
+        import google.generativeai as genai
+        if self.gemini_api_key:
+            genai.configure(api_key=self.gemini_api_key)
+        return genai
+
+    def _make_geolocator(self):
+        from functools import partial
+        from geopy.adapters import RequestsAdapter
+        from geopy.geocoders import Nominatim
+        adapter = partial(RequestsAdapter, pool_connections=1, pool_maxsize=HTTP_POOL_SIZE, max_retries=0)
+        return Nominatim(user_agent="daivaya_app_stable", domain=self.nominatim_domain, scheme=self.nominatim_scheme,
+                         timeout=nominatim_calls.timeout, adapter_factory=adapter)
+
+    # Accessors (all may block on first use, so call them from the I/O pool)
+    def supabase(self):
+        return self._supabase.get()
+
+    def genai(self):
+        return self._genai.get()
+
+    def geocode(self, *args, **kwargs):
+        return nominatim_calls.call(self._geolocator.get().geocode, *args, **kwargs)
+
+    def override(self, supabase=None, genai=None, geolocator=None):
+        """Install ready-made clients (benchmarks and local experiments)."""
+        for lazy, value in ((self._supabase, supabase), (self._genai, genai), (self._geolocator, geolocator)):
+            if value is not None:
+                lazy.value, lazy.error = value, None
+
+    def warm_up(self):
+        for lazy in (self._geolocator, self._supabase, self._genai):
+            try:
+                lazy.get()
+            except ClientUnavailable:
+                pass
+
+    def start_warm_up(self):
+        # Background thread: the worker starts serving while the imports finish
+        if self._warmup is None:
+            self._warmup = threading.Thread(target=self.warm_up, name="client-warmup", daemon=True)
+            self._warmup.start()
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {lazy.name: lazy.status() for lazy in (self._supabase, self._genai, self._geolocator)}
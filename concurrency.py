@@ -0,0 +1,70 @@
+import os
+import asyncio
+import functools
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+import swisseph as swe
+
+
+# --- Execution Pools ---
+# The endpoints are async, but geopy, supabase-py, google-generativeai and
+# swisseph are all synchronous. Blocking network calls go to a bounded thread
+# pool; chart math goes to its own pool so a burst of slow Nominatim/Supabase
+# responses can never starve the CPU work (or the other way round).
+#
+# CHART_POOL_KIND=thread keeps everything in one process (pyswisseph holds the
+# GIL, so this mostly just keeps the event loop free). CHART_POOL_KIND=process
+# gives real parallelism for chart-heavy traffic at the cost of a few extra
+# processes per Gunicorn worker.
+
+IO_POOL_SIZE = int(os.environ.get("IO_POOL_SIZE", "16"))
+CHART_POOL_KIND = os.environ.get("CHART_POOL_KIND", "thread").lower()
+CHART_POOL_SIZE = int(os.environ.get("CHART_POOL_SIZE", "2"))
+
+_io_pool: Optional[ThreadPoolExecutor] = None
+_chart_pool: Optional[Executor] = None
+
+
+def _init_chart_process():
+    # Sidereal mode is per-process state in the Swiss Ephemeris
+    swe.set_sid_mode(swe.SIDM_LAHIRI)
+
+
+def io_pool() -> ThreadPoolExecutor:
+    global _io_pool
+    if _io_pool is None:
+        _io_pool = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix="io")
+    return _io_pool
+
+
+def chart_pool() -> Executor:
+    global _chart_pool
+    if _chart_pool is None:
+        if CHART_POOL_KIND == "process":
+            _chart_pool = ProcessPoolExecutor(max_workers=CHART_POOL_SIZE, initializer=_init_chart_process)
+        else:
+            _chart_pool = ThreadPoolExecutor(max_workers=CHART_POOL_SIZE, thread_name_prefix="chart")
+    return _chart_pool
+
+
+async def run_io(fn: Callable, *args, **kwargs):
+    """Run a blocking network call (geocoding, Supabase, Gemini) off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_pool(), functools.partial(fn, *args, **kwargs))
+
+
+async def run_chart(fn: Callable, *args):
+    """Run CPU-bound chart math off the event loop. `fn` must be a picklable module-level function."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(chart_pool(), fn, *args)
+
+
+def shutdown_pools():
+    global _io_pool, _chart_pool
+    if _io_pool is not None:
+        _io_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool = None
+    if _chart_pool is not None:
+        _chart_pool.shutdown(wait=False, cancel_futures=True)
+        _chart_pool = None
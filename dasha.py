@@ -0,0 +1,172 @@
+import datetime
+from bisect import bisect_left
+from datetime import timedelta
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Union
+
+from ephemeris import NAKSHATRA_SPAN
+
+
+# --- Vimshottari Dasha Tree ---
+# Mahadasha -> antardasha -> pratyantardasha. Each level splits its parent in
+# the same 9-lord order (starting from the parent's own lord), in proportion
+# to the lords' years out of 120. Only the mahadashas are built up front;
+# a period's sub-periods are generated the first time something asks for them.
+# Every node keeps its children as a tuple of lord indices plus a sorted list
+# of boundaries, so finding the period that contains a date is one bisect per level.
+
+DASHA_YEARS = {'Ketu': 7, 'Venus': 20, 'Sun': 6, 'Moon': 10, 'Mars': 7, 'Rahu': 18, 'Jupiter': 16, 'Saturn': 19, 'Mercury': 17}
+DASHA_SEQUENCE = ['Ketu', 'Venus', 'Sun', 'Moon', 'Mars', 'Rahu', 'Jupiter', 'Saturn', 'Mercury']
+SOLAR_YEAR_IN_DAYS = 365.2425
+TOTAL_DASHA_YEARS = 120
+LEVEL_NAMES = ('mahadasha', 'antardasha', 'pratyantardasha')
+MAHADASHA_COUNT = len(DASHA_SEQUENCE) * 2
+
+DateLike = Union[datetime.date, datetime.datetime]
+
+
+class DashaPeriod(NamedTuple):
+    level: int      # 0 maha, 1 antar, 2 pratyantar
+    lord: str
+    start: datetime.datetime
+    end: datetime.datetime
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"level": LEVEL_NAMES[self.level], "lord": self.lord,
+                "start_date": self.start.date().isoformat(), "end_date": self.end.date().isoformat()}
+
+
+class _Node:
+    __slots__ = ('level', 'lord', 'full_start', 'full_days', 'start', 'end', 'lords', 'bounds', 'full_starts', 'children')
+
+    def __init__(self, level, lord, full_start, full_days, start, end):
+        self.level = level
+        self.lord = lord                # index into DASHA_SEQUENCE
+        self.full_start = full_start    # where the period would start if birth didn't cut it short
+        self.full_days = full_days
+        self.start = start              # actual start (the birth moment for the first branch)
+        self.end = end
+        self.lords = None               # children, filled in by _expand()
+        self.bounds = None              # len(lords) + 1 boundaries
+        self.full_starts = None
+        self.children = None
+
+    def period(self) -> DashaPeriod:
+        return DashaPeriod(self.level, DASHA_SEQUENCE[self.lord], self.start, self.end)
+
+
+def _day_start(day: DateLike) -> datetime.datetime:
+    if isinstance(day, datetime.datetime):
+        day = day.date()
+    return datetime.datetime.combine(day, datetime.time())
+
+
+class DashaTree:
+    def __init__(self, birth_datetime: datetime.datetime, moon_pos: float):
+        moon_pos = moon_pos % 360
+        nakshatra_num = int(moon_pos / NAKSHATRA_SPAN)
+        first_lord = nakshatra_num % len(DASHA_SEQUENCE)
+        moon_travelled_in_nakshatra = moon_pos % NAKSHATRA_SPAN
+        proportion_remaining = (NAKSHATRA_SPAN - moon_travelled_in_nakshatra) / NAKSHATRA_SPAN
+        first_days = DASHA_YEARS[DASHA_SEQUENCE[first_lord]] * SOLAR_YEAR_IN_DAYS
+        balance_in_days = proportion_remaining * first_days
+        self.birth = birth_datetime
+
+        # Mahadasha boundaries are accumulated step by step exactly as the old
+        # list-of-dicts version did, so their dates don't move
+        lords, full_starts = [first_lord], [birth_datetime - timedelta(days=first_days - balance_in_days)]
+        bounds = [birth_datetime, birth_datetime + timedelta(days=balance_in_days)]
+        for i in range(1, MAHADASHA_COUNT):
+            lord = (first_lord + i) % len(DASHA_SEQUENCE)
+            lords.append(lord)
+            full_starts.append(bounds[-1])
+            bounds.append(bounds[-1] + timedelta(days=DASHA_YEARS[DASHA_SEQUENCE[lord]] * SOLAR_YEAR_IN_DAYS))
+        self.root = _Node(-1, None, None, None, bounds[0], bounds[-1])
+        self.root.lords, self.root.bounds, self.root.full_starts = tuple(lords), bounds, full_starts
+        self.root.children = [None] * len(lords)
+
+    # --- Lazy expansion ---
+    def _expand(self, node: _Node):
+        lords, bounds, full_starts = [], [node.start], []
+        previous, cumulative = node.full_start, 0
+        for k in range(len(DASHA_SEQUENCE)):
+            lord = (node.lord + k) % len(DASHA_SEQUENCE)
+            cumulative += DASHA_YEARS[DASHA_SEQUENCE[lord]]
+            end = node.end if cumulative == TOTAL_DASHA_YEARS else node.full_start + timedelta(days=node.full_days * cumulative / TOTAL_DASHA_YEARS)
+            if end > node.start:
+                # Sub-periods that ended before birth are dropped, the one running at birth is clipped
+                lords.append(lord)
+                full_starts.append(previous)
+                bounds.append(min(end, node.end))
+            previous = end
+        node.lords, node.bounds, node.full_starts = tuple(lords), bounds, full_starts
+        node.children = [None] * len(lords)
+
+    def _child(self, node: _Node, i: int) -> _Node:
+        if node.children is None:
+            self._expand(node)
+        child = node.children[i]
+        if child is None:
+            lord = node.lords[i]
+            years = DASHA_YEARS[DASHA_SEQUENCE[lord]]
+            if node is self.root:
+                full_days = years * SOLAR_YEAR_IN_DAYS
+            else:
+                full_days = node.full_days * years / TOTAL_DASHA_YEARS
+            child = node.children[i] = _Node(node.level + 1, lord, node.full_starts[i], full_days, node.bounds[i], node.bounds[i + 1])
+        return child
+
+    def _index_on(self, node: _Node, day: datetime.date) -> Optional[int]:
+        # First period whose end date is on/after `day` - the same "start <= day <= end"
+        # rule the old linear scans used, so a boundary day belongs to the earlier period
+        if node.children is None:
+            self._expand(node)
+        i = bisect_left(node.bounds, _day_start(day), 1) - 1
+        if i >= len(node.lords) or node.bounds[i].date() > day:
+            return None
+        return i
+
+    # --- Queries ---
+    def mahadasha_count(self) -> int:
+        return len(self.root.lords)
+
+    def mahadasha(self, i: int) -> DashaPeriod:
+        return self._child(self.root, i).period()
+
+    def mahadasha_index_on(self, day: DateLike) -> Optional[int]:
+        return self._index_on(self.root, day.date() if isinstance(day, datetime.datetime) else day)
+
+    def path_on(self, day: DateLike, depth: int = 3) -> List[DashaPeriod]:
+        """Maha (/antar/pratyantar) periods running on `day`, outermost first. Empty outside the 120+ years covered."""
+        day = day.date() if isinstance(day, datetime.datetime) else day
+        path, node = [], self.root
+        for _ in range(depth):
+            i = self._index_on(node, day)
+            if i is None:
+                break
+            node = self._child(node, i)
+            path.append(node.period())
+        return path
+
+    def periods_between(self, start: DateLike, end: DateLike, depth: int = 2) -> Iterator[DashaPeriod]:
+        """Every period at `depth` (1 = mahadasha) overlapping the date range, in order."""
+        start = start.date() if isinstance(start, datetime.datetime) else start
+        end = end.date() if isinstance(end, datetime.datetime) else end
+        yield from self._walk(self.root, start, end, depth)
+
+    def _walk(self, node: _Node, start: datetime.date, end: datetime.date, depth: int) -> Iterator[DashaPeriod]:
+        if node.children is None:
+            self._expand(node)
+        i = bisect_left(node.bounds, _day_start(start), 1) - 1
+        while i < len(node.lords) and node.bounds[i].date() <= end:
+            child = self._child(node, i)
+            if child.level + 1 == depth:
+                yield child.period()
+            else:
+                yield from self._walk(child, start, end, depth)
+            i += 1
+
+    def mahadasha_sequence(self) -> List[Dict[str, Any]]:
+        # The original list-of-dicts shape, still returned by /prepare_porondam
+        bounds = self.root.bounds
+        return [{"lord": DASHA_SEQUENCE[lord], "start_date": bounds[i].date(), "end_date": bounds[i + 1].date()}
+                for i, lord in enumerate(self.root.lords)]
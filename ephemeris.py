@@ -0,0 +1,189 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+import swisseph as swe
+
+from vargas import varga_signs
+
+
+# --- Chart Ephemeris Engine ---
+# Everything calculate_astro_details needs from the Swiss Ephemeris for one
+# birth moment: each body is computed exactly once per Julian day and the
+# result is memoized, so the dasha balance, nakshatra and divisional charts
+# all reuse the same numbers. The arithmetic mirrors the original inline code
+# step for step so the output stays bit-for-bit identical.
+
+# This is a small adjustment value to align the library's Ayanamsa
+# with traditional calculations. You can fine-tune this value slightly
+# (e.g., -0.06, -0.07) if needed, but -0.05 is a strong starting point
+# to match your specific chart.
+TRADITIONAL_AYANAMSA_OFFSET = -0.05
+
+# Same order as PLANET_LIST in main.py; Ketu is derived from Rahu, never computed
+PLANET_ORDER = ('Sun', 'Moon', 'Mars', 'Mercury', 'Jupiter', 'Venus', 'Saturn', 'Rahu', 'Ketu')
+SWE_BODIES = (swe.SUN, swe.MOON, swe.MARS, swe.MERCURY, swe.JUPITER, swe.VENUS, swe.SATURN, swe.MEAN_NODE)
+# Column layout of longitude arrays: lagna first, then PLANET_ORDER
+CHART_COLUMNS = ('Lagna',) + PLANET_ORDER
+NAKSHATRA_SPAN = 13.333333333333333
+
+EPHEMERIS_CACHE_SIZE = int(os.environ.get("EPHEMERIS_CACHE_SIZE", "4096"))
+
+# Optional precomputed table of the slow movers (daily, 0h UT, 1900-2100).
+# Answers come from 4-point Lagrange interpolation, which typically agrees
+# with the Swiss Ephemeris to ~1e-8 degrees (worst case ~2e-4, where the
+# ephemeris itself has small seams) - close, but not bit-identical, so it is
+# opt-in via EPHEMERIS_TABLE_PATH. Build one with:
+#   python ephemeris.py build-table data/slow_planets.npy
+EPHEMERIS_TABLE_PATH = os.environ.get("EPHEMERIS_TABLE_PATH")
+TABLE_BODIES = ('Jupiter', 'Saturn', 'Rahu')
+TABLE_START_JD = 2415020.5   # 1900-01-01 00:00 UT
+TABLE_DAYS = 73051           # through 2100-01-01
+
+
+class ChartPositions(NamedTuple):
+    lagna: float                 # sidereal lagna, ayanamsa offset applied
+    planets: Tuple[float, ...]   # sidereal longitudes in PLANET_ORDER, offset applied
+    moon_sidereal: float         # raw Swiss Ephemeris Moon, as used for the dasha balance
+
+    def planet(self, name: str) -> float:
+        return self.planets[PLANET_ORDER.index(name)]
+
+    def as_dict(self):
+        return dict(zip(PLANET_ORDER, self.planets))
+
+    def as_row(self) -> Tuple[float, ...]:
+        return (self.lagna,) + self.planets
+
+
+class ChartIndices(NamedTuple):
+    d1: np.ndarray          # (N, 10) rasi index per CHART_COLUMNS
+    d9: np.ndarray          # (N, 10) navamsa rasi index per CHART_COLUMNS
+    nakshatra: np.ndarray   # (N,) Moon nakshatra number 0-26
+    pada: np.ndarray        # (N,) Moon nakshatra pada 1-4
+    vargas: Dict[str, np.ndarray]   # (N, 10) per requested divisional chart (see vargas.py)
+
+
+def derive_chart_indices(longitudes, vargas: Iterable[str] = ()) -> ChartIndices:
+    """Sign, navamsa, nakshatra and pada (plus any requested vargas) for N charts at once from an (N, 10) longitude array.
+
+    D1 and D9 come out of the varga tables identical to the int(pos / 30) and
+    int(((pos * 9) % 360) / 30) code they replace.
+    """
+    lon = np.asarray(longitudes, dtype=np.float64).reshape(-1, len(CHART_COLUMNS))
+    signs = varga_signs(lon, ("D1", "D9") + tuple(v for v in vargas if v not in ("D1", "D9")))
+    moon = lon[:, CHART_COLUMNS.index('Moon')]
+    nakshatra = (moon / NAKSHATRA_SPAN).astype(np.int64)
+    pada = ((moon - nakshatra * NAKSHATRA_SPAN) / (NAKSHATRA_SPAN / 4.0)).astype(np.int64) + 1
+    return ChartIndices(signs["D1"], signs["D9"], nakshatra, pada, {v: signs[v] for v in vargas})
+
+
+class SlowPlanetTable:
+    def __init__(self, path: str):
+        self.longitudes = np.load(path, mmap_mode="r")
+        if self.longitudes.shape != (TABLE_DAYS, len(TABLE_BODIES)):
+            raise ValueError(f"Unexpected ephemeris table shape {self.longitudes.shape} in {path}")
+
+    def covers(self, jd: float) -> bool:
+        return TABLE_START_JD + 1 <= jd < TABLE_START_JD + TABLE_DAYS - 2
+
+    def lookup(self, jd: float) -> Tuple[float, ...]:
+        x = jd - TABLE_START_JD
+        i = int(x) - 1
+        t = x - (i + 1)
+        window = np.unwrap(np.radians(self.longitudes[i:i + 4]), axis=0)
+        # 4-point Lagrange weights for nodes at -1, 0, 1, 2
+        w = np.array([
+            -t * (t - 1) * (t - 2) / 6.0,
+            (t + 1) * (t - 1) * (t - 2) / 2.0,
+            -(t + 1) * t * (t - 2) / 2.0,
+            (t + 1) * t * (t - 1) / 6.0,
+        ])
+        return tuple(float(v) % 360.0 for v in np.degrees(w @ window))
+
+
+def build_slow_planet_table(path: str):
+    bodies = [SWE_BODIES[PLANET_ORDER.index(name)] for name in TABLE_BODIES]
+    table = np.empty((TABLE_DAYS, len(bodies)), dtype="<f8")
+    for day in range(TABLE_DAYS):
+        jd = TABLE_START_JD + day
+        for col, body in enumerate(bodies):
+            table[day, col] = swe.calc_ut(jd, body, swe.FLG_SIDEREAL)[0][0]
+    np.save(path, table)
+
+
+class ChartEngine:
+    def __init__(self, cache_size: int = EPHEMERIS_CACHE_SIZE, table: Optional[SlowPlanetTable] = None):
+        self.cache_size = cache_size
+        self.table = table
+        self._cache: "OrderedDict[tuple, ChartPositions]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def positions(self, jd_utc: float, lat: float, lon: float) -> ChartPositions:
+        # Birth times have minute resolution, so 1e-7 days (~9ms) never merges two distinct births
+        key = (round(jd_utc, 7), lat, lon)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return cached
+        result = self._compute(jd_utc, lat, lon)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = result
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+    def _compute(self, jd_utc: float, lat: float, lon: float) -> ChartPositions:
+        houses, ascmc = swe.houses(jd_utc, lat, lon, b'P')
+        tropical_lagna_long = ascmc[0]
+
+        # --- CRITICAL FIX 1: Apply Ayanamsa Offset ---
+        ayanamsa_value = swe.get_ayanamsa_ut(jd_utc) + TRADITIONAL_AYANAMSA_OFFSET
+        lagna_long = (tropical_lagna_long - ayanamsa_value + 360) % 360
+
+        slow = None
+        if self.table is not None and self.table.covers(jd_utc):
+            slow = dict(zip(TABLE_BODIES, self.table.lookup(jd_utc)))
+
+        raw = []
+        for name, body in zip(PLANET_ORDER, SWE_BODIES):
+            if slow is not None and name in slow:
+                raw.append(slow[name])
+            else:
+                raw.append(swe.calc_ut(jd_utc, body, swe.FLG_SIDEREAL)[0][0])
+        # --- CRITICAL FIX 2: Ketu is exactly 180 degrees from Rahu ---
+        raw.append((raw[-1] + 180) % 360)
+
+        # Apply the Ayanamsa offset to all planets for consistency
+        planets = tuple((pos - TRADITIONAL_AYANAMSA_OFFSET + 360) % 360 for pos in raw)
+        moon_sidereal = raw[PLANET_ORDER.index('Moon')] % 360
+        return ChartPositions(lagna_long, planets, moon_sidereal)
+
+    def cache_info(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "max_size": self.cache_size}
+
+
+def _default_table() -> Optional[SlowPlanetTable]:
+    if EPHEMERIS_TABLE_PATH and os.path.exists(EPHEMERIS_TABLE_PATH):
+        return SlowPlanetTable(EPHEMERIS_TABLE_PATH)
+    return None
+
+
+engine = ChartEngine(table=_default_table())
+
+
+if __name__ == "__main__":
+    # python ephemeris.py build-table data/slow_planets.npy
+    if len(sys.argv) != 3 or sys.argv[1] != "build-table":
+        sys.exit("usage: python ephemeris.py build-table <output.npy>")
+    swe.set_sid_mode(swe.SIDM_LAHIRI)
+    build_slow_planet_table(sys.argv[2])
@@ -0,0 +1,47 @@
+import json
+from typing import Any, Optional
+
+from fastapi.responses import Response
+
+
+# --- Response Formats ---
+# Chart endpoints answer in one of three formats:
+#   full     the labelled JSON the web frontend uses (default)
+#   compact  short-key JSON of chart.Chart.compact(), no whitespace
+#   msgpack  the same compact payload as MessagePack
+# Clients pick one with ?format=... or an Accept header; ?format wins.
+# msgpack is imported on first use so workers that never see it don't pay for it.
+
+COMPACT_JSON_TYPE = "application/vnd.daivaya.chart+json"
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack", "application/vnd.msgpack")
+FORMATS = ("full", "compact", "msgpack")
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+def negotiate(format_param: Optional[str], accept: Optional[str]) -> str:
+    if format_param:
+        if format_param not in FORMATS:
+            raise UnsupportedFormat(f"Unknown format {format_param!r}; expected one of {', '.join(FORMATS)}.")
+        return format_param
+    if accept:
+        if any(t in accept for t in MSGPACK_TYPES):
+            return "msgpack"
+        if COMPACT_JSON_TYPE in accept:
+            return "compact"
+    return "full"
+
+
+def compact_response(payload: Any, fmt: str) -> Response:
+    if fmt == "msgpack":
+        try:
+            import msgpack
+        except ImportError:
+            raise UnsupportedFormat("msgpack responses are not available on this server.")
+        body, media_type = msgpack.packb(payload, use_bin_type=True), MSGPACK_TYPES[0]
+    else:
+        body, media_type = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), COMPACT_JSON_TYPE
+    # The same URL answers differently per Accept header
+    return Response(body, media_type=media_type, headers={"Vary": "Accept"})
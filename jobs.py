@@ -0,0 +1,357 @@
+import os
+import hmac
+import json
+import time
+import uuid
+import socket
+import asyncio
+import sqlite3
+import hashlib
+import ipaddress
+import threading
+import itertools
+import contextvars
+import urllib.request
+from urllib.parse import urlparse
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import metrics
+from concurrency import run_io
+
+
+# --- Background Reading Jobs ---
+# A Gemini reading can take minutes, and a synchronous /generate_reading or
+# /calculate_porondam holds its connection (and a slot of the Gunicorn worker)
+# the whole time. With ?job=true the endpoint returns 202 and a job ID right
+# away and the generation runs on a small in-process worker pool:
+#   * VIP users (profiles.is_vip) jump the queue; within a priority it's FIFO;
+#   * the queue is bounded (503 + Retry-After past JOB_QUEUE_MAX) and a user
+#     may have JOB_MAX_PER_USER unfinished jobs (429 past it);
+#   * status and results are written to SQLite, so any Gunicorn worker can
+#     answer GET /jobs/{id} (optionally long-polling with ?wait=) and results
+#     survive restarts until JOB_RESULT_TTL_SECONDS;
+#   * a job can also name an https webhook that gets the finished job POSTed,
+#     signed with JOB_WEBHOOK_SECRET when one is set. Webhooks are off unless
+#     JOB_WEBHOOK_HOSTS lists the hosts they may go to, and are only ever sent
+#     to public addresses, without following redirects: otherwise any user
+#     could make the server POST to internal services.
+# The queue itself is in memory: jobs still queued or running when their
+# worker process dies are reported as interrupted, not re-run.
+
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join(".cache", "jobs.sqlite3"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.environ.get("JOB_QUEUE_MAX", "200"))
+JOB_MAX_PER_USER = int(os.environ.get("JOB_MAX_PER_USER", "5"))
+JOB_TIMEOUT_SECONDS = float(os.environ.get("JOB_TIMEOUT_SECONDS", "300"))
+JOB_RESULT_TTL_SECONDS = int(os.environ.get("JOB_RESULT_TTL_SECONDS", str(7 * 24 * 3600)))
+JOB_WEBHOOK_SECRET = os.environ.get("JOB_WEBHOOK_SECRET")
+# Comma-separated hosts webhooks may go to (empty: webhooks are refused)
+JOB_WEBHOOK_HOSTS = {h.strip().lower() for h in os.environ.get("JOB_WEBHOOK_HOSTS", "").split(",") if h.strip()}
+WEBHOOK_ATTEMPTS = 3
+
+PRIORITY_VIP, PRIORITY_REGULAR = 0, 1
+FINISHED = ("done", "error")
+# Who owns a queued/running row: jobs whose process is gone are interrupted
+OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class QueueFull(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TooManyJobs(Exception):
+    pass
+
+
+class InvalidWebhook(Exception):
+    pass
+
+
+def validate_webhook(url: Optional[str]) -> Optional[str]:
+    if not url:
+        return None
+    if not JOB_WEBHOOK_HOSTS:
+        raise InvalidWebhook("Webhooks are not enabled on this server.")
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if parsed.scheme != "https":
+        raise InvalidWebhook("Webhook URLs must be https.")
+    if host not in JOB_WEBHOOK_HOSTS:
+        raise InvalidWebhook(f"Webhooks to {host or 'that URL'} are not allowed.")
+    return url
+
+
+def _check_public_address(host: str, port: int):
+    # Resolved again at delivery time, so an allowed name re-pointed at an internal address is still refused
+    for *_, sockaddr in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP):
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if not address.is_global:
+            # Private, loopback, link-local (cloud metadata at 169.254.169.254), reserved...
+            raise InvalidWebhook(f"Webhook host {host} resolves to a non-public address.")
+
+
+class _NoRedirects(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None  # urlopen then raises HTTPError for the 3xx
+
+
+_webhook_opener = urllib.request.build_opener(_NoRedirects)
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname():
+        return True  # another machine's worker; can't tell, assume it is fine
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except (ValueError, PermissionError):
+        pass
+    return True
+
+
+class JobStore:
+    def __init__(self, path: str = JOB_DB_PATH, ttl_seconds: int = JOB_RESULT_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        try:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+        except (OSError, sqlite3.Error):
+            # Read-only filesystem etc.: keep jobs in memory. Only this process then
+            # sees them, and results don't survive a restart
+            self._db = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, user_id TEXT, kind TEXT, priority INTEGER, status TEXT, owner TEXT,"
+            " webhook TEXT, result TEXT, error TEXT, created_at REAL, started_at REAL, finished_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_finished_at ON jobs (finished_at)")
+        self.purge()
+
+    def create(self, job_id: str, user_id: str, kind: str, priority: int, webhook: Optional[str],
+               result: Optional[Any] = None):
+        now = time.time()
+        status, finished_at = ("done", now) if result is not None else ("queued", None)
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, user_id, kind, priority, status, owner, webhook, result, created_at, finished_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, kind, priority, status, OWNER, webhook,
+                 json.dumps(result, ensure_ascii=False) if result is not None else None, now, finished_at),
+            )
+
+    def started(self, job_id: str):
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), job_id))
+
+    def finish(self, job_id: str, result: Optional[Any] = None, error: Optional[str] = None):
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                ("error" if error is not None else "done",
+                 json.dumps(result, ensure_ascii=False) if result is not None else None, error, time.time(), job_id),
+            )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cur = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+            job = dict(zip([c[0] for c in cur.description], row))
+        if job["status"] not in FINISHED and not _owner_alive(job["owner"]):
+            self.finish(job_id, error="The job was interrupted by a server restart. Please submit it again.")
+            return self.get(job_id)
+        return job
+
+    def purge(self) -> int:
+        with self._lock:
+            cur = self._db.execute("DELETE FROM jobs WHERE finished_at < ?", (time.time() - self.ttl_seconds,))
+            return cur.rowcount
+
+
+def public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    view = {"job_id": job["id"], "kind": job["kind"], "status": job["status"], "created_at": job["created_at"],
+            "started_at": job["started_at"], "finished_at": job["finished_at"]}
+    if job["status"] == "done":
+        view["result"] = json.loads(job["result"])
+    elif job["status"] == "error":
+        view["error"] = job["error"]
+    return view
+
+
+class JobQueue:
+    def __init__(self, store_path: str = JOB_DB_PATH, workers: int = JOB_WORKERS, max_queued: int = JOB_QUEUE_MAX,
+                 max_per_user: int = JOB_MAX_PER_USER, timeout: float = JOB_TIMEOUT_SECONDS):
+        self.store_path = store_path
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.timeout = timeout
+        self._store: Optional[JobStore] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._seq = itertools.count()
+        # Everything below is only touched from the event loop
+        self._done_events: Dict[str, asyncio.Event] = {}
+        self._unfinished: Dict[str, int] = {}
+        self._running = 0
+        self._recent_seconds: List[float] = []
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "webhooks_sent": 0, "webhooks_failed": 0}
+
+    @property
+    def store(self) -> JobStore:
+        if self._store is None:
+            self._store = JobStore(self.store_path)
+        return self._store
+
+    def _ensure_started(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            # Fresh context: the workers must not inherit the submitting request's metrics trace
+            self._tasks = contextvars.Context().run(lambda: [asyncio.ensure_future(self._work()) for _ in range(self.workers)])
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks, self._queue = [], None
+
+    def _reject(self, kind: str, error: Exception):
+        self.stats["rejected"] += 1
+        metrics.record_job(kind, "rejected")
+        raise error
+
+    def _retry_after(self) -> int:
+        # Rough wait for a slot: queue length times the recent mean job time, spread over the workers
+        mean = sum(self._recent_seconds) / len(self._recent_seconds) if self._recent_seconds else 30.0
+        return max(1, int(self._queue.qsize() * mean / max(self.workers, 1)))
+
+    async def submit(self, kind: str, user_id: str, vip: bool, run: Optional[Callable[[], Awaitable[Any]]] = None,
+                     webhook: Optional[str] = None, result: Optional[Any] = None) -> Dict[str, Any]:
+        """Queue run() (or record an already known result) and return the job's public view."""
+        webhook = validate_webhook(webhook)
+        self._ensure_started()
+        job_id = uuid.uuid4().hex
+        priority = PRIORITY_VIP if vip else PRIORITY_REGULAR
+        if result is None:
+            if self._queue.qsize() >= self.max_queued:
+                self._reject(kind, QueueFull("The reading queue is full. Please try again shortly.", self._retry_after()))
+            if self._unfinished.get(user_id, 0) >= self.max_per_user:
+                self._reject(kind, TooManyJobs(f"Too many readings in progress (limit {self.max_per_user}). Please wait for them to finish."))
+        await run_io(self.store.create, job_id, user_id, kind, priority, webhook, result)
+        self.stats["submitted"] += 1
+        metrics.record_job(kind, "submitted")
+        if result is not None:
+            await self._landed(job_id, kind, webhook)
+        else:
+            self._unfinished[user_id] = self._unfinished.get(user_id, 0) + 1
+            self._done_events[job_id] = asyncio.Event()
+            self._queue.put_nowait((priority, next(self._seq), job_id, kind, user_id, webhook, run))
+        if self.stats["submitted"] % 500 == 0:
+            await run_io(self.store.purge)
+        view = {"job_id": job_id, "kind": kind, "status": "done" if result is not None else "queued"}
+        if result is None:
+            view["queued_ahead"] = self._queue.qsize() - 1
+        return view
+
+    async def _work(self):
+        while True:
+            _, _, job_id, kind, user_id, webhook, run = await self._queue.get()
+            self._running += 1
+            started = time.perf_counter()
+            try:
+                await run_io(self.store.started, job_id)
+                result = await asyncio.wait_for(run(), self.timeout)
+                await run_io(self.store.finish, job_id, result)
+                outcome = "completed"
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    detail = "The reading took too long to generate. Please try again."
+                else:
+                    # HTTPException carries its message in .detail
+                    detail = str(getattr(e, "detail", None) or e)
+                await run_io(self.store.finish, job_id, None, detail)
+                outcome = "failed"
+            finally:
+                self._running -= 1
+                remaining = self._unfinished.get(user_id, 0) - 1
+                if remaining > 0:
+                    self._unfinished[user_id] = remaining
+                else:
+                    self._unfinished.pop(user_id, None)
+            seconds = time.perf_counter() - started
+            self._recent_seconds = (self._recent_seconds + [seconds])[-50:]
+            self.stats[outcome] += 1
+            metrics.record_job(kind, outcome)
+            metrics.observe_stage("job", seconds)
+            await self._landed(job_id, kind, webhook)
+
+    async def _landed(self, job_id: str, kind: str, webhook: Optional[str]):
+        event = self._done_events.pop(job_id, None)
+        if event is not None:
+            event.set()
+        if webhook:
+            # Not awaited: a slow receiver must not hold up the worker
+            asyncio.ensure_future(self._deliver(job_id, webhook))
+
+    async def _deliver(self, job_id: str, url: str):
+        job = await run_io(self.store.get, job_id)
+        body = json.dumps(public_view(job), ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json", "User-Agent": "daivaya-jobs"}
+        if JOB_WEBHOOK_SECRET:
+            headers["X-Daivaya-Signature"] = "sha256=" + hmac.new(JOB_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        for attempt in range(WEBHOOK_ATTEMPTS):
+            try:
+                await run_io(_post, url, body, headers)
+                self.stats["webhooks_sent"] += 1
+                return
+            except InvalidWebhook:
+                break
+            except Exception:
+                if attempt + 1 < WEBHOOK_ATTEMPTS:
+                    await asyncio.sleep(2 ** attempt)
+        self.stats["webhooks_failed"] += 1
+
+    async def get(self, job_id: str, user_id: str, wait: float = 0.0) -> Optional[Dict[str, Any]]:
+        """The job's public view (None if it isn't this user's), waiting up to `wait` seconds for it to finish."""
+        deadline = time.monotonic() + wait
+        while True:
+            job = await run_io(self.store.get, job_id)
+            if job is None or job["user_id"] != user_id:
+                return None
+            remaining = deadline - time.monotonic()
+            if job["status"] in FINISHED or remaining <= 0:
+                return public_view(job)
+            event = self._done_events.get(job_id)
+            if event is not None:
+                # Ours: wake up the moment it lands
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # Queued in another worker process: poll the shared store
+                await asyncio.sleep(min(0.5, remaining))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "queued": self._queue.qsize() if self._queue is not None else 0,
+                "running": self._running, "workers": self.workers}
+
+
+def _post(url: str, body: bytes, headers: Dict[str, str]):
+    parsed = urlparse(url)
+    _check_public_address(parsed.hostname, parsed.port or 443)
+    request = urllib.request.Request(url, data=body, headers=headers, method="POST")
+    with _webhook_opener.open(request, timeout=10) as response:
+        if response.status >= 300:
+            raise RuntimeError(f"webhook answered {response.status}")
@@ -1,21 +1,51 @@
 import os
 import datetime
-import pytz
 import swisseph as swe
-from fastapi import FastAPI, HTTPException, Header
+from fastapi import FastAPI, HTTPException, Header, Depends, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse, Response
+from pydantic import BaseModel, Field
 from typing import Dict, Any, List
-from geopy.geocoders import Nominatim
 from datetime import timedelta
 import json
 import re
-import google.generativeai as genai
-from supabase import create_client, Client
+import time
+from contextlib import asynccontextmanager
+from clients import Clients, ClientUnavailable, CLIENT_WARMUP
+from places import PlaceResolver, normalize_place_name
+from concurrency import run_io, run_chart, shutdown_pools
+from streaming import stream_generation, replay_text, event_stream_response
+from reading_cache import ReadingCache, canonical_json
+from auth import Authenticator, AuthError, bearer_token
+from singleflight import SingleFlight, FlightTimeout, TooManyFlights
+from prompts import PromptBuilder, ModelFactory, PromptTooLarge, log_call
+from jobs import JobQueue, QueueFull, TooManyJobs, InvalidWebhook
+from resilience import DependencyError, DependencyTimeout, DEPENDENCIES, gemini_calls, when_available
+from panchanga import DailyFeed, today as panchanga_today
+from dasha import DashaTree, DASHA_YEARS, DASHA_SEQUENCE, SOLAR_YEAR_IN_DAYS
+from chart import Chart, COMPACT_VERSION
+from vargas import VARGAS, parse_vargas
+from formats import negotiate, compact_response, UnsupportedFormat
+from transits import find_transits, daily_ephemeris
+from timezones import resolver as tz_resolver, jd_to_local, local_to_jd
+import metrics
+from metrics import span
+import porondam
+from ephemeris import engine as chart_engine, derive_chart_indices, PLANET_ORDER, CHART_COLUMNS, NAKSHATRA_SPAN
 
 
 # --- App Initialization ---
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Heavy clients are built on first use; warming them here just gets that out of the way early
+    if CLIENT_WARMUP:
+        clients.start_warm_up()
+    yield
+    await job_queue.stop()
+    shutdown_pools()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
 # List of allowed origins
 origins = [
     "https://www.daivaya.lk", # Your new custom domain (www)
@@ -33,20 +63,27 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-geolocator = Nominatim(user_agent="daivaya_app_stable")
+# Overridable so benchmarks can point geocoding at a local stand-in
+NOMINATIM_DOMAIN = os.environ.get("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+NOMINATIM_SCHEME = os.environ.get("NOMINATIM_SCHEME", "https")
 
 # --- Supabase Admin Client Initialization ---
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
-
-# --- Set Astrological Standard (Ayanamsa) Globally ---
-swe.set_sid_mode(swe.SIDM_LAHIRI)
 
 # --- Gemini API Configuration ---
 GEMINI_API_KEY = os.environ.get("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+
+# Supabase, Gemini and Nominatim clients are imported and built on first use (see clients.py)
+clients = Clients(SUPABASE_URL, SUPABASE_SERVICE_KEY, GEMINI_API_KEY, NOMINATIM_DOMAIN, NOMINATIM_SCHEME)
+# Gazetteer + persistent cache in front of Nominatim (see places.py)
+place_resolver = PlaceResolver(clients.geocode)
+
+# Local JWT verification + short-lived user/profile cache (see auth.py)
+authenticator = Authenticator(clients.supabase, SUPABASE_URL)
+
+# --- Set Astrological Standard (Ayanamsa) Globally ---
+swe.set_sid_mode(swe.SIDM_LAHIRI)
 
 # --- Pydantic Models for Data Validation ---
 class BirthData(BaseModel):
@@ -59,16 +96,48 @@ class PorondamRequest(BaseModel):
     person1: BirthData
     person2: BirthData
 
+class BatchChartRequest(BaseModel):
+    records: List[BirthData]
+
+class PorondamCandidate(BaseModel):
+    id: str
+    nakshatra: int = Field(ge=0, le=26)
+    rasi: int = Field(ge=0, le=11)
+    kuja_dosha: bool = False
+    gender: str | None = None
+
+class PorondamSearchRequest(BaseModel):
+    person: BirthData
+    top_k: int = Field(default=10, ge=1, le=500)
+    # Omit to search the server-side candidate index
+    candidates: List[PorondamCandidate] | None = None
+
+class DashaRequest(BaseModel):
+    person: BirthData
+    # Either a single day ("on", default today) or a range ("start" + "end"), all YYYY-MM-DD
+    on: str | None = None
+    start: str | None = None
+    end: str | None = None
+    # 1 = mahadasha, 2 = + antardasha, 3 = + pratyantardasha
+    depth: int = Field(default=3, ge=1, le=3)
+
+class TransitRequest(BaseModel):
+    # d1_chart (and optionally prompt_data) exactly as returned by /calculate_charts,
+    # or the compact chart from ?format=compact/msgpack as `chart`
+    d1_chart: Dict[str, Any] | None = None
+    prompt_data: Dict[str, Any] | None = None
+    chart: Dict[str, Any] | None = None
+    start: str | None = None    # YYYY-MM-DD, default today
+    end: str | None = None      # YYYY-MM-DD, default one year after start
+    planets: List[str] = ['Saturn', 'Jupiter', 'Rahu', 'Ketu']
+    nakshatra: bool = True
+
 # (Keep all your existing Sinhala Translation Maps & Astrological Constants here...)
 ZODIAC_SIGNS_SI = { "Aries": "මේෂ", "Taurus": "වෘෂභ", "Gemini": "මිථුන", "Cancer": "කටක", "Leo": "සිංහ", "Virgo": "කන්‍යා", "Libra": "තුලා", "Scorpio": "වෘශ්චික", "Sagittarius": "ධනු", "Capricorn": "මකර", "Aquarius": "කුම්භ", "Pisces": "මීන" }
 PLANET_SI = {'Ketu': 'කේතු', 'Venus': 'ශුක්‍ර', 'Sun': 'රවි', 'Moon': 'චන්ද්‍ර', 'Mars': 'කුජ', 'Rahu': 'රාහු', 'Jupiter': 'ගුරු', 'Saturn': 'ශනි', 'Mercury': 'බුධ'}
 ZODIAC_SIGNS_EN = [ "Aries", "Taurus", "Gemini", "Cancer", "Leo", "Virgo", "Libra", "Scorpio", "Sagittarius", "Capricorn", "Aquarius", "Pisces" ]
 PLANET_LIST = { 'Sun': swe.SUN, 'Moon': swe.MOON, 'Mars': swe.MARS, 'Mercury': swe.MERCURY, 'Jupiter': swe.JUPITER, 'Venus': swe.VENUS, 'Saturn': swe.SATURN, 'Rahu': swe.MEAN_NODE, 'Ketu': swe.TRUE_NODE }
 NAKSHATRA_LORDS = ['Ketu', 'Venus', 'Sun', 'Moon', 'Mars', 'Rahu', 'Jupiter', 'Saturn', 'Mercury']
-DASHA_YEARS = {'Ketu': 7, 'Venus': 20, 'Sun': 6, 'Moon': 10, 'Mars': 7, 'Rahu': 18, 'Jupiter': 16, 'Saturn': 19, 'Mercury': 17}
-DASHA_SEQUENCE = ['Ketu', 'Venus', 'Sun', 'Moon', 'Mars', 'Rahu', 'Jupiter', 'Saturn', 'Mercury']
-NAKSHATRA_SPAN = 13.333333333333333
-SOLAR_YEAR_IN_DAYS = 365.2425
 READING_COST = 100 # Define the cost of a reading
 PORONDAM_COST = 200
 PDF_COST = 20
@@ -80,29 +149,11 @@ NAKSHATRA_NAMES_SI = [
 
 # (Keep all your existing Core Astrology Calculation Logic functions here...)
 # calculate_vimshottari_dasha_sequence(), get_house_placements(), etc.
-def calculate_vimshottari_dasha_sequence(jd_utc: float, birth_datetime: datetime.datetime) -> List[Dict[str, Any]]:
-    moon_pos = swe.calc_ut(jd_utc, swe.MOON, swe.FLG_SIDEREAL)[0][0]
-    moon_pos = moon_pos % 360
-    nakshatra_num = int(moon_pos / NAKSHATRA_SPAN)
-    nakshatra_lord_index = nakshatra_num % len(NAKSHATRA_LORDS)
-    birth_dasha_lord = NAKSHATRA_LORDS[nakshatra_lord_index]
-    moon_travelled_in_nakshatra = moon_pos % NAKSHATRA_SPAN
-    proportion_remaining = (NAKSHATRA_SPAN - moon_travelled_in_nakshatra) / NAKSHATRA_SPAN
-    total_years_for_lord = DASHA_YEARS[birth_dasha_lord]
-    balance_in_days = proportion_remaining * total_years_for_lord * SOLAR_YEAR_IN_DAYS
-    first_dasha_end_date = birth_datetime + timedelta(days=balance_in_days)
-    dasha_periods = [{"lord": birth_dasha_lord, "start_date": birth_datetime.date(), "end_date": first_dasha_end_date.date()}]
-    current_end_date = first_dasha_end_date
-    start_lord_index = DASHA_SEQUENCE.index(birth_dasha_lord)
-    for i in range(1, len(DASHA_SEQUENCE) * 2):
-        next_lord_index = (start_lord_index + i) % len(DASHA_SEQUENCE)
-        next_lord = DASHA_SEQUENCE[next_lord_index]
-        duration_in_days = DASHA_YEARS[next_lord] * SOLAR_YEAR_IN_DAYS
-        start_date = current_end_date
-        end_date = start_date + timedelta(days=duration_in_days)
-        dasha_periods.append({"lord": next_lord, "start_date": start_date.date(), "end_date": end_date.date()})
-        current_end_date = end_date
-    return dasha_periods
+def calculate_vimshottari_dasha_sequence(jd_utc: float, birth_datetime: datetime.datetime, moon_pos: float | None = None) -> List[Dict[str, Any]]:
+    # Callers that already have the chart pass the Moon in; otherwise compute it here
+    if moon_pos is None:
+        moon_pos = swe.calc_ut(jd_utc, swe.MOON, swe.FLG_SIDEREAL)[0][0]
+    return DashaTree(birth_datetime, moon_pos).mahadasha_sequence()
 
 def get_house_placements(d1_data: Dict[str, Any]) -> List[Dict[str, Any]]:
     placements = []
@@ -118,69 +169,44 @@ def identify_special_yogas(d1_data: Dict[str, Any]) -> List[str]:
     yogas = []
     return yogas
 
-def calculate_astro_details(date_str, time_str, lat, lon):
-    # This is a small adjustment value to align the library's Ayanamsa
-    # with traditional calculations. You can fine-tune this value slightly
-    # (e.g., -0.06, -0.07) if needed, but -0.05 is a strong starting point
-    # to match your specific chart.
-    TRADITIONAL_AYANAMSA_OFFSET = -0.05 
-
+def parse_birth(date_str, time_str) -> datetime.datetime:
     year, month, day = map(int, date_str.split('-'))
     hour, minute = map(int, time_str.split(':'))
-    dt_local_naive = datetime.datetime(year, month, day, hour, minute)
-    sri_lanka_tz = pytz.timezone("Asia/Colombo")
-    dt_local_aware = sri_lanka_tz.localize(dt_local_naive)
-    dt_utc = dt_local_aware.astimezone(pytz.utc)
-    jd_utc, _ = swe.utc_to_jd(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour, dt_utc.minute, dt_utc.second, 1)
-    
+    return datetime.datetime(year, month, day, hour, minute)
+
+def birth_moment(date_str, time_str, lat=None, lon=None):
+    # Local time in the zone of the birth place (Asia/Colombo without coordinates), see timezones.py
+    dt_local_naive = parse_birth(date_str, time_str)
+    return dt_local_naive, tz_resolver.to_jd(dt_local_naive, lat, lon)
+
+def calculate_chart(date_str, time_str, lat, lon) -> Chart:
+    dt_local_naive, jd_utc = birth_moment(date_str, time_str, lat, lon)
+    # Lagna and all planets (Ayanamsa offset and Rahu/Ketu fix applied), memoized per JD/place
+    positions = chart_engine.positions(jd_utc, lat, lon)
+    idx = derive_chart_indices([positions.as_row()])
+    return Chart.from_positions(dt_local_naive, positions, idx.d1[0].tolist(), idx.d9[0].tolist(), int(idx.nakshatra[0]), int(idx.pada[0]))
+
+def assemble_astro_details(chart: Chart):
+    # The labelled (English/Sinhala) form of a chart; compact responses skip this entirely
+    dt_local_naive = chart.birth
+    nakshatra_num, nakshatra_pada = chart.nakshatra, chart.pada
     today = datetime.date.today()
     age = today.year - dt_local_naive.year - ((today.month, today.day) < (dt_local_naive.month, dt_local_naive.day))
 
-    houses, ascmc = swe.houses(jd_utc, lat, lon, b'P')
-    tropical_lagna_long = ascmc[0]
-    
-    # --- CRITICAL FIX 1: Apply Ayanamsa Offset ---
-    ayanamsa_value = swe.get_ayanamsa_ut(jd_utc) + TRADITIONAL_AYANAMSA_OFFSET
-    lagna_long = (tropical_lagna_long - ayanamsa_value + 360) % 360
-    
-    # --- CRITICAL FIX 2: Correct Rahu/Ketu Calculation ---
-    # First, calculate all planets EXCEPT Ketu.
-    d1_planets_raw = {name: swe.calc_ut(jd_utc, planet_id, swe.FLG_SIDEREAL)[0][0] for name, planet_id in PLANET_LIST.items() if name != 'Ketu'}
-    # Now, calculate Ketu to be exactly 180 degrees from Rahu.
-    d1_planets_raw['Ketu'] = (d1_planets_raw['Rahu'] + 180) % 360
-
-    # Apply the Ayanamsa offset to all planets for consistency
-    for planet in d1_planets_raw:
-        d1_planets_raw[planet] = (d1_planets_raw[planet] - TRADITIONAL_AYANAMSA_OFFSET + 360) % 360
-
-    # Now continue with the rest of the logic as before
-    d1_planets = {name: ZODIAC_SIGNS_EN[int(pos / 30)] for name, pos in d1_planets_raw.items()}
-    
-    d9_planets = {name: ZODIAC_SIGNS_EN[int(((pos * 9) % 360) / 30)] for name, pos in d1_planets_raw.items()}
+    d1_planets = {name: ZODIAC_SIGNS_EN[sign] for name, sign in zip(PLANET_ORDER, chart.d1[1:])}
+    d9_planets = {name: ZODIAC_SIGNS_EN[sign] for name, sign in zip(PLANET_ORDER, chart.d9[1:])}
 
-    d1_data = {"lagna": ZODIAC_SIGNS_EN[int(lagna_long / 30)], "planets": d1_planets}
-    d9_data = {"lagna": ZODIAC_SIGNS_EN[int(((lagna_long * 9) % 360) / 30)], "planets": d9_planets}
-    
-    dasha_sequence = calculate_vimshottari_dasha_sequence(jd_utc, dt_local_naive)
+    d1_data = {"lagna": ZODIAC_SIGNS_EN[chart.lagna], "planets": d1_planets}
+    d9_data = {"lagna": ZODIAC_SIGNS_EN[chart.d9[0]], "planets": d9_planets}
+
+    dasha_tree = chart.dasha_tree
 
-    # Nakshatra (Nakath) details based on Moon position
-    # The moon position for Nakshatra calculation should also be adjusted
-    moon_pos_for_nakshatra = d1_planets_raw['Moon']
-    nakshatra_num = int(moon_pos_for_nakshatra / NAKSHATRA_SPAN)
+    # Nakshatra (Nakath) details based on the (offset-adjusted) Moon position
     nakshatra_name_si = NAKSHATRA_NAMES_SI[nakshatra_num % len(NAKSHATRA_NAMES_SI)] if NAKSHATRA_NAMES_SI else ""
     nakshatra_lord_en = NAKSHATRA_LORDS[nakshatra_num % len(NAKSHATRA_LORDS)]
     nakshatra_lord_si = PLANET_SI[nakshatra_lord_en]
-    # Nakshatra pada (quarter)
-    pada_span = NAKSHATRA_SPAN / 4.0
-    pos_in_nakshatra = moon_pos_for_nakshatra - (nakshatra_num * NAKSHATRA_SPAN)
-    nakshatra_pada = int(pos_in_nakshatra / pada_span) + 1
     
-    current_dasha, next_dasha = None, None
-    for i, period in enumerate(dasha_sequence):
-        if period['start_date'] <= today <= period['end_date']:
-            current_dasha = period
-            if i + 1 < len(dasha_sequence): next_dasha = dasha_sequence[i+1]
-            break
+    current_dasha, current_antardasha, next_dasha = current_dashas(dasha_tree, today)
 
     astro_details_for_prompt = {
         "age": age,
@@ -189,37 +215,467 @@ def calculate_astro_details(date_str, time_str, lat, lon):
         "chandra_rasi": ZODIAC_SIGNS_SI[d1_planets['Moon']],
         "nakshatra": {"name": nakshatra_name_si, "lord": nakshatra_lord_si, "pada": nakshatra_pada},
         "dasha_info": {
-            "current_mahadasha": PLANET_SI[current_dasha['lord']] if current_dasha else "N/A",
-            "next_mahadasha": PLANET_SI[next_dasha['lord']] if next_dasha else "N/A",
-            "next_mahadasha_start_year": next_dasha['start_date'].year if next_dasha else "N/A"
+            "current_mahadasha": PLANET_SI[current_dasha.lord] if current_dasha else "N/A",
+            "current_antardasha": PLANET_SI[current_antardasha.lord] if current_antardasha else "N/A",
+            "current_antardasha_end": current_antardasha.end.strftime('%Y-%m-%d') if current_antardasha else "N/A",
+            "next_mahadasha": PLANET_SI[next_dasha.lord] if next_dasha else "N/A",
+            "next_mahadasha_start_year": next_dasha.start.year if next_dasha else "N/A"
         },
         "d1_chart_placements": get_house_placements(d1_data),
         "d9_chart_placements": [{"graha": PLANET_SI[p], "sign": ZODIAC_SIGNS_SI[s]} for p, s in d9_planets.items()],
         "special_yogas": identify_special_yogas(d1_data)
     }
     
-    return d1_data, d9_data, astro_details_for_prompt, dasha_sequence
+    return d1_data, d9_data, astro_details_for_prompt, dasha_tree
+
+def current_dashas(dasha_tree: DashaTree, day: datetime.date):
+    """(mahadasha, antardasha, next mahadasha) on `day`; any of them may be None."""
+    path = dasha_tree.path_on(day, depth=2)
+    current_dasha = path[0] if path else None
+    current_antardasha = path[1] if len(path) > 1 else None
+    next_dasha = None
+    i = dasha_tree.mahadasha_index_on(day)
+    if i is not None and i + 1 < dasha_tree.mahadasha_count():
+        next_dasha = dasha_tree.mahadasha(i + 1)
+    return current_dasha, current_antardasha, next_dasha
 
+def calculate_astro_details(date_str, time_str, lat, lon):
+    return assemble_astro_details(calculate_chart(date_str, time_str, lat, lon))
+
+def calculate_dasha(date_str, time_str, lat, lon, on=None, start=None, end=None, depth=3):
+    dt_local_naive, jd_utc = birth_moment(date_str, time_str, lat, lon)
+    positions = chart_engine.positions(jd_utc, lat, lon)
+    dasha_tree = DashaTree(dt_local_naive, positions.moon_sidereal)
+    if start is not None:
+        periods = dasha_tree.periods_between(start, end, depth)
+        return {"start": start.isoformat(), "end": end.isoformat(), "periods": [p.as_dict() for p in periods]}
+    on = on or datetime.date.today()
+    return {"on": on.isoformat(), "path": [p.as_dict() for p in dasha_tree.path_on(on, depth)]}
+
+TRANSIT_MAX_DAYS = int(os.environ.get("TRANSIT_MAX_DAYS", str(366 * 10)))
+
+def _local_midnight_jd(day: datetime.date) -> float:
+    # Windows are whole days on the same (Sri Lankan) clock the times are shown on
+    return local_to_jd(datetime.datetime.combine(day, datetime.time()), tz_resolver.default)
+
+def _jd_to_local(jd_utc: float) -> str:
+    # Transit times are shown on the default (Sri Lankan) clock
+    return jd_to_local(jd_utc, tz_resolver.default).strftime('%Y-%m-%d %H:%M')
+
+def calculate_transits(lagna_index, moon_index, birth_nakshatra, start, end, planets, nakshatras=True):
+    events = []
+    for event in find_transits(_local_midnight_jd(start), _local_midnight_jd(end), planets, nakshatras):
+        item = {
+            "planet": event.planet, "planet_si": PLANET_SI[event.planet], "type": event.kind,
+            "time": _jd_to_local(event.jd_utc), "retrograde": event.retrograde,
+        }
+        if event.kind == "sign":
+            item.update({
+                "from": ZODIAC_SIGNS_EN[event.from_index], "to": ZODIAC_SIGNS_EN[event.to_index],
+                "to_si": ZODIAC_SIGNS_SI[ZODIAC_SIGNS_EN[event.to_index]],
+                # Gochara is read from both the lagna and the Moon sign
+                "house_from_lagna": (event.to_index - lagna_index) % 12 + 1,
+                "house_from_moon": (event.to_index - moon_index) % 12 + 1,
+            })
+        else:
+            item.update({"from": NAKSHATRA_NAMES_SI[event.from_index], "to": NAKSHATRA_NAMES_SI[event.to_index]})
+            if birth_nakshatra is not None:
+                item["birth_nakshatra"] = event.to_index == birth_nakshatra
+        events.append(item)
+    return events
+
+def build_chart_response(d1_data, d9_data, astro_details_for_prompt, dasha_tree, gender=None):
+    birth_dasha = dasha_tree.mahadasha(0)
+    current_dasha, _, next_dasha = current_dashas(dasha_tree, datetime.date.today())
+    
+    ui_details = {
+        "ලග්නය": astro_details_for_prompt['lagna'],
+        "නවාංශක ලග්නය": astro_details_for_prompt['navamsa_lagna'],
+        "උපන් දශාව": f"{PLANET_SI[birth_dasha.lord]} ({birth_dasha.end.strftime('%Y-%m-%d')} දක්වා)",
+        "වත්මන් දශාව": f"{PLANET_SI[current_dasha.lord]} ({current_dasha.end.strftime('%Y-%m-%d')} දක්වා)" if current_dasha else "N/A",
+        "මීළඟ දශාව": f"{PLANET_SI[next_dasha.lord]} ({next_dasha.start.strftime('%Y-%m-%d')} සිට)" if next_dasha else "N/A"
+    }
+    
+    # Add gender to prompt data if provided
+    if gender:
+        astro_details_for_prompt["gender"] = gender
+
+    return {"d1_chart": d1_data, "d9_chart": d9_data, "astro_details": ui_details, "prompt_data": astro_details_for_prompt}
+
+def varga_charts(chart: Chart, names) -> Dict[str, Any]:
+    # Same shape as d1_chart/d9_chart, per requested divisional chart
+    charts = {}
+    for name, signs in chart.vargas(names).items():
+        charts[name] = {"title": VARGAS[name].title, "lagna": ZODIAC_SIGNS_EN[signs[0]],
+                        "planets": {planet: ZODIAC_SIGNS_EN[sign] for planet, sign in zip(PLANET_ORDER, signs[1:])}}
+    return charts
+
+def full_chart_response(chart: Chart, gender, vargas=()):
+    response = build_chart_response(*assemble_astro_details(chart), gender)
+    if vargas:
+        response["vargas"] = varga_charts(chart, vargas)
+    return response
+
+def chart_response(chart: Chart, gender, fmt: str, vargas=()):
+    if fmt == "full":
+        return full_chart_response(chart, gender, vargas)
+    try:
+        return compact_response(chart.compact(gender, vargas), fmt)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
+
+def chart_vector(chart: Chart) -> Dict[str, Any]:
+    # porondam_vector() straight from the sign indices
+    return {"nakshatra": chart.nakshatra, "rasi": chart.sign('Moon'),
+            "kuja_dosha": porondam.has_kuja_dosha(chart.lagna, chart.sign('Mars'))}
+
+def porondam_vector(d1_data: Dict[str, Any], astro_details_for_prompt: Dict[str, Any]) -> Dict[str, Any]:
+    # The compact form the porondam engine scores on
+    lagna_index = ZODIAC_SIGNS_EN.index(d1_data['lagna'])
+    return {
+        "nakshatra": NAKSHATRA_NAMES_SI.index(astro_details_for_prompt['nakshatra']['name']),
+        "rasi": ZODIAC_SIGNS_EN.index(d1_data['planets']['Moon']),
+        "kuja_dosha": porondam.has_kuja_dosha(lagna_index, ZODIAC_SIGNS_EN.index(d1_data['planets']['Mars'])),
+    }
+
+# --- Batch Charts ---
+BATCH_MAX_RECORDS = int(os.environ.get("BATCH_MAX_RECORDS", "5000"))
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "256"))
+
+def calculate_charts_chunk(items: List[tuple], compact: bool = False, vargas=()) -> List[Dict[str, Any]]:
+    """items: (date, time, lat, lon, gender) per birth. Same result shape as /calculate_charts (or its compact form), or {"error": ...}."""
+    parsed, moments, rows, results = [], [], [], [None] * len(items)
+    for i, (date_str, time_str, lat, lon, _) in enumerate(items):
+        try:
+            parsed.append((i, parse_birth(date_str, time_str)))
+        except ValueError as e:
+            results[i] = {"error": f"Invalid date or time: {e}"}
+    # One time-zone pass for the chunk: each distinct place is resolved once
+    jds = tz_resolver.to_jd_batch([(dt, items[i][2], items[i][3]) for i, dt in parsed])
+    for (i, dt_local_naive), jd_utc in zip(parsed, jds):
+        positions = chart_engine.positions(jd_utc, items[i][2], items[i][3])
+        moments.append((i, dt_local_naive, jd_utc, positions))
+        rows.append(positions.as_row())
+    if not rows:
+        return results
+
+    # One vectorized pass for every chart in the chunk, requested vargas included
+    idx = derive_chart_indices(rows, vargas)
+    d1_all, d9_all = idx.d1.tolist(), idx.d9.tolist()
+    nakshatras, padas = idx.nakshatra.tolist(), idx.pada.tolist()
+    vargas_all = {name: signs.tolist() for name, signs in idx.vargas.items()}
+    for row, (i, dt_local_naive, jd_utc, positions) in enumerate(moments):
+        chart = Chart.from_positions(dt_local_naive, positions, d1_all[row], d9_all[row], nakshatras[row], padas[row],
+                                     {name: signs[row] for name, signs in vargas_all.items()})
+        results[i] = chart.compact(items[i][4], vargas) if compact else full_chart_response(chart, items[i][4], vargas)
+    return results
+
+def calculate_charts_batch(records: List[BirthData], resolve=None, chunk_size: int = BATCH_CHUNK_SIZE, vargas=()):
+    """Library entry point: yields one result per record, in order, resolving each distinct place once."""
+    resolve = resolve or place_resolver.resolve
+    places: Dict[str, Any] = {}
+    for start in range(0, len(records), chunk_size):
+        chunk = records[start:start + chunk_size]
+        for record in chunk:
+            key = normalize_place_name(record.place)
+            if key not in places:
+                places[key] = resolve(record.place)
+        items, slots = _chunk_items(chunk, places)
+        yield from _merge_chunk(chunk, slots, calculate_charts_chunk(items, False, vargas) if items else [])
+
+def _chunk_items(chunk: List[BirthData], places: Dict[str, Any]):
+    # Plain tuples, so the chunk can be shipped to a process pool
+    items, slots = [], []
+    for record in chunk:
+        location = places.get(normalize_place_name(record.place))
+        if location:
+            slots.append(len(items))
+            items.append((record.date, record.time, location.latitude, location.longitude, record.gender))
+        else:
+            slots.append(None)
+    return items, slots
+
+def _merge_chunk(chunk: List[BirthData], slots: List[Any], computed: List[Dict[str, Any]], unavailable=None):
+    # unavailable: normalized place -> why it couldn't be looked up (geocoder down), as opposed to not found
+    for record, slot in zip(chunk, slots):
+        if slot is not None:
+            yield computed[slot]
+        elif unavailable and normalize_place_name(record.place) in unavailable:
+            yield {"error": unavailable[normalize_place_name(record.place)], "retryable": True}
+        else:
+            yield {"error": f"Could not find location: {record.place}"}
+
+
+# --- Prompts ---
+# Templates, token budget and the Gemini model per prompt live in prompts.py.
+# Their template versions key the reading cache, so changing the wording (or
+# PROMPT_STYLE) invalidates readings made with the old prompts.
+READING_MODEL = 'gemini-2.5-flash'
+PORONDAM_GENERATION_CONFIG = {"temperature": 0.22}
+
+prompt_builder = PromptBuilder()
+gemini_models = ModelFactory(clients.genai, READING_MODEL)
+reading_cache = ReadingCache(prompt_builder.template_versions())
+# Identical concurrent chart/reading requests share one computation (see singleflight.py)
+flights = SingleFlight()
+# ?job=true readings run in the background (see jobs.py)
+job_queue = JobQueue()
+
+def split_porondam_text(text: str):
+    # Parse the AI response to separate the score from the reading (robust)
+    score = ""
+    reading = text
+    # Try to extract score with regex (case-insensitive)
+    m = re.search(r"(?i)SCORE\s*:\s*([0-9]{1,2}\s*/\s*20)", text)
+    if m:
+        score = m.group(1).replace(" ", "")
+    # Try split on first --- for reading content
+    parts = text.split('\n---', 1)
+    if len(parts) == 2:
+        reading = parts[1].strip()
+    if not score:
+        # Last fallback: keep a label to ensure UI shows something
+        score = "0/20"
+    return score, reading
+
+
+# Candidates for one-to-many matchmaking (built with `python porondam.py build-index`)
+porondam_index = porondam.load_default_index()
+
+# --- Timed Stages (see metrics.py) ---
+async def resolve_place(place: str):
+    try:
+        with span("geocode"):
+            return await run_io(place_resolver.resolve, place)
+    except DependencyError as e:
+        raise dependency_unavailable(e)
+
+async def gemini_generate(model, contents):
+    # Timeout, retries and the breaker for the Gemini call (see resilience.py)
+    with span("gemini"):
+        return await run_io(gemini_calls.call, model.generate_content, contents,
+                            request_options={"timeout": gemini_calls.timeout})
+
+async def chart_details(date_str, time_str, lat, lon):
+    with span("ephemeris"):
+        return await run_chart(calculate_astro_details, date_str, time_str, lat, lon)
+
+async def compute_chart(date_str, time_str, lat, lon) -> Chart:
+    with span("ephemeris"):
+        return await run_chart(calculate_chart, date_str, time_str, lat, lon)
+
+def requested_vargas(text) -> tuple:
+    try:
+        return parse_vargas(text)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def response_format(format_param, accept) -> str:
+    try:
+        return negotiate(format_param, accept)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def chart_from_compact(data: Dict[str, Any]):
+    try:
+        return Chart.from_compact(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid compact chart: {e}")
+
+# --- External Services Failing (see resilience.py) ---
+def dependency_unavailable(e: DependencyError) -> HTTPException:
+    return HTTPException(status_code=504 if isinstance(e, DependencyTimeout) else 503, detail=str(e),
+                         headers={"Retry-After": str(e.retry_after or 5)})
+
+def gemini_breaker_open() -> bool:
+    return gemini_calls.breaker.is_open()
+
+def require_gemini():
+    # Streams can't be turned into a job, so with Gemini known to be down they get a 503 up front
+    if gemini_breaker_open():
+        raise dependency_unavailable(gemini_calls.unavailable())
+
+# --- Coalescing Identical Requests ---
+async def single_flight(kind: str, key: str, compute, user_id: str):
+    try:
+        return await flights.do(kind, key, compute, user_id)
+    except TooManyFlights as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except FlightTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except DependencyError as e:
+        raise dependency_unavailable(e)
+
+def shared_stream(kind: str, key: str, make_events, user_id: str):
+    try:
+        return flights.stream(kind, key, make_events, user_id)
+    except TooManyFlights as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+async def submit_job(kind: str, user_id: str, profile: Dict[str, Any], run=None, webhook: str | None = None, result=None,
+                     reason: str | None = None):
+    try:
+        job = await job_queue.submit(kind, user_id, bool(profile.get("is_vip")), run, webhook, result)
+    except InvalidWebhook as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except TooManyJobs as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    if reason:
+        # Asked for a synchronous answer but got a job: say why
+        job = {**job, "queued_because": reason}
+    return JSONResponse(job, status_code=202, headers={"Location": f"/jobs/{job['job_id']}"})
+
+def build_prompt(make, *prompt_data):
+    # Before any flight or stream is opened, so an oversized prompt is a plain 413
+    try:
+        with span("prompt"):
+            return make(*prompt_data)
+    except PromptTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+@metrics.register_collector
+def cache_metrics():
+    places = place_resolver.snapshot()
+    for result in ("gazetteer_hits", "cache_hits", "negative_hits", "stale_hits", "misses"):
+        yield ("horoscope_place_lookups_total", "counter", "Place lookups by how they were answered.", {"result": result}, places[result])
+    ephemeris_info = chart_engine.cache_info()
+    yield ("horoscope_ephemeris_cache_total", "counter", "Chart ephemeris cache lookups.", {"result": "hit"}, ephemeris_info["hits"])
+    yield ("horoscope_ephemeris_cache_total", "counter", "Chart ephemeris cache lookups.", {"result": "miss"}, ephemeris_info["misses"])
+    auth_stats = authenticator.snapshot()
+    for key in ("verified_locally", "verified_remotely", "user_cache_hits", "user_cache_misses", "profile_cache_hits",
+                "profile_cache_misses", "stale_profiles_served"):
+        yield ("horoscope_auth_events_total", "counter", "Token verification and auth cache events.", {"event": key}, auth_stats[key])
+    job_stats = job_queue.snapshot()
+    for state in ("queued", "running"):
+        yield ("horoscope_jobs_in_progress", "gauge", "Background reading jobs in this worker.", {"state": state}, job_stats[state])
+
+# --- Auth Dependencies ---
+async def current_user(token: str = Depends(bearer_token)) -> str:
+    # Verified tokens are cached, so the common case never leaves the event loop
+    user_id = authenticator.cached_user_id(token)
+    if user_id is not None:
+        return user_id
+    try:
+        with span("auth"):
+            return await run_io(authenticator.user_id, token)
+    except AuthError:
+        raise HTTPException(status_code=401, detail="Invalid or expired session. Please log in again.")
+    except ClientUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Authentication is unavailable: {str(e)}")
+    except DependencyError as e:
+        raise dependency_unavailable(e)
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+async def current_profile(user_id: str = Depends(current_user)) -> Dict[str, Any]:
+    try:
+        with span("profile"):
+            profile = await run_io(authenticator.profile, user_id)
+    except ClientUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Profiles are unavailable: {str(e)}")
+    except DependencyError as e:
+        raise dependency_unavailable(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+    if not profile:
+        raise HTTPException(status_code=404, detail="User profile not found.")
+    return profile
 
 # --- API Endpoints ---
+STARTED_AT = time.time()
+
+@app.get("/health")
+async def health():
+    # Liveness is answering at all; readiness is Supabase being configured and no client failing to build
+    status = clients.status()
+    ready = bool(SUPABASE_URL and SUPABASE_SERVICE_KEY) and all(c["state"] != "error" for c in status.values())
+    body = {"status": "ok" if ready else "unavailable", "uptime_seconds": round(time.time() - STARTED_AT, 1),
+            "gemini_configured": bool(GEMINI_API_KEY), "clients": status,
+            # Breakers and recent latency; an open breaker degrades features but doesn't make the worker unready
+            "dependencies": {d.name: d.snapshot() for d in DEPENDENCIES}}
+    return JSONResponse(body, status_code=200 if ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/chart_legend")
+async def chart_legend():
+    # What compact charts' indices mean, for clients that label them themselves
+    return JSONResponse({
+        "version": COMPACT_VERSION,
+        "columns": list(CHART_COLUMNS),
+        "signs": ZODIAC_SIGNS_EN,
+        "signs_si": [ZODIAC_SIGNS_SI[s] for s in ZODIAC_SIGNS_EN],
+        "planets": list(PLANET_ORDER),
+        "planets_si": [PLANET_SI[p] for p in PLANET_ORDER],
+        "nakshatras_si": NAKSHATRA_NAMES_SI,
+        "nakshatra_lords": [NAKSHATRA_LORDS[i % len(NAKSHATRA_LORDS)] for i in range(len(NAKSHATRA_NAMES_SI))],
+        "vargas": [{"name": v.name, "title": v.title, "parts": v.parts} for v in VARGAS.values()],
+    }, headers={"Cache-Control": "public, max-age=86400"})
+
+# Built ahead of time by `python panchanga.py build`; this endpoint only reads the files
+daily_feed = DailyFeed()
+
+@app.get("/daily")
+async def daily(date: str | None = None, if_none_match: str = Header(None)):
+    try:
+        day = datetime.date.fromisoformat(date) if date else panchanga_today()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD.")
+    artifact = await run_io(daily_feed.get, day)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail=f"The daily feed for {day.isoformat()} is not available yet.")
+    body, etag, with_readings = artifact
+    # Never immutable: `panchanga.py build --readings` (or --force) can rewrite any day, and
+    # the ETag makes revalidating cheap. Short-lived while a day may still gain its readings
+    max_age = "86400" if day < panchanga_today() and with_readings else "300"
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if if_none_match and etag in [t.strip() for t in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.get("/cache_stats")
+async def cache_stats():
+    return {"places": place_resolver.snapshot(), "readings": await run_io(reading_cache.snapshot), "auth": authenticator.snapshot(),
+            "transit_ephemeris": daily_ephemeris.cache_info(), "single_flight": flights.snapshot(),
+            "timezones": tz_resolver.snapshot(), "jobs": job_queue.snapshot(),
+            "daily": daily_feed.snapshot(),
+            "prompts": {"style": prompt_builder.style, "versions": prompt_builder.template_versions(),
+                        "context_cache": gemini_models.context_cache, "context_cache_error": gemini_models.context_error}}
+
 @app.post("/prepare_porondam")
-async def prepare_porondam_endpoint(data: PorondamRequest):
+async def prepare_porondam_endpoint(data: PorondamRequest, format_param: str | None = Query(None, alias="format"),
+                                    accept: str = Header(None)):
+    fmt = response_format(format_param, accept)
     try:
         # Person 1
-        location1 = geolocator.geocode(data.person1.place)
+        location1 = await resolve_place(data.person1.place)
         if not location1:
             raise HTTPException(status_code=400, detail=f"Could not find location for Person 1: {data.person1.place}")
-        d1_p1, d9_p1, prompt_p1, dasha_p1 = calculate_astro_details(data.person1.date, data.person1.time, location1.latitude, location1.longitude)
+        chart_p1 = await compute_chart(data.person1.date, data.person1.time, location1.latitude, location1.longitude)
 
         # Person 2
-        location2 = geolocator.geocode(data.person2.place)
+        location2 = await resolve_place(data.person2.place)
         if not location2:
             raise HTTPException(status_code=400, detail=f"Could not find location for Person 2: {data.person2.place}")
-        d1_p2, d9_p2, prompt_p2, dasha_p2 = calculate_astro_details(data.person2.date, data.person2.time, location2.latitude, location2.longitude)
+        chart_p2 = await compute_chart(data.person2.date, data.person2.time, location2.latitude, location2.longitude)
 
+        if fmt != "full":
+            try:
+                return compact_response({"person1": chart_p1.compact(data.person1.gender), "person2": chart_p2.compact(data.person2.gender)}, fmt)
+            except UnsupportedFormat as e:
+                raise HTTPException(status_code=406, detail=str(e))
+
+        d1_p1, d9_p1, prompt_p1, dasha_p1 = assemble_astro_details(chart_p1)
+        d1_p2, d9_p2, prompt_p2, dasha_p2 = assemble_astro_details(chart_p2)
         return {
-            "person1": {"d1": d1_p1, "d9": d9_p1, "details": prompt_p1, "dasha": dasha_p1},
-            "person2": {"d1": d1_p2, "d9": d9_p2, "details": prompt_p2, "dasha": dasha_p2}
+            "person1": {"d1": d1_p1, "d9": d9_p1, "details": prompt_p1, "dasha": dasha_p1.mahadasha_sequence()},
+            "person2": {"d1": d1_p2, "d9": d9_p2, "details": prompt_p2, "dasha": dasha_p2.mahadasha_sequence()}
         }
     except Exception as e:
         if isinstance(e, HTTPException):
@@ -227,48 +683,26 @@ async def prepare_porondam_endpoint(data: PorondamRequest):
         raise HTTPException(status_code=500, detail=f"An error occurred while preparing porondam: {str(e)}")
 
 @app.post("/calculate_charts")
-async def calculate_charts_endpoint(data: BirthData, authorization: str = Header(None)):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid authentication token.")
-    
-    token = authorization.split("Bearer ")[1]
-    
-    try:
-        # 1. Authenticate user (charts are free; no credit check here)
-        user_response = supabase.auth.get_user(token)
-        _ = user_response.user.id
-
-        # 2. Proceed with horoscope calculation (FREE)
-        location = geolocator.geocode(data.place)
+async def calculate_charts_endpoint(data: BirthData, format_param: str | None = Query(None, alias="format"),
+                                    vargas: str | None = None,
+                                    accept: str = Header(None), user_id: str = Depends(current_user)):
+    # Charts are free; authentication only, no credit check here
+    fmt = response_format(format_param, accept)
+    # ?vargas=D10,D60 (or "all") adds those divisional charts; computed only when asked for
+    varga_names = requested_vargas(vargas)
+
+    async def compute():
+        location = await resolve_place(data.place)
         if not location:
             raise HTTPException(status_code=400, detail="Could not find location.")
-            
-        d1_data, d9_data, astro_details_for_prompt, dasha_sequence = calculate_astro_details(data.date, data.time, location.latitude, location.longitude)
-        
-        # (The rest of the function remains the same as before)
-        birth_dasha = dasha_sequence[0]
-        today = datetime.date.today()
-        current_dasha, next_dasha = None, None
-        for i, period in enumerate(dasha_sequence):
-            if period['start_date'] <= today <= period['end_date']:
-                current_dasha = period
-                if i + 1 < len(dasha_sequence):
-                    next_dasha = dasha_sequence[i + 1]
-                break
-        
-        ui_details = {
-            "ලග්නය": astro_details_for_prompt['lagna'],
-            "නවාංශක ලග්නය": astro_details_for_prompt['navamsa_lagna'],
-            "උපන් දශාව": f"{PLANET_SI[birth_dasha['lord']]} ({birth_dasha['end_date'].strftime('%Y-%m-%d')} දක්වා)",
-            "වත්මන් දශාව": f"{PLANET_SI[current_dasha['lord']]} ({current_dasha['end_date'].strftime('%Y-%m-%d')} දක්වා)" if current_dasha else "N/A",
-            "මීළඟ දශාව": f"{PLANET_SI[next_dasha['lord']]} ({next_dasha['start_date'].strftime('%Y-%m-%d')} සිට)" if next_dasha else "N/A"
-        }
-        
-        # Add gender to prompt data if provided
-        if data.gender:
-            astro_details_for_prompt["gender"] = data.gender
+        return await compute_chart(data.date, data.time, location.latitude, location.longitude)
 
-        return {"d1_chart": d1_data, "d9_chart": d9_data, "astro_details": ui_details, "prompt_data": astro_details_for_prompt}
+    try:
+        # Double clicks and retries of the same birth share one geocode and one chart
+        key = canonical_json([data.date, data.time, normalize_place_name(data.place)])
+        chart = await single_flight("charts", key, compute, user_id)
+        # Labels (or the compact encoding) are applied per request, after the shared part
+        return chart_response(chart, data.gender, fmt, varga_names)
 
     except Exception as e:
         # More specific error handling
@@ -276,29 +710,52 @@ async def calculate_charts_endpoint(data: BirthData, authorization: str = Header
             raise e # Re-raise FastAPI's exceptions
         import traceback
         print(traceback.format_exc())
-        # Check for specific Supabase auth error
-        if "Invalid JWT" in str(e) or "Auth session missing" in str(e):
-            raise HTTPException(status_code=401, detail="Invalid or expired session. Please log in again.")
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 
-@app.post("/calculate_porondam")
-async def calculate_porondam_endpoint(data: PorondamRequest, authorization: str = Header(None)):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid authentication token.")
-    
-    token = authorization.split("Bearer ")[1]
-
-    try:
-        # 1. Authenticate user and get their profile
-        user_response = supabase.auth.get_user(token)
-        user_id = user_response.user.id
-        profile_response = supabase.table('profiles').select('credits', 'is_vip').eq('id', user_id).single().execute()
-        profile = profile_response.data
+@app.post("/calculate_charts/batch")
+async def calculate_charts_batch_endpoint(data: BatchChartRequest, format_param: str | None = Query(None, alias="format"),
+                                          vargas: str | None = None, user_id: str = Depends(current_user)):
+    # Authenticated once for the whole batch
+    fmt = response_format(format_param, None)
+    varga_names = requested_vargas(vargas)
+    if fmt == "msgpack":
+        raise HTTPException(status_code=400, detail="Batch results are NDJSON; use format=compact for compact lines.")
+    if len(data.records) > BATCH_MAX_RECORDS:
+        raise HTTPException(status_code=413, detail=f"Too many records; the limit is {BATCH_MAX_RECORDS} per request.")
+
+    async def ndjson_lines():
+        # One chunk in flight at a time keeps memory flat for large uploads
+        places: Dict[str, Any] = {}
+        unavailable: Dict[str, str] = {}
+        records = data.records
+        separators = (",", ":") if fmt == "compact" else None
+        for start in range(0, len(records), BATCH_CHUNK_SIZE):
+            chunk = records[start:start + BATCH_CHUNK_SIZE]
+            for record in chunk:
+                key = normalize_place_name(record.place)
+                if key not in places:
+                    try:
+                        places[key] = await resolve_place(record.place)
+                    except HTTPException as e:
+                        # Nominatim down or its breaker open: the line says so instead of "not found".
+                        # Remembered for the rest of the batch, so an outage isn't hit once per place
+                        places[key], unavailable[key] = None, e.detail
+            items, slots = _chunk_items(chunk, places)
+            with span("ephemeris"):
+                computed = await run_chart(calculate_charts_chunk, items, fmt == "compact", varga_names) if items else []
+            for offset, result in enumerate(_merge_chunk(chunk, slots, computed, unavailable)):
+                yield json.dumps({"index": start + offset, **result}, ensure_ascii=False, default=str, separators=separators) + "\n"
+
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
 
-        if not profile:
-            raise HTTPException(status_code=404, detail="User profile not found.")
 
+@app.post("/calculate_porondam")
+async def calculate_porondam_endpoint(data: PorondamRequest, stream: bool = False, job: bool = False, webhook: str | None = None,
+                                      accept: str = Header(None),
+                                      user_id: str = Depends(current_user), profile: Dict[str, Any] = Depends(current_profile)):
+    # 1. User and profile come from the auth dependencies
+    try:
         # 2. Check for VIP status or sufficient credits
         # is_vip = profile.get('is_vip', False)
         # user_credits = profile.get('credits', 0)
@@ -308,203 +765,286 @@ async def calculate_porondam_endpoint(data: PorondamRequest, authorization: str
 
         # 3. Calculate astrological details for both people
         # Person 1
-        location1 = geolocator.geocode(data.person1.place)
+        location1 = await resolve_place(data.person1.place)
         if not location1: raise HTTPException(status_code=400, detail=f"Could not find location for Person 1: {data.person1.place}")
-        d1_p1, d9_p1, prompt_p1, _ = calculate_astro_details(data.person1.date, data.person1.time, location1.latitude, location1.longitude)
+        d1_p1, d9_p1, prompt_p1, _ = await chart_details(data.person1.date, data.person1.time, location1.latitude, location1.longitude)
 
         # Person 2
-        location2 = geolocator.geocode(data.person2.place)
+        location2 = await resolve_place(data.person2.place)
         if not location2: raise HTTPException(status_code=400, detail=f"Could not find location for Person 2: {data.person2.place}")
-        d1_p2, d9_p2, prompt_p2, _ = calculate_astro_details(data.person2.date, data.person2.time, location2.latitude, location2.longitude)
+        d1_p2, d9_p2, prompt_p2, _ = await chart_details(data.person2.date, data.person2.time, location2.latitude, location2.longitude)
         
         # 4. Generate the AI reading (deduct AFTER success)
         if not GEMINI_API_KEY: raise HTTPException(status_code=500, detail="GEMINI_API_KEY is not configured.")
         
-        model = genai.GenerativeModel('gemini-2.5-flash', generation_config={"temperature": 0.22})
-        
-        prompt = f"""
-        You are 'Daivaya Guru', an expert Vedic Astrologer from Sri Lanka specializing in Porondam (marriage compatibility). Your tone must be formal, wise, and deeply insightful. The entire response must be in the SINHALA language.
-
-        **CRITICAL ANALYSIS & FORMATTING RULES:**
-        1.  **START WITH THE SCORE:** The VERY FIRST LINE of your response MUST be the compatibility score in the format `SCORE: X/20`. Base this on the 20 core "Wisi Porondam".
-        2.  **SEPARATOR:** After the score, you MUST include a line with only `---`.
-        3.  **DETAILED BREAKDOWN (Wisi Porondam):** After the separator, provide a detailed, paragraph-by-paragraph analysis for each of the **20 main Porondam ('Wisi Porondam')**. You must cover the 10 core Dasa Porondam first, and then the remaining 10 sub-porondams. For each one, you MUST state if it matches ('ගැලපේ') or does not match ('නොගැලපේ') and then explain *why* based on the provided astrological data.
-        4.  **SYNTHESIZE, DON'T JUST LIST:** Explain what each match (or mismatch) means for the relationship in practical terms (e.g., harmony, prosperity, health, longevity, children).
-        5.  **BOLD KEY TERMS:** Use markdown `**` for emphasis on key terms.
-        6.  **CONCLUDING SUMMARY:** End with a final summary paragraph that gives an overall, balanced recommendation based on the score and the nature of the matches. Be encouraging but realistic.
-        
-        GENERATE THE REPORT NOW using this exact structure for all 20 Porondams:
-
-        නැකැත් පොරොන්දම
-        ගණ පොරොන්දම
-        මහේන්ද්‍ර පොරොන්දම
-        ස්ත්‍රී දීර්ඝ පොරොන්දම
-        යෝනි පොරොන්දම
-        රාශි පොරොන්දම
-        රාශ්‍යාධිපති පොරොන්දම
-        වශ්‍ය පොරොන්දම
-        රජ්ජු පොරොන්දම
-        වේධ පොරොන්දම
-        වෘක්ෂ පොරොන්දම
-        ආයුෂ පොරොන්දම
-        පක්ෂි පොරොන්දම
-        භූත පොරොන්දම
-        ගෝත්‍ර පොරොන්දම
-        වර්ණ පොරොන්දම
-        ලිංග පොරොන්දම
-        නාඩි පොරොන්දම
-        දින පොරොන්දම
-        ග්‍රහ පොරොන්දම (කුජ දෝෂය)
-
-        **Astrological Data for Person 1 (e.g., Bride):**
-        {json.dumps(prompt_p1, indent=2, ensure_ascii=False)}
-
-        **Astrological Data for Person 2 (e.g., Groom):**
-        {json.dumps(prompt_p2, indent=2, ensure_ascii=False)}
-
-        ---
-        **GENERATE THE REPORT NOW**
-        """
-        
-        response = model.generate_content(prompt)
-        
-        # Parse the AI response to separate the score from the reading (robust)
-        text = response.text or ""
-        score = ""
-        reading = text
-        # Try to extract score with regex (case-insensitive)
-        m = re.search(r"(?i)SCORE\s*:\s*([0-9]{1,2}\s*/\s*20)", text)
-        if m:
-            score = m.group(1).replace(" ", "")
-        # Try split on first --- for reading content
-        parts = text.split('\n---', 1)
-        if len(parts) == 2:
-            reading = parts[1].strip()
-        if not score:
-            # Last fallback: keep a label to ensure UI shows something
-            score = "0/20"
+        model_key = READING_MODEL + canonical_json(PORONDAM_GENERATION_CONFIG)
+        # Ordered: the prompt reads person1 as the bride and person2 as the groom, so a swapped pair is another reading
+        cache_key = reading_cache.key("porondam", model_key, prompt_p1, prompt_p2)
+        cached_text = await run_io(reading_cache.get, cache_key)
+        metrics.record_cache("reading", cached_text is not None)
+
+        def remember(text, seconds):
+            reading_cache.put(cache_key, "porondam", model_key, text, seconds)
+
+        if cached_text is None:
+            prompt = build_prompt(prompt_builder.porondam, prompt_p1, prompt_p2)
+
+        async def generation_events():
+            model = await run_io(gemini_models.model, prompt, PORONDAM_GENERATION_CONFIG)
+            async for event in stream_generation(model, prompt.contents, expect_score=True, on_complete=remember,
+                                                 kind="porondam", on_usage=lambda chunk, seconds: log_call(prompt, chunk, seconds)):
+                yield event
+
+        async def generate():
+            model = await run_io(gemini_models.model, prompt, PORONDAM_GENERATION_CONFIG)
+            started = time.perf_counter()
+            response = await gemini_generate(model, prompt.contents)
+            metrics.record_gemini_usage(response, "porondam")
+            log_call(prompt, response, time.perf_counter() - started)
+            text = response.text or ""
+            await run_io(remember, text, time.perf_counter() - started)
+            return text
+
+        def porondam_result(text):
+            score, reading = split_porondam_text(text)
+            return {
+                "score": score,
+                "reading": reading,
+                "person1_charts": {"d1": d1_p1, "d9": d9_p1},
+                "person2_charts": {"d1": d1_p2, "d9": d9_p2}
+            }
+
+        async def run_job():
+            # Queued while Gemini's breaker is open: start once it lets a call through again
+            return porondam_result(await when_available(gemini_calls, lambda: flights.do("porondam", cache_key, generate)))
+
+        if job:
+            # 202 with a job ID now; the result is fetched from /jobs/{id} (or delivered to the webhook)
+            if cached_text is not None:
+                return await submit_job("porondam", user_id, profile, webhook=webhook, result=porondam_result(cached_text))
+            return await submit_job("porondam", user_id, profile, run_job, webhook)
+
+        if stream:
+            if cached_text is not None:
+                events = replay_text(cached_text, expect_score=True)
+            else:
+                require_gemini()
+                # Opened before responding, so a 429 is still a proper status code
+                events = shared_stream("porondam", cache_key, generation_events, user_id)
+
+            # Charts go out first so the UI can draw them while the reading is generated
+            async def porondam_events():
+                yield {"type": "charts", "person1_charts": {"d1": d1_p1, "d9": d9_p1}, "person2_charts": {"d1": d1_p2, "d9": d9_p2}}
+                async for event in events:
+                    yield event
+            return event_stream_response(porondam_events(), accept)
+
+        if cached_text is not None:
+            text = cached_text
+        elif gemini_breaker_open():
+            return await submit_job("porondam", user_id, profile, run_job, webhook, reason=str(gemini_calls.unavailable()))
+        else:
+            text = await single_flight("porondam", cache_key, generate, user_id)
 
         # 5. Deduct credits only after successful generation
         # if not is_vip:
             # new_credits = user_credits - PORONDAM_COST
             # supabase.table('profiles').update({'credits': new_credits}).eq('id', user_id).execute()
+            # authenticator.forget_profile(user_id)
 
         # 6. Return all data to the frontend
+        return porondam_result(text)
+
+    except Exception as e:
+        if isinstance(e, HTTPException): raise e
+        import traceback
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+@app.post("/porondam/search")
+async def porondam_search_endpoint(data: PorondamSearchRequest, user_id: str = Depends(current_user)):
+    gender = (data.person.gender or "").lower()
+    if gender not in ("female", "male"):
+        raise HTTPException(status_code=400, detail="Gender ('female' or 'male') is required for porondam matching.")
+
+    try:
+        location = await resolve_place(data.person.place)
+        if not location:
+            raise HTTPException(status_code=400, detail="Could not find location.")
+        vector = chart_vector(await compute_chart(data.person.date, data.person.time, location.latitude, location.longitude))
+
+        if data.candidates is not None:
+            index = porondam.CandidateIndex()
+            index.extend(c.model_dump() for c in data.candidates)
+        else:
+            index = porondam_index
+        started = time.perf_counter()
+        matches = index.search(vector["nakshatra"], vector["rasi"], vector["kuja_dosha"], gender == "female", data.top_k)
         return {
-            "score": score,
-            "reading": reading,
-            "person1_charts": {"d1": d1_p1, "d9": d9_p1},
-            "person2_charts": {"d1": d1_p2, "d9": d9_p2}
+            "person": vector,
+            "matches": matches,
+            "searched": len(index),
+            "search_ms": round((time.perf_counter() - started) * 1000, 3),
         }
+    except Exception as e:
+        if isinstance(e, HTTPException): raise e
+        import traceback
+        print(traceback.format_exc())
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+@app.post("/dasha")
+async def dasha_endpoint(data: DashaRequest, user_id: str = Depends(current_user)):
+    try:
+        on = datetime.date.fromisoformat(data.on) if data.on else None
+        start = datetime.date.fromisoformat(data.start) if data.start else None
+        end = datetime.date.fromisoformat(data.end) if data.end else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be in YYYY-MM-DD format.")
+    if (start is None) != (end is None) or (start is not None and on is not None):
+        raise HTTPException(status_code=400, detail="Send either 'on' or both 'start' and 'end'.")
+    if start is not None and end < start:
+        raise HTTPException(status_code=400, detail="'end' must not be before 'start'.")
 
+    try:
+        location = await resolve_place(data.person.place)
+        if not location:
+            raise HTTPException(status_code=400, detail="Could not find location.")
+        with span("ephemeris"):
+            result = await run_chart(calculate_dasha, data.person.date, data.person.time, location.latitude, location.longitude,
+                                     on, start, end, data.depth)
+        for period in result.get("path", result.get("periods")):
+            period["lord_si"] = PLANET_SI[period["lord"]]
+        return result
     except Exception as e:
         if isinstance(e, HTTPException): raise e
         import traceback
         print(traceback.format_exc())
-        if "Invalid JWT" in str(e): raise HTTPException(status_code=401, detail="Invalid session. Please log in again.")
+        raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
+
+@app.post("/transits")
+async def transits_endpoint(data: TransitRequest, user_id: str = Depends(current_user)):
+    try:
+        start = datetime.date.fromisoformat(data.start) if data.start else datetime.date.today()
+        end = datetime.date.fromisoformat(data.end) if data.end else start + timedelta(days=365)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dates must be in YYYY-MM-DD format.")
+    if end <= start or (end - start).days > TRANSIT_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"'end' must be after 'start' and at most {TRANSIT_MAX_DAYS} days later.")
+    unknown = [p for p in data.planets if p not in PLANET_ORDER]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown planets: {', '.join(unknown)}")
+    if data.chart is not None:
+        chart, _ = chart_from_compact(data.chart)
+        lagna_index, moon_index, birth_nakshatra = chart.lagna, chart.sign('Moon'), chart.nakshatra
+    else:
+        try:
+            lagna_index = ZODIAC_SIGNS_EN.index(data.d1_chart['lagna'])
+            moon_index = ZODIAC_SIGNS_EN.index(data.d1_chart['planets']['Moon'])
+        except (KeyError, TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="d1_chart must be the chart returned by /calculate_charts.")
+        birth_nakshatra = None
+        if data.prompt_data and data.prompt_data.get('nakshatra', {}).get('name') in NAKSHATRA_NAMES_SI:
+            birth_nakshatra = NAKSHATRA_NAMES_SI.index(data.prompt_data['nakshatra']['name'])
+
+    try:
+        with span("ephemeris"):
+            events = await run_chart(calculate_transits, lagna_index, moon_index, birth_nakshatra, start, end, data.planets, data.nakshatra)
+        return {"start": start.isoformat(), "end": end.isoformat(), "events": events}
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
 # (Keep the /generate_reading endpoint the same)
 @app.post("/generate_reading")
-async def generate_reading(chart_data: Dict[str, Any], authorization: str = Header(None)):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid authentication token.")
+async def generate_reading(chart_data: Dict[str, Any], stream: bool = False, job: bool = False, webhook: str | None = None,
+                           accept: str = Header(None),
+                           user_id: str = Depends(current_user), profile: Dict[str, Any] = Depends(current_profile)):
     if not GEMINI_API_KEY:
         raise HTTPException(status_code=500, detail="GEMINI_API_KEY is not configured.")
     try:
         # Charge AFTER success (VIP free)
-        token = authorization.split("Bearer ")[1]
-        user_response = supabase.auth.get_user(token)
-        user_id = user_response.user.id
-        profile_response = supabase.table('profiles').select('credits', 'is_vip').eq('id', user_id).single().execute()
-        profile = profile_response.data
-        if not profile:
-            raise HTTPException(status_code=404, detail="User profile not found.")
         # is_vip = profile.get('is_vip', False)
         # user_credits = profile.get('credits', 0)
         # if not is_vip and user_credits < READING_COST:
            # raise HTTPException(status_code=402, detail="Insufficient credits. Please purchase a credit pack.")
 
-        model = genai.GenerativeModel('gemini-2.5-flash')
         prompt_data = chart_data.get("prompt_data", {})
-        
-        gender = prompt_data.get('gender', '').lower()
-        gender_instruction = "ස්ත්‍රී ලිංගය." if gender == 'female' else ("පුරුෂ ලිංගය." if gender == 'male' else "")
-
-        prompt = f"""
-        You are 'Daivaya Guru', an expert Vedic Astrologer from Sri Lanka. Your tone must be wise, formal, respectful, and deeply insightful, like a personal consultation. The entire response must be in the SINHALA language. Your goal is to provide a comprehensive, positive, and empowering horoscope reading ('ජන්ම පත්‍ර විග්‍රහය') that leaves the user feeling understood, optimistic, and 100% satisfied.
-
-        **CRITICAL ANALYSIS & FORMATTING RULES:**
-        1.  **DEEP, DETAILED, PERSONALIZED ANALYSIS:** For every single section, provide a detailed, multi-paragraph analysis (at least 3-5 sentences). You MUST explain the 'why' behind every conclusion by referencing specific planets, houses, and signs from the user's data.
-        2.  **HANDLE EMPTY HOUSES CORRECTLY:** If a key house is empty, **DO NOT** state it as a negative or an uncertainty. Instead, you MUST perform a detailed analysis of the **house's lord**: its sign, its house placement, its strength, and any aspects it receives. This reveals the true, nuanced nature of that area of life.
-        3.  **BOLD KEY TERMS:** Use markdown `**` to bold key astrological terms like planet names (**ශනි**, **ගුරු**), house numbers (**දසවැන්න**, **හත්වැන්න**), and rasi names (**මේෂ**, **තුලා**) for emphasis and clarity.
-        4.  **AGE-APPROPRIATE READING:** The user's age is {prompt_data.get('age', 'N/A')}. If under 18, frame the entire reading as **guidance for the parents** (e.g., "ඔබගේ දරුවාගේ අධ්‍යාපනයට..."). Otherwise, address the user directly (e.g., "ඔබගේ අධ්‍යාපනය..."). Use correct gendered Sinhala language. {gender_instruction}
-        5.  **ACCURATE DASHA SYNTHESIS:** This is the most critical part. You MUST synthesize the Dasha's meaning in a non-generic way. For the current and next Mahadasha, you must analyze the Dasha lord's house rulership, its placement, and its condition in **both the D1 and D9 charts** to give a concrete, personalized prediction about the user's life during that specific period. Explain the pros and cons of the period based on this deep analysis.
-        6.  **POSITIVE & CAUTIOUS TONE:** Always highlight strengths and positive potentials. When discussing challenges (like health), be gentle, cautious, and provide constructive, preventative advice. AVOID creating fear.
-        7.  **STRUCTURED HEADINGS:** Start each new section with '### ' followed by the title.
-
-        **Astrological Data:**
-        {json.dumps(prompt_data, indent=2, ensure_ascii=False)}
-
-        ---
-        **GENERATE THE READING USING THIS EXACT STRUCTURE:**
-
-        ### ජන්ම පත්‍ර විග්‍රහය: {prompt_data.get('lagna', '')} ලග්නය
-        (A wise, multi-sentence introduction explaining the significance of the Lagna and Navamsa Lagna, tailored to the user's age.)
-
-        ### පෞරුෂය සහ මූලික ස්වභාවය
-        (Provide a deep analysis of personality. Synthesize insights from the Lagna, its lord's placement, planets in the 1st house, and the Chandra Rasi. Explain how the Navamsa Lagna reveals their inner, core self, discussing the pros and cons of these placements.)
-
-        ### ධනය, පවුල සහ කථාව (දෙවැන්න)
-        (Provide a detailed, multi-paragraph analysis of the 2nd house. If it is empty, analyze its lord in detail. Discuss wealth potential, family life, and communication style, linking them to specific Dasha periods where finances might change.)
-
-        ### පවුල් ජීවිතය සහ ඥාතීන්
-        (Provide a detailed, multi-paragraph analysis of family matters. Analyze the 4th house and Moon for mother, 9th house and Sun for father, 3rd house for siblings, and 5th house for children. Explain the nature of these relationships based on the planets.)
-
-        ### වෘත්තීය ජීවිතය සහ රැකියාව (දසවැන්න)
-        (Provide a deep, multi-paragraph analysis of career. If the 10th house in D1 is empty, analyze its lord's placement and strength in detail. Critically, analyze the D9 chart for career, as it reveals true professional destiny. Explain *why* the chart indicates a tendency for business, technology, or a stable job. Connect career changes to Dasha periods.)
-
-        ### විවාහය සහ සබඳතා (හත්වැන්න)
-        (Provide a detailed, multi-paragraph analysis of relationships. Analyze the 7th house in D1 and its lord. Most importantly, use the Navamsa Lagna and the D9 chart to give detailed insight into the nature of the spouse and the timing and quality of the marital relationship. Mention relevant Dasha periods for marriage.)
-
-        ### සෞඛ්‍යය
-        (Provide a gentle, multi-paragraph analysis of health. Analyze Lagna lord for vitality, the 6th house for diseases, and the 8th house for chronic issues. Offer constructive, preventative advice. Connect potential periods of concern to specific Dasha timelines.)
-
-        ### දශා පද්ධතියට අනුව අනාගත දැක්ම
-        (CRITICAL SECTION: Provide a very detailed, multi-paragraph forecast.
-        - Analyze the **current Mahadasha lord ({prompt_data.get('dasha_info', {}).get('current_mahadasha')})**. Explain its nature, its house rulership, and its placement in **both D1 and D9 charts** to describe the specific positive and negative experiences of the current period.
-        - Analyze the **next Mahadasha lord ({prompt_data.get('dasha_info', {}).get('next_mahadasha')})**. Explain in detail what specific changes, opportunities (pros), and challenges (cons) to expect starting around **{prompt_data.get('dasha_info', {}).get('next_mahadasha_start_year')}**, based on its strength and placement in **both D1 and D9 charts**.)
-
-        ### අවසාන විග්‍රහය
-        (A final, empowering multi-sentence summary of the overall destiny and life path, highlighting the chart's greatest strengths.)
-
-        ### තෙරුවන් සරණයි!
-        (Just the blessing.)
-        """
-        response = model.generate_content(prompt)
+        if "chart" in chart_data and not prompt_data:
+            # Compact clients send their chart back; the prompt data is rebuilt exactly as /calculate_charts would have
+            chart, gender = chart_from_compact(chart_data["chart"])
+            prompt_data = build_chart_response(*assemble_astro_details(chart), gender)["prompt_data"]
+        cache_key = reading_cache.key("reading", READING_MODEL, prompt_data)
+        cached_text = await run_io(reading_cache.get, cache_key)
+        metrics.record_cache("reading", cached_text is not None)
+
+        def remember(text, seconds):
+            reading_cache.put(cache_key, "reading", READING_MODEL, text, seconds)
+
+        if cached_text is None:
+            prompt = build_prompt(prompt_builder.reading, prompt_data)
+
+        async def generation_events():
+            model = await run_io(gemini_models.model, prompt)
+            async for event in stream_generation(model, prompt.contents, on_complete=remember, kind="reading",
+                                                 on_usage=lambda chunk, seconds: log_call(prompt, chunk, seconds)):
+                yield event
+
+        async def generate():
+            model = await run_io(gemini_models.model, prompt)
+            started = time.perf_counter()
+            response = await gemini_generate(model, prompt.contents)
+            metrics.record_gemini_usage(response, "reading")
+            log_call(prompt, response, time.perf_counter() - started)
+            await run_io(remember, response.text, time.perf_counter() - started)
+            return response.text
+
+        async def run_job():
+            return {"reading": await when_available(gemini_calls, lambda: flights.do("reading", cache_key, generate))}
+
+        if job:
+            if cached_text is not None:
+                return await submit_job("reading", user_id, profile, webhook=webhook, result={"reading": cached_text})
+            return await submit_job("reading", user_id, profile, run_job, webhook)
+
+        if stream:
+            if cached_text is not None:
+                return event_stream_response(replay_text(cached_text), accept)
+            require_gemini()
+            return event_stream_response(shared_stream("reading", cache_key, generation_events, user_id), accept)
+        if cached_text is not None:
+            return {"reading": cached_text}
+        if gemini_breaker_open():
+            # Gemini is known to be down: queue the reading instead of failing it
+            return await submit_job("reading", user_id, profile, run_job, webhook, reason=str(gemini_calls.unavailable()))
+
+        # A double click or retry waits for the generation already running instead of starting another
+        text = await single_flight("reading", cache_key, generate, user_id)
 
         # Deduct credits only after successful AI response
         # if not is_vip:
            # new_credits = user_credits - READING_COST
           #  supabase.table('profiles').update({'credits': new_credits}).eq('id', user_id).execute()
+          #  authenticator.forget_profile(user_id)
 
-        return {"reading": response.text}
+        return {"reading": text}
     except Exception as e:
+        if isinstance(e, HTTPException): raise e
         raise HTTPException(status_code=500, detail=f"An error occurred while generating the reading: {str(e)}")
 
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = Query(0.0, ge=0, le=60), user_id: str = Depends(current_user)):
+    # wait > 0 long-polls: answers as soon as the job finishes, or with its current status after `wait` seconds
+    job = await job_queue.get(job_id, user_id, wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+
 @app.post("/deduct_pdf_credit")
-async def deduct_pdf_credit(authorization: str = Header(None)):
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Missing or invalid authentication token.")
-    token = authorization.split("Bearer ")[1]
+async def deduct_pdf_credit(user_id: str = Depends(current_user), profile: Dict[str, Any] = Depends(current_profile)):
     try:
-        user_response = supabase.auth.get_user(token)
-        user_id = user_response.user.id
-        profile_response = supabase.table('profiles').select('credits', 'is_vip').eq('id', user_id).single().execute()
-        profile = profile_response.data
-        if not profile:
-            raise HTTPException(status_code=404, detail="User profile not found.")
         # is_vip = profile.get('is_vip', False)
         # user_credits = profile.get('credits', 0)
         # if is_vip:
@@ -513,6 +1053,7 @@ async def deduct_pdf_credit(authorization: str = Header(None)):
             # raise HTTPException(status_code=402, detail="Insufficient credits for PDF download.")
         # new_credits = user_credits - PDF_COST
         # supabase.table('profiles').update({'credits': new_credits}).eq('id', user_id).execute()
+        # authenticator.forget_profile(user_id)
         # return {"status": "ok", "vip": False, "remaining": new_credits}
         return {"status": "ok"}
     
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import random
+import threading
+import contextvars
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+
+# --- Request Metrics ---
+# A tiny in-process registry (no prometheus_client dependency) exposed as
+# Prometheus text on /metrics. Requests are timed by MetricsMiddleware; inside
+# a request, `with span("geocode"): ...` times one stage. Each observation is
+# a bisect plus an add under a lock, i.e. a couple of microseconds against
+# requests that take milliseconds. A sample of requests (and every 5xx) is
+# also printed as one JSON line with its stage breakdown.
+
+METRICS_LOG_SAMPLE_RATE = float(os.environ.get("METRICS_LOG_SAMPLE_RATE", "0"))
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_trace: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar("metrics_trace", default=None)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name, self.help, self.labelnames = name, help_text, labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help_text, labelnames
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: (list(s[0]), s[1], s[2]) for labels, s in self._series.items()}
+        for labels, (counts, total, count) in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {repr(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram("horoscope_request_duration_seconds", "HTTP request latency.", ("method", "route", "status"))
+STAGE_SECONDS = Histogram("horoscope_stage_duration_seconds", "Time spent in one stage of a request.", ("stage",))
+GEMINI_TOKENS = Counter("horoscope_gemini_tokens_total", "Gemini tokens used.", ("kind", "direction"))
+CACHE_EVENTS = Counter("horoscope_cache_events_total", "Cache lookups by result.", ("cache", "result"))
+FLIGHT_EVENTS = Counter("horoscope_singleflight_total", "Coalesced requests by outcome (led, joined, timeout, rejected).", ("kind", "outcome"))
+JOB_EVENTS = Counter("horoscope_jobs_total", "Background reading jobs by outcome (submitted, completed, failed, rejected).", ("kind", "outcome"))
+DEPENDENCY_SECONDS = Histogram("horoscope_dependency_duration_seconds",
+                               "Calls to Nominatim, Supabase and Gemini by outcome (ok, timeout, retryable, client_error, rejected).",
+                               ("dependency", "outcome"))
+_METRICS = [REQUEST_SECONDS, STAGE_SECONDS, GEMINI_TOKENS, CACHE_EVENTS, FLIGHT_EVENTS, JOB_EVENTS, DEPENDENCY_SECONDS]
+
+# Collectors are called at scrape time and return (name, type, help, labels, value)
+# samples, so existing stats dicts can be exported without touching the hot path
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, Any], float]]]] = []
+
+
+def register_collector(collector: Callable[[], Iterable[Tuple[str, str, str, Dict[str, Any], float]]]):
+    _collectors.append(collector)
+    return collector
+
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe((stage,), seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+
+class span:
+    """`with span("geocode"): ...` - a plain class, cheaper than a @contextmanager generator."""
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe_stage(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_EVENTS.inc((cache, "hit" if hit else "miss"))
+
+
+def record_flight(kind: str, outcome: str):
+    FLIGHT_EVENTS.inc((kind, outcome))
+
+
+def record_job(kind: str, outcome: str):
+    JOB_EVENTS.inc((kind, outcome))
+
+
+def observe_dependency(dependency: str, outcome: str, seconds: float):
+    DEPENDENCY_SECONDS.observe((dependency, outcome), seconds)
+
+
+def record_gemini_usage(response: Any, kind: str):
+    # usage_metadata is on the (last chunk of the) Gemini response; missing on fakes and errors
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+    output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+    # Part of prompt_token_count that came from a cached context (PROMPT_CONTEXT_CACHE)
+    cached_tokens = getattr(usage, "cached_content_token_count", 0) or 0
+    if prompt_tokens:
+        GEMINI_TOKENS.inc((kind, "prompt"), prompt_tokens)
+    if cached_tokens:
+        GEMINI_TOKENS.inc((kind, "cached"), cached_tokens)
+    if output_tokens:
+        GEMINI_TOKENS.inc((kind, "output"), output_tokens)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    grouped: Dict[str, Tuple[str, str, List[str]]] = {}
+    for collector in _collectors:
+        try:
+            samples = list(collector())
+        except Exception:
+            continue
+        for name, kind, help_text, labels, value in samples:
+            entry = grouped.setdefault(name, (kind, help_text, []))
+            names = tuple(labels)
+            entry[2].append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+    for name, (kind, help_text, samples) in grouped.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Plain ASGI middleware (no BaseHTTPMiddleware overhead); times until the last body chunk is sent."""
+
+    def __init__(self, app, sample_rate: float = METRICS_LOG_SAMPLE_RATE):
+        self.app = app
+        self.sample_rate = sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        trace: List[Tuple[str, float]] = []
+        token = _trace.set(trace)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(token)
+            elapsed = time.perf_counter() - started
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe((scope["method"], route_path, str(status[0])), elapsed)
+            if status[0] >= 500 or (self.sample_rate and random.random() < self.sample_rate):
+                print(json.dumps({
+                    "event": "request", "method": scope["method"], "route": route_path, "status": status[0],
+                    "ms": round(elapsed * 1000, 2),
+                    "stages": [{"stage": stage, "ms": round(seconds * 1000, 2)} for stage, seconds in trace],
+                }), flush=True)
@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import datetime
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import swisseph as swe
+
+from ephemeris import PLANET_ORDER, NAKSHATRA_SPAN, TRADITIONAL_AYANAMSA_OFFSET
+from transits import sidereal_longitude
+from timezones import local_to_jd, jd_to_local, zone
+
+
+# --- Daily Panchanga Feed ---
+# Today's tithi, nakshatra, Moon rasi and a short reading per Chandra rasi are
+# the same for every visitor, so they are computed ahead of time instead of per
+# request:
+#
+#     python panchanga.py build [--days 7] [--readings]     (daily, from cron)
+#
+# writes one JSON artifact per date to DAILY_DIR/v<DAILY_FORMAT_VERSION>/.
+# GET /daily only reads those files (ETag = hash of the bytes, 304 on
+# If-None-Match): no ephemeris and no Gemini at request time, and a day that
+# wasn't built is a 404, never computed on demand.
+#
+# The elements are taken at sunrise in Colombo, with the same Lahiri ayanamsa
+# and TRADITIONAL_AYANAMSA_OFFSET as the birth charts, plus the moments the
+# tithi and nakshatra current at sunrise end. Signs and nakshatras are indices
+# (labels: GET /chart_legend). With --readings each rasi also gets a Gemini
+# reading from its transit houses; without, `reading` is null and `favourable`
+# follows the classical Moon gochara houses.
+
+DAILY_DIR = os.environ.get("DAILY_DIR", os.path.join(".cache", "daily"))
+DAILY_MODEL = os.environ.get("DAILY_MODEL", "gemini-2.5-flash")
+# Bump when the artifact layout or the way elements are computed changes
+DAILY_FORMAT_VERSION = 1
+
+PLACE = {"name": "Colombo", "lat": 6.9271, "lon": 79.8612, "zone": "Asia/Colombo"}
+TITHI_SPAN = 12.0
+KARANA_SPAN = 6.0
+TITHI_NAMES = ["Pratipada", "Dwitiya", "Tritiya", "Chaturthi", "Panchami", "Shashthi", "Saptami", "Ashtami",
+               "Navami", "Dashami", "Ekadashi", "Dwadashi", "Trayodashi", "Chaturdashi"]
+YOGA_NAMES = ["Vishkambha", "Priti", "Ayushman", "Saubhagya", "Shobhana", "Atiganda", "Sukarma", "Dhriti", "Shula",
+              "Ganda", "Vriddhi", "Dhruva", "Vyaghata", "Harshana", "Vajra", "Siddhi", "Vyatipata", "Variyan",
+              "Parigha", "Shiva", "Siddha", "Sadhya", "Shubha", "Shukla", "Brahma", "Indra", "Vaidhriti"]
+MOVABLE_KARANAS = ["Bava", "Balava", "Kaulava", "Taitila", "Garaja", "Vanija", "Vishti"]
+WEEKDAYS = ["Sunday", "Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday"]
+WEEKDAYS_SI = ["ඉරිදා", "සඳුදා", "අඟහරුවාදා", "බදාදා", "බ්‍රහස්පතින්දා", "සිකුරාදා", "සෙනසුරාදා"]
+# Moon transit houses (from the Chandra rasi) counted as good in gochara
+FAVOURABLE_MOON_HOUSES = {1, 3, 6, 7, 10, 11}
+# Tithis and nakshatras last under 27 hours; search a little past that for their ends
+END_SEARCH_DAYS = 1.25
+END_TOLERANCE_DAYS = 1.0 / 1440
+
+
+def tithi_name(index: int) -> str:
+    if index == 14:
+        return "Purnima"
+    if index == 29:
+        return "Amavasya"
+    return TITHI_NAMES[index % 15]
+
+
+def karana_name(index: int) -> str:
+    # 60 half-tithis: one fixed karana first, 56 movable ones in a cycle of 7, three fixed at the end
+    if index == 0:
+        return "Kimstughna"
+    if index >= 57:
+        return ("Shakuni", "Chatushpada", "Naga")[index - 57]
+    return MOVABLE_KARANAS[(index - 1) % 7]
+
+
+def _elongation(jd: float) -> float:
+    return (sidereal_longitude(jd, 'Moon') - sidereal_longitude(jd, 'Sun')) % 360
+
+
+def _moon(jd: float) -> float:
+    return sidereal_longitude(jd, 'Moon')
+
+
+def _end_of(angle: Callable[[float], float], span: float, jd_start: float) -> float:
+    """First moment after jd_start at which angle(jd) crosses the next multiple of span.
+
+    angle only ever increases (Moon longitude, Moon-Sun elongation), so a bisection on the
+    unwrapped advance since jd_start is enough.
+    """
+    start = angle(jd_start)
+    target = (int(start / span) + 1) * span - start
+    lo, hi = jd_start, jd_start + END_SEARCH_DAYS
+    while hi - lo > END_TOLERANCE_DAYS:
+        mid = (lo + hi) / 2
+        if (angle(mid) - start) % 360 >= target:
+            hi = mid
+        else:
+            lo = mid
+    return hi
+
+
+def sun_event(jd_start: float, rise: bool) -> Optional[float]:
+    flag = (swe.CALC_RISE if rise else swe.CALC_SET) | swe.BIT_HINDU_RISING
+    res, times = swe.rise_trans(jd_start, swe.SUN, flag, (PLACE["lon"], PLACE["lat"], 0.0))
+    return times[0] if res == 0 else None
+
+
+def _local_time(jd: Optional[float]) -> Optional[str]:
+    if jd is None:
+        return None
+    return jd_to_local(jd, PLACE["zone"]).strftime("%Y-%m-%dT%H:%M")
+
+
+def compute_panchanga(day: datetime.date) -> Dict[str, Any]:
+    midnight = local_to_jd(datetime.datetime(day.year, day.month, day.day), PLACE["zone"])
+    sunrise = sun_event(midnight, rise=True)
+    sunset = sun_event(sunrise or midnight, rise=False)
+    jd = sunrise if sunrise is not None else midnight + 0.25
+
+    sun, moon = sidereal_longitude(jd, 'Sun'), sidereal_longitude(jd, 'Moon')
+    elongation = (moon - sun) % 360
+    tithi = int(elongation / TITHI_SPAN)
+    nakshatra = int(moon / NAKSHATRA_SPAN)
+    yoga = int(((sun + moon) % 360) / NAKSHATRA_SPAN)
+    karana = int(elongation / KARANA_SPAN)
+    weekday = (day.weekday() + 1) % 7   # Sunday first
+    return {
+        "sunrise": _local_time(sunrise),
+        "sunset": _local_time(sunset),
+        "weekday": weekday,
+        "vara": WEEKDAYS[weekday],
+        "vara_si": WEEKDAYS_SI[weekday],
+        "tithi": {"index": tithi, "name": tithi_name(tithi), "paksha": "Shukla" if tithi < 15 else "Krishna",
+                  "ends": _local_time(_end_of(_elongation, TITHI_SPAN, jd))},
+        "nakshatra": {"index": nakshatra, "pada": int((moon % NAKSHATRA_SPAN) / (NAKSHATRA_SPAN / 4)) + 1,
+                      "ends": _local_time(_end_of(_moon, NAKSHATRA_SPAN, jd))},
+        "yoga": {"index": yoga, "name": YOGA_NAMES[yoga]},
+        "karana": {"index": karana, "name": karana_name(karana)},
+        "moon_rasi": int(moon / 30),
+        "sun_rasi": int(sun / 30),
+        "positions": {planet: round(sidereal_longitude(jd, planet), 4) for planet in PLANET_ORDER},
+    }
+
+
+def rasi_facts(panchanga: Dict[str, Any]) -> List[Dict[str, Any]]:
+    signs = {planet: int(lon / 30) for planet, lon in panchanga["positions"].items()}
+    out = []
+    for rasi in range(12):
+        houses = {planet: (sign - rasi) % 12 + 1 for planet, sign in signs.items()}
+        out.append({"rasi": rasi, "transit_houses": houses, "favourable": houses['Moon'] in FAVOURABLE_MOON_HOUSES})
+    return out
+
+
+def build_day(day: datetime.date, reading_for: Optional[Callable[[Dict[str, Any]], str]] = None) -> Dict[str, Any]:
+    from prompts import DAILY_TEMPLATE_VERSION
+    panchanga = compute_panchanga(day)
+    summary = {k: panchanga[k] for k in ("tithi", "nakshatra", "yoga", "vara")}
+    rasis = []
+    for facts in rasi_facts(panchanga):
+        reading = None
+        if reading_for is not None:
+            reading = reading_for({"rasi": facts["rasi"], "panchanga": summary, "transit_houses": facts["transit_houses"]})
+        rasis.append({**facts, "reading": reading})
+    return {
+        "version": DAILY_FORMAT_VERSION,
+        "date": day.isoformat(),
+        "place": PLACE["name"],
+        "ayanamsa": {"mode": "lahiri", "offset": TRADITIONAL_AYANAMSA_OFFSET},
+        "reading_template": DAILY_TEMPLATE_VERSION if reading_for is not None else None,
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "panchanga": panchanga,
+        "rasis": rasis,
+    }
+
+
+def artifact_path(day: datetime.date, root: str = DAILY_DIR) -> str:
+    return os.path.join(root, f"v{DAILY_FORMAT_VERSION}", f"{day.isoformat()}.json")
+
+
+def write_artifact(path: str, payload: Dict[str, Any]):
+    # Written next to the target and renamed, so readers never see half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(body)
+    os.replace(tmp, path)
+
+
+def gemini_reader(model_name: str = DAILY_MODEL) -> Callable[[Dict[str, Any]], str]:
+    import google.generativeai as genai
+    from prompts import PromptBuilder, ModelFactory, log_call
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+    builder, models = PromptBuilder(), ModelFactory(lambda: genai, model_name)
+
+    def read(facts):
+        prompt = builder.daily(facts)
+        started = time.perf_counter()
+        response = models.model(prompt).generate_content(prompt.contents)
+        log_call(prompt, response, time.perf_counter() - started)
+        return (response.text or "").strip()
+    return read
+
+
+def build(start: datetime.date, days: int, root: str = DAILY_DIR, readings: bool = False, force: bool = False) -> List[str]:
+    swe.set_sid_mode(swe.SIDM_LAHIRI)
+    reading_for = gemini_reader() if readings else None
+    written = []
+    for offset in range(days):
+        day = start + datetime.timedelta(days=offset)
+        path = artifact_path(day, root)
+        if os.path.exists(path) and not force:
+            with open(path, encoding="utf-8") as f:
+                existing = json.load(f)
+            # Only redo a day to add readings it doesn't have yet
+            if existing.get("reading_template") or not readings:
+                continue
+        write_artifact(path, build_day(day, reading_for))
+        written.append(path)
+    return written
+
+
+class DailyFeed:
+    """Serves the built artifacts: bytes, ETag and whether it has readings, per date; re-read only when the file changes."""
+
+    def __init__(self, root: str = DAILY_DIR):
+        self.root = root
+        self._files: Dict[str, Tuple[Tuple[int, int], bytes, str, bool]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "loads": 0, "missing": 0}
+
+    def get(self, day: datetime.date) -> Optional[Tuple[bytes, str, bool]]:
+        path = artifact_path(day, self.root)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            self.stats["missing"] += 1
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached[0] == stamp:
+                self.stats["hits"] += 1
+                return cached[1], cached[2], cached[3]
+        with open(path, "rb") as f:
+            body = f.read()
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        # A day built without readings is rewritten by a later `build --readings`
+        with_readings = bool(json.loads(body).get("reading_template"))
+        with self._lock:
+            self._files[path] = (stamp, body, etag, with_readings)
+            # A worker only ever needs the last few weeks
+            while len(self._files) > 64:
+                self._files.pop(next(iter(self._files)))
+            self.stats["loads"] += 1
+        return body, etag, with_readings
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "files": len(self._files), "root": self.root}
+
+
+def today() -> datetime.date:
+    return datetime.datetime.now(zone(PLACE["zone"])).date()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the daily panchanga feed served by GET /daily.")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--start", type=datetime.date.fromisoformat, help="first date (default: today in Colombo)")
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--out", default=DAILY_DIR)
+    parser.add_argument("--readings", action="store_true", help="add a Gemini reading per rasi (needs GEMINI_API_KEY)")
+    parser.add_argument("--force", action="store_true", help="rebuild days that already have an artifact")
+    args = parser.parse_args()
+    if args.readings and not os.environ.get("GEMINI_API_KEY"):
+        sys.exit("--readings needs GEMINI_API_KEY")
+    for path in build(args.start or today(), args.days, args.out, args.readings, args.force):
+        print(path)
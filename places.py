@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import unicodedata
+import re
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from resilience import DependencyError
+
+
+# --- Place Resolution (gazetteer -> local cache -> Nominatim) ---
+# Most users type one of a few hundred Sri Lankan towns, so we try the bundled
+# gazetteer first, then our own record of earlier lookups, and only then go to
+# the network. Every layer is keyed on the same normalized place name.
+# Expired coordinates are kept for a while longer: if Nominatim is down (or its
+# breaker is open) when one needs refreshing, the old answer is used instead.
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer_lk.json")
+PLACE_CACHE_PATH = os.environ.get("PLACE_CACHE_PATH", os.path.join(".cache", "places.sqlite3"))
+PLACE_CACHE_MAX_ENTRIES = int(os.environ.get("PLACE_CACHE_MAX_ENTRIES", "20000"))
+PLACE_CACHE_TTL_SECONDS = int(os.environ.get("PLACE_CACHE_TTL_SECONDS", str(90 * 24 * 3600)))
+# "Not found" answers are cached too, but only briefly, so a typo does not hit Nominatim on every retry
+PLACE_CACHE_NEGATIVE_TTL_SECONDS = int(os.environ.get("PLACE_CACHE_NEGATIVE_TTL_SECONDS", str(6 * 3600)))
+# How long past expiry a found place may still be used when Nominatim is unavailable
+PLACE_CACHE_STALE_SECONDS = int(os.environ.get("PLACE_CACHE_STALE_SECONDS", str(365 * 24 * 3600)))
+PLACE_MEMORY_ENTRIES = 2048
+
+_COUNTRY_SUFFIXES = ("sri lanka", "srilanka", "ශ්‍රී ලංකාව", "ශ්‍රී ලංකා", "lk")
+
+
+class ResolvedPlace(NamedTuple):
+    # Same attribute names as geopy's Location, so callers can use either
+    latitude: float
+    longitude: float
+    source: str
+
+
+def normalize_place_name(name: str) -> str:
+    text = unicodedata.normalize("NFC", name or "").casefold().strip()
+    text = re.sub(r"[.,;:()\"']+", " ", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    for suffix in _COUNTRY_SUFFIXES:
+        if text.endswith(" " + suffix):
+            text = text[: -len(suffix)].strip()
+            break
+    return text.replace(" - ", "-")
+
+
+def load_gazetteer(path: str = GAZETTEER_PATH) -> Dict[str, tuple]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # Every label also works qualified by district ("Fort, Galle"); a label two
+    # places share (at different coordinates) works only that way
+    index, ambiguous = {}, set()
+    for entry in entries:
+        coords = (float(entry["lat"]), float(entry["lon"]))
+        district = normalize_place_name(entry.get("district", ""))
+        for label in [entry["name"], entry.get("si", "")] + entry.get("aliases", []):
+            key = normalize_place_name(label)
+            if not key:
+                continue
+            if district:
+                index.setdefault(f"{key} {district}", coords)
+                index.setdefault(f"{key} district {district}", coords)
+            if index.get(key, coords) != coords:
+                ambiguous.add(key)
+            index.setdefault(key, coords)
+    for key in ambiguous:
+        del index[key]
+    return index
+
+
+class PlaceCache:
+    """Persistent lookup cache with TTL, bounded size (LRU eviction) and a small in-memory front."""
+
+    def __init__(self, path: str = PLACE_CACHE_PATH, max_entries: int = PLACE_CACHE_MAX_ENTRIES,
+                 ttl: int = PLACE_CACHE_TTL_SECONDS, negative_ttl: int = PLACE_CACHE_NEGATIVE_TTL_SECONDS,
+                 stale_seconds: int = PLACE_CACHE_STALE_SECONDS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.stale_seconds = stale_seconds
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._db = None
+        try:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS places ("
+                " key TEXT PRIMARY KEY, lat REAL, lon REAL, expires_at REAL, last_used REAL)"
+            )
+        except sqlite3.Error:
+            # Read-only filesystem etc.: keep working with the in-memory layer only
+            self._db = None
+
+    def get(self, key: str):
+        """Returns (lat, lon), None for a cached "not found", or raises KeyError on a miss."""
+        now = time.time()
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None:
+                value, expires_at = hit
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return value
+            if self._db is None:
+                raise KeyError(key)
+            row = self._db.execute("SELECT lat, lon, expires_at FROM places WHERE key = ?", (key,)).fetchone()
+            if row is None or row[2] <= now:
+                raise KeyError(key)
+            self._db.execute("UPDATE places SET last_used = ? WHERE key = ?", (now, key))
+            value = (row[0], row[1]) if row[0] is not None else None
+            self._remember(key, value, row[2])
+            return value
+
+    def stale(self, key: str) -> Optional[tuple]:
+        """Coordinates for key even if expired (within stale_seconds); None if there are none."""
+        oldest = time.time() - self.stale_seconds
+        with self._lock:
+            hit = self._memory.get(key)
+            if hit is not None and hit[0] is not None and hit[1] > oldest:
+                return hit[0]
+            if self._db is None:
+                return None
+            row = self._db.execute("SELECT lat, lon FROM places WHERE key = ? AND lat IS NOT NULL AND expires_at > ?",
+                                   (key, oldest)).fetchone()
+            return (row[0], row[1]) if row is not None else None
+
+    def put(self, key: str, coords: Optional[tuple]):
+        now = time.time()
+        expires_at = now + (self.ttl if coords is not None else self.negative_ttl)
+        lat, lon = coords if coords is not None else (None, None)
+        with self._lock:
+            self._remember(key, coords, expires_at)
+            if self._db is None:
+                return
+            self._db.execute(
+                "INSERT OR REPLACE INTO places (key, lat, lon, expires_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, lat, lon, expires_at, now),
+            )
+            self._evict(now)
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > PLACE_MEMORY_ENTRIES:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now):
+        # Negative entries go at expiry, places only once they're too old to serve stale
+        self._db.execute("DELETE FROM places WHERE expires_at <= ? AND (lat IS NULL OR expires_at <= ?)",
+                         (now, now - self.stale_seconds))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM places").fetchone()
+        if count > self.max_entries:
+            self._db.execute(
+                "DELETE FROM places WHERE key IN (SELECT key FROM places ORDER BY last_used ASC LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def __len__(self):
+        with self._lock:
+            if self._db is None:
+                return len(self._memory)
+            return self._db.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+
+
+class PlaceResolver:
+    def __init__(self, geocode: Callable, cache: Optional[PlaceCache] = None, gazetteer: Optional[Dict[str, tuple]] = None):
+        self._geocode = geocode
+        self.cache = cache if cache is not None else PlaceCache()
+        self.gazetteer = gazetteer if gazetteer is not None else load_gazetteer()
+        self._stats_lock = threading.Lock()
+        self.stats = {"gazetteer_hits": 0, "cache_hits": 0, "negative_hits": 0, "misses": 0, "geocode_errors": 0, "stale_hits": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def resolve(self, place: str) -> Optional[ResolvedPlace]:
+        key = normalize_place_name(place)
+        if not key:
+            return None
+
+        coords = self.gazetteer.get(key)
+        if coords is not None:
+            self._count("gazetteer_hits")
+            return ResolvedPlace(coords[0], coords[1], "gazetteer")
+
+        try:
+            coords = self.cache.get(key)
+            if coords is None:
+                self._count("negative_hits")
+                return None
+            self._count("cache_hits")
+            return ResolvedPlace(coords[0], coords[1], "cache")
+        except KeyError:
+            pass
+
+        self._count("misses")
+        try:
+            location = self._geocode(place)
+        except Exception as e:
+            # Don't cache network failures, only real answers
+            self._count("geocode_errors")
+            stale = self.cache.stale(key) if isinstance(e, DependencyError) else None
+            if stale is None:
+                raise
+            self._count("stale_hits")
+            return ResolvedPlace(stale[0], stale[1], "stale_cache")
+        coords = (location.latitude, location.longitude) if location else None
+        self.cache.put(key, coords)
+        if coords is None:
+            return None
+        return ResolvedPlace(coords[0], coords[1], "nominatim")
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = sum(stats[k] for k in ("gazetteer_hits", "cache_hits", "negative_hits", "misses"))
+        stats["hit_ratio"] = round((lookups - stats["misses"]) / lookups, 4) if lookups else 0.0
+        stats["cached_entries"] = len(self.cache)
+        return stats
@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+# --- Deterministic Porondam Engine ---
+# The 20 "Wisi Porondam" from the Gemini prompt, as yes/no rules over the
+# bride's and groom's birth nakshatra (0 = Ashwini .. 26 = Revati), Chandra
+# rasi (0 = Aries .. 11 = Pisces) and Kuja dosha. Every rule is evaluated once
+# at import into 27x27 / 12x12 tables indexed [bride, groom], so scoring one
+# chart against N candidates is a handful of array lookups.
+#
+# The group assignments below are the common traditional ones; where schools
+# differ (vruksha, pakshi, ayusha) the table is the single place to change.
+
+N_NAK = 27
+N_RASI = 12
+
+# Sinhala names, in the same order as the prompt lists them
+PORONDAM_NAMES_SI = [
+    "නැකැත් පොරොන්දම", "ගණ පොරොන්දම", "මහේන්ද්‍ර පොරොන්දම", "ස්ත්‍රී දීර්ඝ පොරොන්දම", "යෝනි පොරොන්දම",
+    "රාශි පොරොන්දම", "රාශ්‍යාධිපති පොරොන්දම", "වශ්‍ය පොරොන්දම", "රජ්ජු පොරොන්දම", "වේධ පොරොන්දම",
+    "වෘක්ෂ පොරොන්දම", "ආයුෂ පොරොන්දම", "පක්ෂි පොරොන්දම", "භූත පොරොන්දම", "ගෝත්‍ර පොරොන්දම",
+    "වර්ණ පොරොන්දම", "ලිංග පොරොන්දම", "නාඩි පොරොන්දම", "දින පොරොන්දම", "ග්‍රහ පොරොන්දම (කුජ දෝෂය)",
+]
+PORONDAM_KEYS = [
+    "nakath", "gana", "mahendra", "stree_deergha", "yoni",
+    "rasi", "rasyadhipati", "vashya", "rajju", "vedha",
+    "vruksha", "ayusha", "pakshi", "bhoota", "gothra",
+    "varna", "linga", "nadi", "dina", "graha",
+]
+RASI_KEYS = ("rasi", "rasyadhipati", "vashya", "varna")
+MAX_SCORE = len(PORONDAM_KEYS)
+
+# 0 = Deva, 1 = Manushya, 2 = Rakshasa
+GANA = [0, 1, 2, 1, 0, 1, 0, 0, 2, 2, 1, 1, 0, 2, 0, 2, 0, 2, 2, 1, 1, 0, 2, 2, 1, 1, 0]
+# Yoni animal and its sex (1 = male)
+YONI = ["horse", "elephant", "sheep", "serpent", "serpent", "dog", "cat", "sheep", "cat",
+        "rat", "rat", "cow", "buffalo", "tiger", "buffalo", "tiger", "deer", "deer",
+        "dog", "monkey", "mongoose", "monkey", "lion", "horse", "lion", "cow", "elephant"]
+YONI_MALE = [1, 1, 0, 1, 0, 0, 0, 1, 1, 1, 0, 1, 0, 0, 1, 1, 0, 1, 1, 1, 1, 0, 0, 0, 1, 0, 0]
+YONI_ENEMIES = {frozenset(p) for p in [("horse", "buffalo"), ("elephant", "lion"), ("sheep", "monkey"),
+                                        ("serpent", "mongoose"), ("dog", "deer"), ("cat", "rat"), ("cow", "tiger")]}
+# Rajju runs feet, hip, navel, neck, head and back down again every 9 nakshatras
+RAJJU = [[0, 1, 2, 3, 4, 3, 2, 1, 0][n % 9] for n in range(N_NAK)]
+VEDHA_PAIRS = {frozenset(p) for p in [(0, 17), (1, 16), (2, 15), (3, 14), (5, 21), (6, 20), (7, 19), (8, 18),
+                                       (9, 26), (10, 25), (11, 24), (12, 23), (4, 22), (4, 13), (13, 22)]}
+# Nakshatras whose tree has milky sap (kiri gas)
+MILKY_TREE = {2, 7, 9, 11, 16, 20, 21, 24, 26}
+# Pakshi (bird) and bhoota (element) run in blocks through the zodiac
+PAKSHI = [0] * 5 + [1] * 6 + [2] * 5 + [3] * 5 + [4] * 6
+BHOOTA = [0] * 5 + [1] * 6 + [2] * 5 + [3] * 5 + [4] * 6   # earth, water, fire, air, ether
+BHOOTA_CLASH = {frozenset(p) for p in [(1, 2), (0, 3)]}     # water/fire, earth/air
+GOTHRA = [n % 7 for n in range(N_NAK)]
+NADI = [[0, 1, 2, 2, 1, 0][n % 6] for n in range(N_NAK)]
+MAHENDRA_COUNTS = {4, 7, 10, 13, 16, 19, 22, 25}
+DINA_COUNTS = {2, 4, 6, 8, 9, 11, 13, 15, 18, 20, 24, 26}
+
+# Rasi lords: Sun 0, Moon 1, Mars 2, Mercury 3, Jupiter 4, Venus 5, Saturn 6
+RASI_LORD = [2, 5, 3, 1, 0, 3, 5, 2, 4, 6, 6, 4]
+LORD_ENEMIES = {0: {5, 6}, 1: set(), 2: {3}, 3: {1}, 4: {3, 5}, 5: {0, 1}, 6: {0, 1, 2}}
+VASHYA = {0: {4, 7}, 1: {3, 6}, 2: {5}, 3: {7, 8}, 4: {6}, 5: {11, 2}, 6: {5, 9}, 7: {3}, 8: {11}, 9: {0, 10}, 10: {0}, 11: {9}}
+# 3 = Brahmin (water signs) .. 0 = Shudra (air signs)
+VARNA = [2, 1, 0, 3, 2, 1, 0, 3, 2, 1, 0, 3]
+# Houses from lagna that give Kuja dosha
+KUJA_DOSHA_HOUSES = {2, 4, 7, 8, 12}
+
+
+def _count(frm: int, to: int, n: int) -> int:
+    # Traditional inclusive count from one star/sign to the other (1..n)
+    return (to - frm) % n + 1
+
+
+NAKSHATRA_RULES = {
+    "nakath": lambda b, g: _count(b, g, N_NAK) % 9 in (0, 2, 4, 6, 8),
+    "gana": lambda b, g: GANA[b] == GANA[g] or 2 not in (GANA[b], GANA[g]),
+    "mahendra": lambda b, g: _count(b, g, N_NAK) in MAHENDRA_COUNTS,
+    "stree_deergha": lambda b, g: _count(b, g, N_NAK) > 13,
+    "yoni": lambda b, g: frozenset((YONI[b], YONI[g])) not in YONI_ENEMIES,
+    "rajju": lambda b, g: RAJJU[b] != RAJJU[g],
+    "vedha": lambda b, g: frozenset((b, g)) not in VEDHA_PAIRS,
+    "vruksha": lambda b, g: b in MILKY_TREE or g in MILKY_TREE,
+    "ayusha": lambda b, g: _count(b, g, N_NAK) % 3 != 0,
+    "pakshi": lambda b, g: abs(PAKSHI[b] - PAKSHI[g]) <= 1,
+    "bhoota": lambda b, g: frozenset((BHOOTA[b], BHOOTA[g])) not in BHOOTA_CLASH,
+    "gothra": lambda b, g: GOTHRA[b] != GOTHRA[g],
+    "linga": lambda b, g: YONI_MALE[g] == 1 or YONI_MALE[b] == 0,
+    "nadi": lambda b, g: NADI[b] != NADI[g],
+    "dina": lambda b, g: _count(b, g, N_NAK) in DINA_COUNTS,
+}
+RASI_RULES = {
+    "rasi": lambda b, g: _count(b, g, N_RASI) not in (2, 6, 8, 12),
+    "rasyadhipati": lambda b, g: RASI_LORD[g] not in LORD_ENEMIES[RASI_LORD[b]] and RASI_LORD[b] not in LORD_ENEMIES[RASI_LORD[g]],
+    "vashya": lambda b, g: b == g or g in VASHYA[b] or b in VASHYA[g],
+    "varna": lambda b, g: VARNA[g] >= VARNA[b],
+}
+
+
+def _table(rules, size):
+    # (rules, bride, groom) booleans
+    return np.array([[[rule(b, g) for g in range(size)] for b in range(size)] for rule in rules.values()], dtype=bool)
+
+
+NAKSHATRA_TABLES = _table(NAKSHATRA_RULES, N_NAK)
+RASI_TABLES = _table(RASI_RULES, N_RASI)
+# Summed scores; uint8 keeps each table in a few cache lines
+NAKSHATRA_SCORE = NAKSHATRA_TABLES.sum(axis=0).astype(np.uint8)
+RASI_SCORE = RASI_TABLES.sum(axis=0).astype(np.uint8)
+
+
+def has_kuja_dosha(lagna_index: int, mars_index: int) -> bool:
+    return ((mars_index - lagna_index) % 12) + 1 in KUJA_DOSHA_HOUSES
+
+
+def score_pair(bride_nak: int, bride_rasi: int, bride_kuja: bool, groom_nak: int, groom_rasi: int, groom_kuja: bool) -> int:
+    return int(NAKSHATRA_SCORE[bride_nak, groom_nak]) + int(RASI_SCORE[bride_rasi, groom_rasi]) + int(bride_kuja == groom_kuja)
+
+
+def explain_pair(bride_nak: int, bride_rasi: int, bride_kuja: bool, groom_nak: int, groom_rasi: int, groom_kuja: bool) -> List[Dict[str, Any]]:
+    nak_keys = list(NAKSHATRA_RULES)
+    rasi_keys = list(RASI_RULES)
+    breakdown = []
+    for key, name in zip(PORONDAM_KEYS, PORONDAM_NAMES_SI):
+        if key == "graha":
+            matched = bride_kuja == groom_kuja
+        elif key in RASI_RULES:
+            matched = bool(RASI_TABLES[rasi_keys.index(key), bride_rasi, groom_rasi])
+        else:
+            matched = bool(NAKSHATRA_TABLES[nak_keys.index(key), bride_nak, groom_nak])
+        breakdown.append({"key": key, "name": name, "match": matched})
+    return breakdown
+
+
+class CandidateIndex:
+    """Compact per-candidate vectors (nakshatra, rasi, kuja dosha, gender), computed once and searched in bulk."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.ids: List[str] = []
+        self.nakshatra = np.empty(0, dtype=np.uint8)
+        self.rasi = np.empty(0, dtype=np.uint8)
+        self.kuja = np.empty(0, dtype=bool)
+        self.female = np.empty(0, dtype=np.int8)   # 1 female, 0 male, -1 unknown
+
+    def __len__(self):
+        return len(self.ids)
+
+    def extend(self, candidates: Iterable[Dict[str, Any]]):
+        rows = list(candidates)
+        if not rows:
+            return
+        gender_code = {"female": 1, "male": 0}
+        with self._lock:
+            self.ids = self.ids + [str(c["id"]) for c in rows]
+            self.nakshatra = np.concatenate([self.nakshatra, np.array([c["nakshatra"] for c in rows], dtype=np.uint8)])
+            self.rasi = np.concatenate([self.rasi, np.array([c["rasi"] for c in rows], dtype=np.uint8)])
+            self.kuja = np.concatenate([self.kuja, np.array([bool(c.get("kuja_dosha", False)) for c in rows], dtype=bool)])
+            self.female = np.concatenate([self.female, np.array([gender_code.get((c.get("gender") or "").lower(), -1) for c in rows], dtype=np.int8)])
+
+    def search(self, nakshatra: int, rasi: int, kuja: bool, query_is_bride: bool, top_k: int = 10) -> List[Dict[str, Any]]:
+        with self._lock:
+            ids, cand_nak, cand_rasi, cand_kuja, cand_female = self.ids, self.nakshatra, self.rasi, self.kuja, self.female
+        if not ids:
+            return []
+        # Tables are [bride, groom]; pick the row/column that matches the query's side
+        if query_is_bride:
+            scores = NAKSHATRA_SCORE[nakshatra][cand_nak] + RASI_SCORE[rasi][cand_rasi]
+        else:
+            scores = NAKSHATRA_SCORE[:, nakshatra][cand_nak] + RASI_SCORE[:, rasi][cand_rasi]
+        scores = scores + (cand_kuja == kuja)
+        # Only candidates of the other gender (or of unknown gender)
+        wanted_female = 0 if query_is_bride else 1
+        scores = np.where(cand_female == 1 - wanted_female, -1, scores.astype(np.int16))
+
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.lexsort((top, -scores[top]))]
+        results = []
+        for i in top:
+            if scores[i] < 0:
+                continue
+            if query_is_bride:
+                pair = (nakshatra, rasi, kuja, int(cand_nak[i]), int(cand_rasi[i]), bool(cand_kuja[i]))
+            else:
+                pair = (int(cand_nak[i]), int(cand_rasi[i]), bool(cand_kuja[i]), nakshatra, rasi, kuja)
+            results.append({"id": ids[i], "score": int(scores[i]), "max_score": MAX_SCORE, "breakdown": explain_pair(*pair)})
+        return results
+
+    def save(self, path: str):
+        with self._lock:
+            np.savez(path, ids=np.array(self.ids), nakshatra=self.nakshatra, rasi=self.rasi, kuja=self.kuja, female=self.female)
+
+    @classmethod
+    def load(cls, path: str) -> "CandidateIndex":
+        index = cls()
+        with np.load(path) as data:
+            index.ids = [str(i) for i in data["ids"]]
+            index.nakshatra, index.rasi = data["nakshatra"], data["rasi"]
+            index.kuja, index.female = data["kuja"], data["female"]
+        return index
+
+
+def load_default_index() -> CandidateIndex:
+    path = os.environ.get("PORONDAM_CANDIDATES_PATH")
+    if path and os.path.exists(path):
+        return CandidateIndex.load(path)
+    return CandidateIndex()
+
+
+if __name__ == "__main__":
+    # python porondam.py build-index births.jsonl candidates.npz
+    # Each input line: {"id": ..., "date": ..., "time": ..., "place": ..., "gender": ...}
+    if len(sys.argv) != 4 or sys.argv[1] != "build-index":
+        sys.exit("usage: python porondam.py build-index <births.jsonl> <out.npz>")
+    import main
+    with open(sys.argv[2], encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    records = [main.BirthData(**{k: r.get(k) for k in ("date", "time", "place", "gender")}) for r in rows]
+    index = CandidateIndex()
+    vectors = []
+    for row, result in zip(rows, main.calculate_charts_batch(records)):
+        if "error" in result:
+            print(f"skipping {row.get('id')}: {result['error']}", file=sys.stderr)
+            continue
+        vectors.append(dict(main.porondam_vector(result["d1_chart"], result["prompt_data"]), id=row["id"], gender=row.get("gender")))
+    index.extend(vectors)
+    index.save(sys.argv[3])
+    print(f"indexed {len(index)} candidates")
@@ -0,0 +1,123 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+
+# --- AI Reading Cache ---
+# A reading is fully determined by the chart data we send, the prompt template
+# and the model, so we key stored readings on a hash of exactly those. Bumping
+# a template version makes every older entry unreachable, and they are purged
+# on startup (or on demand via invalidate()).
+
+READING_CACHE_PATH = os.environ.get("READING_CACHE_PATH", os.path.join(".cache", "readings.sqlite3"))
+READING_CACHE_MAX_BYTES = int(os.environ.get("READING_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def canonical_json(value: Any) -> str:
+    return json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class ReadingCache:
+    def __init__(self, template_versions: Dict[str, str], path: str = READING_CACHE_PATH,
+                 max_bytes: int = READING_CACHE_MAX_BYTES):
+        # template_versions maps a reading kind ("reading", "porondam") to its current template version
+        self.template_versions = dict(template_versions)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "saved_seconds": 0.0}
+        self._db = None
+        try:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS readings ("
+                " key TEXT PRIMARY KEY, kind TEXT, template_version TEXT, model TEXT, text TEXT,"
+                " size INTEGER, gen_seconds REAL, created_at REAL, last_used REAL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS readings_last_used ON readings (last_used)")
+            self.invalidate()
+        except sqlite3.Error:
+            self._db = None
+
+    def key(self, kind: str, model: str, *chart_payloads: Any) -> str:
+        # Payloads stay in order: porondam's person1/person2 are bride/groom in the prompt
+        parts = [canonical_json(p) for p in chart_payloads]
+        material = "\x1f".join([kind, self.template_versions[kind], model] + parts)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = None
+            if self._db is not None:
+                row = self._db.execute("SELECT text, gen_seconds FROM readings WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.stats["misses"] += 1
+                return None
+            self._db.execute("UPDATE readings SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.stats["hits"] += 1
+            self.stats["saved_seconds"] += row[1] or 0.0
+            return row[0]
+
+    def put(self, key: str, kind: str, model: str, text: str, gen_seconds: float):
+        if not text or self._db is None:
+            return
+        now = time.time()
+        size = len(text.encode("utf-8"))
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO readings (key, kind, template_version, model, text, size, gen_seconds, created_at, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, self.template_versions[kind], model, text, size, gen_seconds, now, now),
+            )
+            self.stats["stores"] += 1
+            self._evict()
+
+    def _evict(self):
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM readings").fetchone()
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used readings until we are back under budget
+        excess = total - self.max_bytes
+        doomed = []
+        for key, size in self._db.execute("SELECT key, size FROM readings ORDER BY last_used ASC"):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        self._db.executemany("DELETE FROM readings WHERE key = ?", doomed)
+        self.stats["evictions"] += len(doomed)
+
+    def invalidate(self, kind: Optional[str] = None) -> int:
+        """Delete entries written under an older template version (or every entry of `kind`)."""
+        if self._db is None:
+            return 0
+        with self._lock:
+            if kind is not None:
+                cur = self._db.execute("DELETE FROM readings WHERE kind = ?", (kind,))
+                return cur.rowcount
+            removed = 0
+            for k, version in self.template_versions.items():
+                cur = self._db.execute("DELETE FROM readings WHERE kind = ? AND template_version != ?", (k, version))
+                removed += cur.rowcount
+            placeholders = ",".join("?" * len(self.template_versions))
+            cur = self._db.execute(f"DELETE FROM readings WHERE kind NOT IN ({placeholders})", tuple(self.template_versions))
+            return removed + cur.rowcount
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            entries, size = (0, 0)
+            if self._db is not None:
+                entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM readings").fetchone()
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        stats["saved_seconds"] = round(stats["saved_seconds"], 2)
+        stats["entries"] = entries
+        stats["bytes"] = size
+        return stats
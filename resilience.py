@@ -0,0 +1,235 @@
+import os
+import re
+import time
+import asyncio
+import random
+import threading
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import metrics
+
+
+# --- Calls to External Services ---
+# Every blocking call to Nominatim, Supabase and Gemini goes through one
+# Dependency, which gives it:
+#   * a timeout (passed to the client library by the caller: geopy's timeout,
+#     the shared httpx client's timeout, Gemini's request_options);
+#   * retries with full-jitter exponential backoff, but only for errors worth
+#     retrying (timeouts, connection errors, 429 and 5xx), never for 4xx;
+#   * a circuit breaker: after BREAKER_FAILURES consecutive failures calls fail
+#     fast with DependencyUnavailable for BREAKER_RESET_SECONDS, then one probe
+#     call is let through to decide whether to close it again;
+#   * latency and outcome stats (/metrics and /health).
+# Callers choose the fallback (stale geocode, stale profile, queued reading)
+# when a call fails; the API turns what remains into 503/504 with Retry-After.
+
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+RETRY_BASE_SECONDS = float(os.environ.get("RETRY_BASE_SECONDS", "0.2"))
+RETRY_MAX_SECONDS = float(os.environ.get("RETRY_MAX_SECONDS", "2"))
+# Keep-alive connections per dependency; no point in more than the I/O pool has threads
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", os.environ.get("IO_POOL_SIZE", "16")))
+
+_TIMEOUT_NAMES = {"Timeout", "TimeoutError", "TimeoutException", "ReadTimeout", "ConnectTimeout", "PoolTimeout",
+                  "GeocoderTimedOut", "DeadlineExceeded"}
+_RETRYABLE_NAMES = {"ConnectionError", "ConnectError", "ReadError", "RemoteProtocolError", "TransportError",
+                    "GeocoderUnavailable", "GeocoderRateLimited", "ServiceUnavailable", "InternalServerError",
+                    "TooManyRequests", "ResourceExhausted", "BadGateway", "GatewayTimeout", "AuthRetryableError"}
+_STATUS_RE = re.compile(r"(?:^|status code:? |HTTP )(429|5\d\d)\b")
+
+
+class DependencyError(Exception):
+    def __init__(self, dependency: str, message: str, retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class DependencyUnavailable(DependencyError):
+    """The circuit is open: not even tried."""
+
+
+class DependencyTimeout(DependencyError):
+    pass
+
+
+class DependencyFailed(DependencyError):
+    pass
+
+
+def classify(error: BaseException) -> str:
+    """"timeout", "retryable" or "fatal" (a real answer, e.g. 4xx, that retrying won't change)."""
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if names & _TIMEOUT_NAMES:
+        return "timeout"
+    if names & _RETRYABLE_NAMES:
+        return "retryable"
+    status = getattr(error, "status_code", None) or getattr(error, "status", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return "retryable" if status == 429 or status >= 500 else "fatal"
+    # Some clients only put the status in the message ("Non-successful status code 502")
+    return "retryable" if _STATUS_RE.search(str(error)) else "fatal"
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.consecutive = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def retry_after(self) -> int:
+        with self._lock:
+            if self.state != "open":
+                return 1
+            return max(1, int(self.reset_seconds - (time.monotonic() - self.opened_at)) + 1)
+
+    def success(self):
+        with self._lock:
+            self.state, self.consecutive, self._probing = "closed", 0, False
+
+    def failure(self):
+        with self._lock:
+            self.consecutive += 1
+            if self.state == "half_open" or self.consecutive >= self.failures:
+                if self.state != "open":
+                    self.opened += 1
+                self.state, self.opened_at, self._probing = "open", time.monotonic(), False
+
+    def can_try(self) -> bool:
+        """Whether allow() would let a call through right now (without taking the probe)."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open":
+                return time.monotonic() - self.opened_at >= self.reset_seconds
+            return not self._probing
+
+    def is_open(self) -> bool:
+        with self._lock:
+            return self.state == "open" and time.monotonic() - self.opened_at < self.reset_seconds
+
+
+class Dependency:
+    def __init__(self, name: str, label: str, timeout: float, retries: int, breaker: Optional[CircuitBreaker] = None):
+        self.name = name
+        self.label = label          # for error messages shown to users
+        self.timeout = timeout
+        self.retries = retries
+        self.breaker = breaker or CircuitBreaker()
+        self._recent = deque(maxlen=512)
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "ok": 0, "retries": 0, "timeouts": 0, "errors": 0, "rejected": 0}
+
+    def _observe(self, outcome: str, seconds: float):
+        metrics.observe_dependency(self.name, outcome, seconds)
+        with self._lock:
+            self.stats["calls"] += 1
+            self.stats[{"ok": "ok", "timeout": "timeouts"}.get(outcome, "errors")] += 1
+            self._recent.append(seconds)
+
+    def unavailable(self) -> DependencyUnavailable:
+        with self._lock:
+            self.stats["rejected"] += 1
+        metrics.observe_dependency(self.name, "rejected", 0.0)
+        return DependencyUnavailable(self.name, f"The {self.label} is temporarily unavailable. Please try again shortly.",
+                                     self.breaker.retry_after())
+
+    def call(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """fn(*args, **kwargs) with retries and the breaker. Blocking: run it on the I/O pool."""
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                raise self.unavailable()
+            started = time.perf_counter()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                seconds = time.perf_counter() - started
+                kind = classify(e)
+                if kind == "fatal":
+                    # The service answered; it's the request that is wrong
+                    self._observe("client_error", seconds)
+                    self.breaker.success()
+                    raise
+                self._observe(kind, seconds)
+                self.breaker.failure()
+                if attempt == self.retries:
+                    if kind == "timeout":
+                        raise DependencyTimeout(self.name, f"The {self.label} did not respond in time. Please try again.") from e
+                    raise DependencyFailed(self.name, f"The {self.label} is having problems. Please try again shortly.") from e
+                with self._lock:
+                    self.stats["retries"] += 1
+                time.sleep(random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt)))
+            else:
+                self._observe("ok", time.perf_counter() - started)
+                self.breaker.success()
+                return result
+
+    def report(self, error: Optional[BaseException], seconds: float):
+        """Outcome of work that happened outside call(), e.g. the rest of a streamed response."""
+        if error is None:
+            self._observe("ok", seconds)
+            self.breaker.success()
+        elif classify(error) == "fatal":
+            self._observe("client_error", seconds)
+        else:
+            self._observe(classify(error), seconds)
+            self.breaker.failure()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            recent = sorted(self._recent)
+            stats = dict(self.stats)
+        if recent:
+            stats["p50_ms"] = round(recent[len(recent) // 2] * 1000, 1)
+            stats["p95_ms"] = round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 1)
+        return {**stats, "breaker": self.breaker.state, "breaker_opened": self.breaker.opened,
+                "timeout_seconds": self.timeout, "retries": self.retries}
+
+
+async def when_available(dependency: Dependency, compute: Callable[[], Awaitable[Any]]) -> Any:
+    """await compute(), first waiting out an open breaker; for queued work (the job timeout still applies)."""
+    while True:
+        while not dependency.breaker.can_try():
+            await asyncio.sleep(min(1.0, dependency.breaker.retry_after()))
+        try:
+            return await compute()
+        except DependencyUnavailable:
+            # Another caller got the half-open probe; wait for its outcome
+            await asyncio.sleep(0.1)
+
+
+def _dependency(name: str, label: str, timeout: str, retries: str) -> Dependency:
+    prefix = name.upper()
+    return Dependency(name, label, float(os.environ.get(f"{prefix}_TIMEOUT_SECONDS", timeout)),
+                      int(os.environ.get(f"{prefix}_RETRIES", retries)))
+
+
+nominatim_calls = _dependency("nominatim", "location service", "5", "1")
+supabase_calls = _dependency("supabase", "account service", "5", "2")
+# Long: a full reading takes a while. Retried once, and only before anything was streamed
+gemini_calls = _dependency("gemini", "reading service", "120", "1")
+DEPENDENCIES = (nominatim_calls, supabase_calls, gemini_calls)
+
+
+@metrics.register_collector
+def breaker_metrics():
+    for dependency in DEPENDENCIES:
+        yield ("horoscope_dependency_breaker_open", "gauge", "1 while the dependency's circuit breaker is open.",
+               {"dependency": dependency.name}, 1 if dependency.breaker.state == "open" else 0)
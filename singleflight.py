@@ -0,0 +1,160 @@
+import os
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import metrics
+
+
+# --- Single-Flight Request Coalescing ---
+# Double clicks and frontend retries send the same /calculate_charts or
+# /generate_reading payload several times at once. Requests with the same
+# (kind, key) share one computation: the first one starts it, the others await
+# the same task and get the same result (or the same exception). Streams are
+# shared too: every event is kept until the stream ends and each subscriber
+# replays from the start, so a late joiner still sees the whole reading.
+#
+# Each flight has one deadline, counted from when it started; when it passes
+# every waiter gets FlightTimeout (streams get an error event). A user may lead
+# at most SINGLEFLIGHT_PER_USER distinct flights at once; joining an existing
+# flight is always allowed since it costs nothing. The computation is not tied
+# to any one request, so a client that disconnects doesn't stop a reading
+# (which still lands in the reading cache) for the others.
+
+SINGLEFLIGHT_TIMEOUT_SECONDS = float(os.environ.get("SINGLEFLIGHT_TIMEOUT_SECONDS", "180"))
+SINGLEFLIGHT_PER_USER = int(os.environ.get("SINGLEFLIGHT_PER_USER", "4"))
+
+
+class FlightTimeout(Exception):
+    pass
+
+
+class TooManyFlights(Exception):
+    pass
+
+
+class _SharedStream:
+    def __init__(self):
+        self.events: List[Dict[str, Any]] = []
+        self.finished = False
+        self.timed_out = False
+        self._changed = asyncio.Event()
+
+    def _publish(self, event: Optional[Dict[str, Any]] = None):
+        if event is not None:
+            self.events.append(event)
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def pump(self, events: AsyncIterator[Dict[str, Any]], timeout: float):
+        deadline = asyncio.get_running_loop().time() + timeout
+        try:
+            while True:
+                remaining = deadline - asyncio.get_running_loop().time()
+                try:
+                    event = await asyncio.wait_for(events.__anext__(), max(remaining, 0))
+                except StopAsyncIteration:
+                    break
+                self._publish(event)
+        except asyncio.TimeoutError:
+            self.timed_out = True
+            self._publish({"type": "error", "detail": "The reading took too long to generate. Please try again."})
+        except Exception as e:
+            self._publish({"type": "error", "detail": f"An error occurred while generating the reading: {str(e)}"})
+        finally:
+            self.finished = True
+            self._publish()
+
+    async def subscribe(self) -> AsyncIterator[Dict[str, Any]]:
+        i = 0
+        while True:
+            while i < len(self.events):
+                yield self.events[i]
+                i += 1
+            if self.finished:
+                return
+            await self._changed.wait()
+
+
+class SingleFlight:
+    def __init__(self, timeout: float = SINGLEFLIGHT_TIMEOUT_SECONDS, per_user: int = SINGLEFLIGHT_PER_USER):
+        self.timeout = timeout
+        self.per_user = per_user
+        # Only touched from the event loop, so no locks
+        self._flights: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._streams: Dict[Tuple[str, str], _SharedStream] = {}
+        self._leading: Dict[str, int] = {}
+        self.stats = {"led": 0, "joined": 0, "timeout": 0, "rejected": 0}
+
+    def _record(self, kind: str, outcome: str):
+        self.stats[outcome] += 1
+        metrics.record_flight(kind, outcome)
+
+    def _claim(self, kind: str, user_id: Optional[str]):
+        if user_id is None:
+            return
+        leading = self._leading.get(user_id, 0)
+        if leading >= self.per_user:
+            self._record(kind, "rejected")
+            raise TooManyFlights(f"Too many requests in progress (limit {self.per_user}). Please wait for them to finish.")
+        self._leading[user_id] = leading + 1
+
+    def _release(self, user_id: Optional[str]):
+        if user_id is None:
+            return
+        leading = self._leading.get(user_id, 0) - 1
+        if leading > 0:
+            self._leading[user_id] = leading
+        else:
+            self._leading.pop(user_id, None)
+
+    async def do(self, kind: str, key: str, compute: Callable[[], Awaitable[Any]], user_id: Optional[str] = None,
+                 timeout: Optional[float] = None) -> Any:
+        """Result of compute(), shared with every concurrent caller using the same kind and key."""
+        flight_key = (kind, key)
+        task = self._flights.get(flight_key)
+        if task is None:
+            self._claim(kind, user_id)
+            task = asyncio.ensure_future(asyncio.wait_for(compute(), timeout or self.timeout))
+            self._flights[flight_key] = task
+            task.add_done_callback(lambda t: self._landed(flight_key, t, user_id))
+            self._record(kind, "led")
+        else:
+            self._record(kind, "joined")
+        try:
+            # shield: a caller that goes away must not cancel the others' result
+            return await asyncio.shield(task)
+        except asyncio.TimeoutError:
+            self._record(kind, "timeout")
+            raise FlightTimeout("The request took too long. Please try again.")
+
+    def _landed(self, flight_key: Tuple[str, str], task: asyncio.Future, user_id: Optional[str]):
+        if self._flights.get(flight_key) is task:
+            del self._flights[flight_key]
+        self._release(user_id)
+        if not task.cancelled():
+            task.exception()  # marks it retrieved even if every waiter left
+
+    def stream(self, kind: str, key: str, make_events: Callable[[], AsyncIterator[Dict[str, Any]]],
+               user_id: Optional[str] = None, timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Events of make_events(), shared with every concurrent subscriber using the same kind and key."""
+        flight_key = (kind, key)
+        shared = self._streams.get(flight_key)
+        if shared is None:
+            self._claim(kind, user_id)
+            shared = self._streams[flight_key] = _SharedStream()
+            task = asyncio.ensure_future(shared.pump(make_events(), timeout or self.timeout))
+            task.add_done_callback(lambda t: self._stream_landed(flight_key, shared, user_id))
+            self._record(kind, "led")
+        else:
+            self._record(kind, "joined")
+        return shared.subscribe()
+
+    def _stream_landed(self, flight_key: Tuple[str, str], shared: _SharedStream, user_id: Optional[str]):
+        if self._streams.get(flight_key) is shared:
+            del self._streams[flight_key]
+        self._release(user_id)
+        if shared.timed_out:
+            self._record(flight_key[0], "timeout")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "in_flight": len(self._flights) + len(self._streams), "users_leading": len(self._leading)}
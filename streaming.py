@@ -0,0 +1,167 @@
+import re
+import json
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from fastapi.responses import StreamingResponse
+
+from concurrency import run_io
+from resilience import DependencyError, gemini_calls
+import metrics
+
+
+# --- Streaming Gemini Output ---
+# Readings are long, so instead of waiting for the whole text we forward it as
+# a sequence of small events:
+#   {"type": "section", "index": 0, "title": "..."}   a "### " heading started
+#   {"type": "delta", "index": 0, "text": "..."}       body text of that section (-1 before the first heading)
+#   {"type": "score", "score": "14/20"}                porondam score, as soon as it is seen
+#   {"type": "done"} / {"type": "error", "detail": "..."}
+# Clients get NDJSON by default, or SSE when they send Accept: text/event-stream.
+
+SCORE_RE = re.compile(r"(?i)SCORE\s*:\s*([0-9]{1,2}\s*/\s*20)")
+# How many lines we hold back waiting for the porondam "---" separator before
+# deciding the model ignored the format and just forwarding everything
+PREAMBLE_MAX_LINES = 6
+
+
+class ReadingStreamParser:
+    """Turns arbitrary text chunks into section/delta/score events, line by line."""
+
+    def __init__(self, expect_score: bool = False):
+        self.expect_score = expect_score
+        self.score: Optional[str] = None
+        self.section_index = -1
+        self._pending = ""
+        self._preamble: Optional[List[str]] = [] if expect_score else None
+
+    def feed(self, chunk: str) -> Iterator[Dict[str, Any]]:
+        self._pending += chunk
+        *lines, self._pending = self._pending.split("\n")
+        yield from self._lines(lines)
+
+    def close(self) -> Iterator[Dict[str, Any]]:
+        lines = [self._pending] if self._pending else []
+        self._pending = ""
+        yield from self._lines(lines)
+        if self._preamble:
+            # Never saw a separator: the whole text is the reading
+            lines, self._preamble = self._preamble, None
+            yield from self._lines(lines)
+        if self.expect_score and self.score is None:
+            # Same fallback as the non-streaming endpoint
+            self.score = "0/20"
+            yield {"type": "score", "score": self.score}
+
+    def _lines(self, lines: List[str]) -> Iterator[Dict[str, Any]]:
+        body: List[str] = []
+        for line in lines:
+            if self._preamble is not None:
+                if self.score is None:
+                    m = SCORE_RE.search(line)
+                    if m:
+                        self.score = m.group(1).replace(" ", "")
+                        yield {"type": "score", "score": self.score}
+                if line.strip() == "---":
+                    self._preamble = None
+                    continue
+                self._preamble.append(line)
+                if len(self._preamble) > PREAMBLE_MAX_LINES:
+                    held, self._preamble = self._preamble, None
+                    body.extend(held)
+                continue
+            if line.startswith("### "):
+                if body:
+                    yield self._delta(body)
+                    body = []
+                self.section_index += 1
+                yield {"type": "section", "index": self.section_index, "title": line[4:].strip()}
+                continue
+            body.append(line)
+        if body:
+            yield self._delta(body)
+
+    def _delta(self, lines: List[str]) -> Dict[str, Any]:
+        return {"type": "delta", "index": self.section_index, "text": "\n".join(lines) + "\n"}
+
+
+def chunk_text(chunk) -> str:
+    """Text of one streamed chunk; "" for chunks without a text part (safety ratings, finish reason only)."""
+    try:
+        return chunk.text or ""
+    except ValueError:
+        # .text raises instead of returning "" when the candidate has no parts
+        return ""
+
+
+async def stream_generation(model, prompt: str, expect_score: bool = False,
+                            on_complete: Optional[Callable[[str, float], None]] = None,
+                            kind: str = "reading",
+                            on_usage: Optional[Callable[[Any, float], None]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Runs a streaming Gemini generation on the I/O pool and yields parsed events.
+
+    on_complete(full_text, seconds) is called (on the I/O pool) once the whole reading arrived;
+    on_usage(last_chunk, seconds) gets the chunk carrying the token counts.
+    """
+    parser = ReadingStreamParser(expect_score=expect_score)
+    started = time.perf_counter()
+    collected: List[str] = []
+    last_chunk = None
+    try:
+        # Retried (and breaker-checked) only up to the first response; a failure mid-stream is just reported
+        response = await run_io(gemini_calls.call, model.generate_content, prompt, stream=True,
+                                request_options={"timeout": gemini_calls.timeout})
+        chunks = iter(response)
+        while True:
+            chunk = await run_io(next, chunks, None)
+            if chunk is None:
+                break
+            last_chunk = chunk
+            text = chunk_text(chunk)
+            if not text:
+                continue
+            collected.append(text)
+            for event in parser.feed(text):
+                yield event
+        for event in parser.close():
+            yield event
+        # Token counts arrive on the final chunk
+        metrics.observe_stage("gemini", time.perf_counter() - started)
+        metrics.record_gemini_usage(last_chunk, kind)
+        if on_usage is not None:
+            on_usage(last_chunk, time.perf_counter() - started)
+        if on_complete is not None:
+            await run_io(on_complete, "".join(collected), time.perf_counter() - started)
+        yield {"type": "done"}
+    except Exception as e:
+        if not isinstance(e, DependencyError):
+            gemini_calls.report(e, time.perf_counter() - started)
+        import traceback
+        print(traceback.format_exc())
+        yield {"type": "error", "detail": f"An error occurred while generating the reading: {str(e)}"}
+
+
+async def replay_text(text: str, expect_score: bool = False) -> AsyncIterator[Dict[str, Any]]:
+    """Same events as stream_generation, for a reading we already have (e.g. from the cache)."""
+    parser = ReadingStreamParser(expect_score=expect_score)
+    for event in parser.feed(text):
+        yield event
+    for event in parser.close():
+        yield event
+    yield {"type": "done"}
+
+
+def event_stream_response(events: AsyncIterator[Dict[str, Any]], accept: Optional[str]) -> StreamingResponse:
+    use_sse = bool(accept) and "text/event-stream" in accept
+
+    async def body():
+        async for event in events:
+            payload = json.dumps(event, ensure_ascii=False)
+            yield f"event: {event['type']}\ndata: {payload}\n\n" if use_sse else payload + "\n"
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        # Stop proxies (Render, nginx) from buffering the whole response
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -0,0 +1,162 @@
+import os
+import datetime
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import pytz
+import swisseph as swe
+
+
+# --- Birth Time Zones ---
+# Birth times are local wall-clock times; which zone (and which historical
+# offset: Sri Lanka was +05:30, +06:00 and +06:30 at different times) depends
+# on where the birth happened. The zone comes from the place's coordinates:
+#   * inside Sri Lanka's bounding box it is Asia/Colombo without any lookup;
+#   * elsewhere timezonefinder (optional, offline polygon index) is asked once
+#     per ~100 m grid cell and the answer kept in an LRU;
+#   * without timezonefinder, or for open sea, BIRTH_TIMEZONE_DEFAULT is used.
+# Offsets come from pytz's transition table: one bisect per birth, with pytz's
+# own localize() only for times within a day of a transition (gaps and
+# repeated hours). Nothing here touches the network or parses zone files per
+# request.
+
+BIRTH_TIMEZONE_DEFAULT = os.environ.get("BIRTH_TIMEZONE_DEFAULT", "Asia/Colombo")
+TIMEZONE_LOOKUP = os.environ.get("TIMEZONE_LOOKUP", "1") not in ("0", "false", "no")
+TIMEZONE_CACHE_SIZE = int(os.environ.get("TIMEZONE_CACHE_SIZE", "20000"))
+
+# (south, north, west, east); the Indian coast stays outside it
+SRI_LANKA_BOUNDS = (5.85, 9.9, 79.5, 81.95)
+SRI_LANKA_ZONE = "Asia/Colombo"
+_NEAR_TRANSITION = datetime.timedelta(days=1)
+
+
+@lru_cache(maxsize=None)
+def zone(name: str) -> datetime.tzinfo:
+    return pytz.timezone(name)
+
+
+class _ZoneTable:
+    """UTC offset of a naive local time, from the zone's transition table."""
+
+    def __init__(self, tz: datetime.tzinfo):
+        self.tz = tz
+        # Private pytz attributes; zones without them (UTC, fixed offsets) fall back to localize()
+        self.transitions: Optional[List[datetime.datetime]] = getattr(tz, "_utc_transition_times", None)
+        infos = getattr(tz, "_transition_info", None)
+        self.offsets = [info[0] for info in infos] if infos else None
+        if not self.transitions or not self.offsets or len(self.transitions) != len(self.offsets):
+            self.transitions = None
+
+    def offset(self, local: datetime.datetime) -> datetime.timedelta:
+        if self.transitions is None:
+            return self.tz.localize(local).utcoffset()
+        # Offsets are under a day, so comparing local time to UTC boundaries is
+        # only ambiguous right next to a transition
+        i = bisect_right(self.transitions, local) - 1
+        near_next = i + 1 < len(self.transitions) and self.transitions[i + 1] - local < _NEAR_TRANSITION
+        near_prev = i >= 1 and local - self.transitions[i] < _NEAR_TRANSITION
+        if near_next or near_prev:
+            return self.tz.localize(local).utcoffset()
+        return self.offsets[max(i, 0)]
+
+
+@lru_cache(maxsize=None)
+def _table(name: str) -> _ZoneTable:
+    return _ZoneTable(zone(name))
+
+
+def local_to_jd(local: datetime.datetime, zone_name: str) -> float:
+    """Julian day of a naive local time in `zone_name`, the same value the old birth_moment() computed."""
+    dt_utc = local - _table(zone_name).offset(local)
+    return swe.utc_to_jd(dt_utc.year, dt_utc.month, dt_utc.day, dt_utc.hour, dt_utc.minute, dt_utc.second, 1)[0]
+
+
+def jd_to_local(jd_utc: float, zone_name: str) -> datetime.datetime:
+    year, month, day, hours = swe.revjul(jd_utc)
+    dt_utc = datetime.datetime(year, month, day, tzinfo=pytz.utc) + datetime.timedelta(hours=hours)
+    return dt_utc.astimezone(zone(zone_name))
+
+
+class TimezoneResolver:
+    def __init__(self, default: str = BIRTH_TIMEZONE_DEFAULT, lookup: bool = TIMEZONE_LOOKUP,
+                 cache_size: int = TIMEZONE_CACHE_SIZE):
+        zone(default)  # fail at startup on a misspelt BIRTH_TIMEZONE_DEFAULT
+        self.default = default
+        self.lookup = lookup
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[Tuple[float, float], str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._finder = None
+        self._finder_error: Optional[str] = None
+        # Separate from _lock, which is held while the finder opens: the Sri Lanka shortcut shouldn't wait on it
+        self._stats_lock = threading.Lock()
+        self.stats = {"sri_lanka": 0, "cache_hits": 0, "lookups": 0, "defaulted": 0}
+
+    def _count(self, name):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def _timezone_finder(self):
+        # ~0.25 s to open the polygon index, so only when the first foreign birth arrives
+        if self._finder is None and self._finder_error is None:
+            try:
+                from timezonefinder import TimezoneFinder
+                self._finder = TimezoneFinder()
+            except Exception as e:
+                self._finder_error = f"{type(e).__name__}: {e}"
+        return self._finder
+
+    def zone_name(self, lat: Optional[float], lon: Optional[float]) -> str:
+        if lat is None or lon is None:
+            return self.default
+        south, north, west, east = SRI_LANKA_BOUNDS
+        if south <= lat <= north and west <= lon <= east:
+            self._count("sri_lanka")
+            return SRI_LANKA_ZONE
+        if not self.lookup:
+            self._count("defaulted")
+            return self.default
+        key = (round(lat, 3), round(lon, 3))
+        with self._lock:
+            name = self._cache.get(key)
+            if name is not None:
+                self._cache.move_to_end(key)
+                self._count("cache_hits")
+                return name
+            finder = self._timezone_finder()
+            name = finder.timezone_at(lng=key[1], lat=key[0]) if finder is not None else None
+            self._count("lookups" if name else "defaulted")
+            name = name or self.default
+            self._cache[key] = name
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return name
+
+    def to_jd(self, local: datetime.datetime, lat: Optional[float], lon: Optional[float]) -> float:
+        return local_to_jd(local, self.zone_name(lat, lon))
+
+    def to_jd_batch(self, moments: Sequence[Tuple[datetime.datetime, Optional[float], Optional[float]]]) -> List[float]:
+        """to_jd() for many births in one pass: one zone lookup per distinct place, one table per zone."""
+        zones: Dict[Tuple[Optional[float], Optional[float]], str] = {}
+        out = []
+        for local, lat, lon in moments:
+            place = (lat, lon)
+            name = zones.get(place)
+            if name is None:
+                name = zones[place] = self.zone_name(lat, lon)
+            out.append(local_to_jd(local, name))
+        return out
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            cached = len(self._cache)
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {**stats, "cached_places": cached, "default": self.default,
+                "finder": "ready" if self._finder is not None else (self._finder_error or ("cold" if self.lookup else "disabled"))}
+
+
+resolver = TimezoneResolver()
@@ -0,0 +1,143 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Sequence
+
+import numpy as np
+import swisseph as swe
+
+from ephemeris import PLANET_ORDER, SWE_BODIES, NAKSHATRA_SPAN, TRADITIONAL_AYANAMSA_OFFSET
+
+
+# --- Transit (Gochara) Events ---
+# Transits don't depend on anyone's chart, so daily positions (0h UT, same
+# ayanamsa offset as the birth charts) are computed once per block of days and
+# shared by every request. Events are found by stepping through those daily
+# samples: from each sample we can skip ahead as many days as the body could
+# not possibly reach a sign/nakshatra boundary in (distance / max daily speed),
+# and only when a boundary was crossed do we refine the exact moment with the
+# full ephemeris.
+
+TRANSIT_BLOCK_DAYS = 366
+TRANSIT_CACHE_BLOCKS = int(os.environ.get("TRANSIT_CACHE_BLOCKS", "64"))
+SIGN_SPAN = 30.0
+# Upper bounds on daily motion in degrees (either direction)
+MAX_DAILY_MOTION = {'Sun': 1.03, 'Moon': 15.5, 'Mars': 0.8, 'Mercury': 2.3, 'Jupiter': 0.26,
+                    'Venus': 1.3, 'Saturn': 0.14, 'Rahu': 0.06, 'Ketu': 0.06}
+# Root refinement stops once the crossing is bracketed to about a minute
+REFINE_TOLERANCE_DAYS = 1.0 / 1440
+
+
+class TransitEvent(NamedTuple):
+    planet: str
+    kind: str           # "sign" or "nakshatra"
+    jd_utc: float
+    from_index: int     # sign 0-11 or nakshatra 0-26
+    to_index: int
+    retrograde: bool
+
+
+def sidereal_longitude(jd_utc: float, planet: str) -> float:
+    """Chart-consistent sidereal longitude (offset applied, Ketu opposite Rahu)."""
+    if planet == 'Ketu':
+        return (sidereal_longitude(jd_utc, 'Rahu') + 180) % 360
+    pos = swe.calc_ut(jd_utc, SWE_BODIES[PLANET_ORDER.index(planet)], swe.FLG_SIDEREAL)[0][0]
+    return (pos - TRADITIONAL_AYANAMSA_OFFSET + 360) % 360
+
+
+def _wrap(delta: float) -> float:
+    # Signed angular difference in (-180, 180]
+    return (delta + 180.0) % 360.0 - 180.0
+
+
+class DailyEphemeris:
+    def __init__(self, max_blocks: int = TRANSIT_CACHE_BLOCKS):
+        self.max_blocks = max_blocks
+        self._blocks: "OrderedDict[int, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _block(self, number: int) -> np.ndarray:
+        with self._lock:
+            block = self._blocks.get(number)
+            if block is not None:
+                self._blocks.move_to_end(number)
+                self.hits += 1
+                return block
+        first_day = number * TRANSIT_BLOCK_DAYS
+        block = np.empty((TRANSIT_BLOCK_DAYS, len(PLANET_ORDER)), dtype=np.float64)
+        for row in range(TRANSIT_BLOCK_DAYS):
+            # Julian day number N is noon of its date, so that date's 0h UT is N - 0.5
+            jd = first_day + row - 0.5
+            for col, planet in enumerate(PLANET_ORDER[:-1]):
+                block[row, col] = sidereal_longitude(jd, planet)
+        block[:, -1] = (block[:, -2] + 180) % 360
+        with self._lock:
+            self.misses += 1
+            self._blocks[number] = block
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+        return block
+
+    def longitude(self, day: int, planet: str) -> float:
+        """Longitude at 0h UT of the date of Julian day number `day` (i.e. JD day - 0.5)."""
+        number, row = divmod(day, TRANSIT_BLOCK_DAYS)
+        return float(self._block(number)[row, PLANET_ORDER.index(planet)])
+
+    def cache_info(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "blocks": len(self._blocks), "max_blocks": self.max_blocks}
+
+
+daily_ephemeris = DailyEphemeris()
+
+
+def _refine(planet: str, boundary: float, jd_lo: float, jd_hi: float) -> float:
+    # Bisection on the signed distance to the boundary; the crossing is bracketed by construction
+    f_lo = _wrap(sidereal_longitude(jd_lo, planet) - boundary)
+    while jd_hi - jd_lo > REFINE_TOLERANCE_DAYS:
+        mid = (jd_lo + jd_hi) / 2
+        f_mid = _wrap(sidereal_longitude(mid, planet) - boundary)
+        if (f_mid >= 0) == (f_lo >= 0):
+            jd_lo, f_lo = mid, f_mid
+        else:
+            jd_hi = mid
+    return (jd_lo + jd_hi) / 2
+
+
+def find_transits(start_jd: float, end_jd: float, planets: Sequence[str], nakshatras: bool = True,
+                  ephemeris: DailyEphemeris = daily_ephemeris) -> List[TransitEvent]:
+    """Sign (and nakshatra) changes for `planets` with start_jd <= jd_utc < end_jd, in time order."""
+    # Daily samples (0h UT) from the one at or before start_jd to the one at or after end_jd
+    start_day, end_day = int(np.floor(start_jd + 0.5)), int(np.ceil(end_jd + 0.5))
+    spans = [("sign", SIGN_SPAN)] + ([("nakshatra", NAKSHATRA_SPAN)] if nakshatras else [])
+    events: List[TransitEvent] = []
+    for planet in planets:
+        max_motion = MAX_DAILY_MOTION[planet]
+        day = start_day
+        lon = ephemeris.longitude(day, planet)
+        while day < end_day:
+            # Nearest boundary in either direction (planets go retrograde)
+            margin = min(min(lon % span, span - lon % span) for _, span in spans)
+            next_day = min(end_day, day + max(1, int(margin / max_motion)))
+            next_lon = ephemeris.longitude(next_day, planet)
+            moved = _wrap(next_lon - lon)
+            unwrapped = lon + moved
+            for kind, span in spans:
+                a, b = int(np.floor(lon / span)), int(np.floor(unwrapped / span))
+                if a == b:
+                    continue
+                step = 1 if b > a else -1
+                # The Moon can cross more than one nakshatra in a day
+                for k in range(a, b, step):
+                    boundary = ((k + 1) if step > 0 else k) * span
+                    jd = _refine(planet, boundary % 360, day - 0.5, next_day - 0.5)
+                    if not start_jd <= jd < end_jd:
+                        continue
+                    count = int(round(360 / span))
+                    from_index, to_index = k % count, (k + step) % count
+                    events.append(TransitEvent(planet, kind, jd, from_index, to_index, step < 0))
+            day, lon = next_day, next_lon
+    events.sort(key=lambda e: e.jd_utc)
+    return events
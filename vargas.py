@@ -0,0 +1,127 @@
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+
+# --- Divisional Charts (Shodasavarga) ---
+# Each varga Dn cuts every sign into n equal parts (D30 into unequal ones) and
+# maps each part to a sign. Instead of per-varga formulas we build, once, a
+# lookup table of 12*n entries per varga from the Parashari rules below; part
+# q = floor(longitude * n / 30) of the zodiac then lands in sign table[q]. All
+# requested vargas are done in one broadcast multiply, floor and take over the
+# (N, 10) longitude array (lagna + 9 planets, CHART_COLUMNS order), so all 16
+# cost little more than the arithmetic this replaces for D1 and D9.
+#
+# D9 from these rules (movable signs count from themselves, fixed from the 9th,
+# dual from the 5th) is exactly the old int(((pos * 9) % 360) / 30) formula;
+# the same holds for D1 and int(pos / 30).
+#
+# Sign indices count from Aries = 0, so an even index is an odd sign.
+
+FIRE, EARTH, AIR, WATER = 0, 1, 2, 3   # sign % 4
+MOVABLE, FIXED, DUAL = 0, 1, 2          # sign % 3
+
+ARIES, TAURUS, GEMINI, CANCER, LEO, VIRGO, LIBRA, SCORPIO, SAGITTARIUS, CAPRICORN, AQUARIUS, PISCES = range(12)
+
+
+class Varga(NamedTuple):
+    name: str
+    title: str
+    parts: int
+    table: np.ndarray    # (12 * parts,) sign for each part of the zodiac
+
+
+def _odd(sign: int) -> bool:
+    return sign % 2 == 0
+
+
+def _cyclic(start: Callable[[int], int], step: int = 1) -> Callable[[int, int], int]:
+    # Part k of `sign` is `start(sign)` moved on by k * step signs
+    return lambda sign, k: (start(sign) + k * step) % 12
+
+
+def _hora(sign: int, k: int) -> int:
+    # Odd signs: Sun's hora (Leo) then Moon's (Cancer); even signs the other way round
+    return (LEO, CANCER)[k] if _odd(sign) else (CANCER, LEO)[k]
+
+
+# Trimsamsa: degrees 0-30 of odd signs go to Mars 5, Saturn 5, Jupiter 8, Mercury 7, Venus 5
+# (their odd signs); even signs run the reverse order (their even signs)
+_TRIMSAMSA_ODD = [ARIES] * 5 + [AQUARIUS] * 5 + [SAGITTARIUS] * 8 + [GEMINI] * 7 + [LIBRA] * 5
+_TRIMSAMSA_EVEN = [TAURUS] * 5 + [VIRGO] * 7 + [PISCES] * 8 + [CAPRICORN] * 5 + [SCORPIO] * 5
+
+
+def _trimsamsa(sign: int, degree: int) -> int:
+    return (_TRIMSAMSA_ODD if _odd(sign) else _TRIMSAMSA_EVEN)[degree]
+
+
+# (name, title, parts, rule(sign, part) -> sign)
+_RULES = (
+    ("D1", "Rasi", 1, lambda sign, k: sign),
+    ("D2", "Hora", 2, _hora),
+    ("D3", "Drekkana", 3, _cyclic(lambda s: s, step=4)),
+    ("D4", "Chaturthamsa", 4, _cyclic(lambda s: s, step=3)),
+    ("D7", "Saptamsa", 7, _cyclic(lambda s: s if _odd(s) else s + 6)),
+    ("D9", "Navamsa", 9, _cyclic(lambda s: (ARIES, CAPRICORN, LIBRA, CANCER)[s % 4])),
+    ("D10", "Dasamsa", 10, _cyclic(lambda s: s if _odd(s) else s + 8)),
+    ("D12", "Dwadasamsa", 12, _cyclic(lambda s: s)),
+    ("D16", "Shodasamsa", 16, _cyclic(lambda s: (ARIES, LEO, SAGITTARIUS)[s % 3])),
+    ("D20", "Vimsamsa", 20, _cyclic(lambda s: (ARIES, SAGITTARIUS, LEO)[s % 3])),
+    ("D24", "Chaturvimsamsa", 24, _cyclic(lambda s: LEO if _odd(s) else CANCER)),
+    ("D27", "Saptavimsamsa", 27, _cyclic(lambda s: (ARIES, CANCER, LIBRA, CAPRICORN)[s % 4])),
+    # Unequal parts: tabulated per whole degree
+    ("D30", "Trimsamsa", 30, _trimsamsa),
+    ("D40", "Khavedamsa", 40, _cyclic(lambda s: ARIES if _odd(s) else LIBRA)),
+    ("D45", "Akshavedamsa", 45, _cyclic(lambda s: (ARIES, LEO, SAGITTARIUS)[s % 3])),
+    ("D60", "Shashtiamsa", 60, _cyclic(lambda s: s)),
+)
+
+
+def _build(name: str, title: str, parts: int, rule) -> Varga:
+    table = np.array([rule(sign, k) for sign in range(12) for k in range(parts)], dtype=np.int8)
+    return Varga(name, title, parts, table)
+
+
+VARGAS: Dict[str, Varga] = {name: _build(name, title, parts, rule) for name, title, parts, rule in _RULES}
+VARGA_NAMES = tuple(VARGAS)
+
+
+def parse_vargas(text: Optional[str]) -> Tuple[str, ...]:
+    """"D2,D3,d60" or "all" -> ("D2", "D3", "D60") in VARGA_NAMES order; ValueError on an unknown name."""
+    if not text:
+        return ()
+    if text.strip().lower() == "all":
+        return VARGA_NAMES
+    names = {part.strip().upper() for part in text.split(",") if part.strip()}
+    unknown = names - set(VARGAS)
+    if unknown:
+        raise ValueError(f"Unknown divisional charts: {', '.join(sorted(unknown))}. Available: {', '.join(VARGA_NAMES)}")
+    return tuple(name for name in VARGA_NAMES if name in names)
+
+
+@lru_cache(maxsize=64)
+def _plan(names: Tuple[str, ...]):
+    # Parts per varga, and one table for all of them: each varga's 12 * parts signs
+    # plus its first sign again, for a longitude that rounds up to 360 (= Aries)
+    parts = np.array([VARGAS[name].parts for name in names], dtype=np.float64)
+    table = np.concatenate([np.append(VARGAS[name].table, VARGAS[name].table[0]) for name in names])
+    offsets = np.cumsum([0] + [12 * VARGAS[name].parts + 1 for name in names[:-1]])
+    return parts, offsets, table
+
+
+def varga_signs(longitudes, names: Iterable[str] = VARGA_NAMES) -> Dict[str, np.ndarray]:
+    """{name: sign indices} for an array of sidereal longitudes (any shape, e.g. (N, 10)); same shape out."""
+    names = tuple(names)
+    if not names:
+        return {}
+    lon = np.asarray(longitudes, dtype=np.float64)
+    parts, offsets, table = _plan(names)
+    # Every requested varga in one broadcast pass: (..., len(names)) part numbers, then one take
+    # (in place, and int8 signs: at batch sizes this is memory-bound)
+    part = lon[..., None] * parts
+    part /= 30
+    index = part.astype(np.intp)
+    index += offsets
+    signs = table.take(index)
+    return {name: signs[..., i] for i, name in enumerate(names)}